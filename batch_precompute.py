@@ -0,0 +1,261 @@
+"""
+MILO Batch Precompute - Meeting prep for many households ahead of review season
+Reads a manifest of (client, query) pairs, fans them out across a process pool
+and streams results to JSONL or Parquet, skipping keys already completed
+
+Usage:
+    python batch_precompute.py manifest.jsonl results.jsonl --workers 8
+    python batch_precompute.py manifest.csv results.parquet
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Set
+import argparse
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import enhanced_milo_agents
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+PARQUET_COLUMNS = ["key", "client_name", "query",
+                   "status", "result_json", "computed_at"]
+
+
+def job_key(client_name: str, query: str) -> str:
+    """Stable identity of one (client, query) job, used for resume"""
+
+    return hashlib.sha256(f"{client_name}\x1f{query}".encode()).hexdigest()[:16]
+
+
+def read_manifest(path: str) -> List[Dict]:
+    """Load (client_name, query) rows from a JSONL or CSV manifest"""
+
+    jobs = []
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for row in rows:
+            client_name = row.get("client_name") or row.get("client")
+            query = row.get("query")
+            if not client_name or not query:
+                print(f"📋 Skipping manifest row without client/query: {row}")
+                continue
+            jobs.append({"key": job_key(client_name, query),
+                         "client_name": client_name, "query": query})
+
+    return jobs
+
+
+# ============================================================================
+# OUTPUT SINKS
+# ============================================================================
+
+
+class JsonlSink:
+    """Appends one JSON object per finished job, flushed as it arrives"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def completed_keys(self) -> Set[str]:
+        keys = set()
+        if not os.path.exists(self.path):
+            return keys
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted run
+                    continue
+                if row.get("status") == "ok":
+                    keys.add(row["key"])
+        return keys
+
+    def __enter__(self):
+        self._file = open(self.path, "a")
+        return self
+
+    def write(self, row: Dict):
+        self._file.write(json.dumps(row, default=str) + "\n")
+        self._file.flush()
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+
+class ParquetSink:
+    """Writes small, complete part files into a dataset directory
+
+    Each part is closed after `rows_per_part` rows, so an interruption loses at
+    most one unflushed part rather than a whole file without a footer.
+    """
+
+    def __init__(self, path: str, rows_per_part: int = 100):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("pyarrow is required for Parquet output")
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self._buffer: List[Dict] = []
+
+    def completed_keys(self) -> Set[str]:
+        keys = set()
+        if not os.path.isdir(self.path):
+            return keys
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".parquet"):
+                continue
+            try:
+                table = pq.read_table(os.path.join(self.path, name),
+                                      columns=["key", "status"])
+            except (OSError, pa.ArrowInvalid):
+                continue
+            for key, status in zip(table.column("key").to_pylist(), table.column("status").to_pylist()):
+                if status == "ok":
+                    keys.add(key)
+        return keys
+
+    def __enter__(self):
+        os.makedirs(self.path, exist_ok=True)
+        return self
+
+    def write(self, row: Dict):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.rows_per_part:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        table = pa.Table.from_pylist(
+            [{column: row.get(column) for column in PARQUET_COLUMNS} for row in self._buffer])
+        name = f"part-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}.parquet"
+        tmp_path = os.path.join(self.path, name + ".tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, name))
+        self._buffer = []
+
+    def __exit__(self, *exc):
+        self._flush()
+
+
+def open_sink(path: str):
+    if path.endswith(".parquet"):
+        return ParquetSink(path)
+    return JsonlSink(path)
+
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+
+
+def warm_shared_state():
+    """Build read-only indexes and price caches before the pool forks"""
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        enhanced_milo_agents.get_communications_index()
+        enhanced_milo_agents.analyze_portfolio("warm-up")
+
+
+def _init_worker(verbose: bool):
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+    # No-op after fork (inherited); builds them once per worker under spawn
+    warm_shared_state()
+
+
+def _run_job(job: Dict) -> Dict:
+    started = time.perf_counter()
+    result = enhanced_milo_agents.execute_enhanced_milo_analysis(
+        job["client_name"], job["query"])
+    status = "failed" if "error" in result else "ok"
+    return {
+        **job,
+        "status": status,
+        "result_json": json.dumps(result, default=str),
+        "elapsed_seconds": round(time.perf_counter() - started, 4),
+        "computed_at": datetime.now().isoformat()
+    }
+
+
+def run_batch(jobs: List[Dict], sink, workers: int, verbose: bool = False) -> Dict:
+    """Fan pending jobs out across a process pool, streaming results to the sink"""
+
+    # Duplicate manifest rows collapse onto one job
+    unique = list({job["key"]: job for job in jobs}.values())
+    done = sink.completed_keys()
+    pending = [job for job in unique if job["key"] not in done]
+
+    print(f"📋 {len(unique)} unique jobs in manifest, {len(unique) - len(pending)} already complete, {len(pending)} to run")
+
+    summary = {"ok": 0, "failed": 0, "skipped": len(unique) - len(pending)}
+    if not pending:
+        return summary
+
+    warm_shared_state()
+
+    # Fork shares the warmed parent state copy-on-write where it is available
+    context = (multiprocessing.get_context("fork")
+               if "fork" in multiprocessing.get_all_start_methods() else None)
+
+    started = time.perf_counter()
+    with sink, ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                   initializer=_init_worker, initargs=(verbose,)) as executor:
+        futures = {executor.submit(_run_job, job): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                row = {**job, "status": "failed", "result_json": json.dumps({"error": str(e)}),
+                       "computed_at": datetime.now().isoformat()}
+            sink.write(row)
+            summary[row["status"]] += 1
+
+            finished = summary["ok"] + summary["failed"]
+            if finished % 25 == 0 or finished == len(pending):
+                rate = finished / (time.perf_counter() - started)
+                print(f"✅ {finished}/{len(pending)} complete ({rate:.1f} jobs/s)")
+
+    return summary
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Precompute MILO meeting prep for a manifest of (client, query) pairs")
+    parser.add_argument("manifest", help="JSONL or CSV with client_name and query")
+    parser.add_argument(
+        "output", help="results.jsonl, or results.parquet (a dataset directory)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--verbose", action="store_true",
+                        help="Keep per-analysis logging from worker processes")
+    args = parser.parse_args(argv)
+
+    jobs = read_manifest(args.manifest)
+    summary = run_batch(jobs, open_sink(args.output),
+                        workers=args.workers, verbose=args.verbose)
+
+    print(f"🎯 Batch complete: {summary}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
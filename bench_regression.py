@@ -0,0 +1,305 @@
+"""
+MILO Latency Regression Gate - Pipeline microbenchmarks vs stored baselines
+Each stage is timed in several fresh interpreter processes, keeping one median
+per process, in units of a fixed calibration workload timed in the same
+process (so a machine that is uniformly slower today is not a regression). A
+stage regresses when the median of those exceeds the baseline's by more than
+the threshold AND every process is slower than the slowest baseline process,
+so process-to-process noise doesn't fail the gate.
+
+Baselines are machine-specific and are not committed; record one on the
+machine that runs the gate.
+
+Usage:
+    python bench_regression.py --update-baseline     # record on the machine that will gate
+    python bench_regression.py --threshold 0.5       # exit 1 on regression
+"""
+
+from typing import Callable, Dict, List
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import enhanced_milo_agents
+import market_data
+import portfolio_analyzer
+
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+BASELINE_VERSION = 2
+DEFAULT_PROCESSES = 5
+
+BENCH_QUERIES = [
+    "What are the client's ESG concerns and sustainability progress?",
+    "How has the portfolio performed this year compared to targets?",
+    "What family changes and milestones should I know about?",
+    "Are there any risk management or volatility concerns to address?"
+]
+
+
+def _bench_analyze_query():
+    for query in BENCH_QUERIES:
+        enhanced_milo_agents.analyze_query(query)
+
+
+def _bench_analyze_communications():
+    for query in BENCH_QUERIES:
+        enhanced_milo_agents.analyze_communications(query)
+
+
+def _bench_analyze_portfolio():
+    # Warm snapshot cache - measures the cached path, not the provider
+    for query in BENCH_QUERIES:
+        enhanced_milo_agents.analyze_portfolio(query)
+
+
+def _bench_analyze_portfolio_cold():
+    market_data.set_default_fetcher(_offline_fetcher())
+    portfolio_analyzer.get_default_analyzer().clear_cache()
+    enhanced_milo_agents.analyze_portfolio(BENCH_QUERIES[1])
+
+
+def _bench_generate_meeting_prep():
+    communications = enhanced_milo_agents.analyze_communications(BENCH_QUERIES[0])
+    portfolio = enhanced_milo_agents.analyze_portfolio(BENCH_QUERIES[0])
+    for query in BENCH_QUERIES:
+        enhanced_milo_agents.generate_meeting_prep(query, communications, portfolio)
+
+
+def _bench_full_pipeline():
+    for query in BENCH_QUERIES:
+        enhanced_milo_agents.execute_enhanced_milo_analysis(user_query=query)
+
+
+def _calibration():
+    """Fixed interpreter-bound work, independent of MILO code"""
+
+    total = 0
+    for i in range(20000):
+        total += len(str(i)) * (i % 7)
+    sorted(range(5000, 0, -1))
+    return total
+
+
+CALIBRATION = "_calibration"
+
+BENCHMARKS: Dict[str, Callable] = {
+    "analyze_query": _bench_analyze_query,
+    "analyze_communications": _bench_analyze_communications,
+    "analyze_portfolio": _bench_analyze_portfolio,
+    "analyze_portfolio_cold": _bench_analyze_portfolio_cold,
+    "generate_meeting_prep": _bench_generate_meeting_prep,
+    "full_pipeline": _bench_full_pipeline,
+}
+
+
+def _offline_fetcher() -> market_data.AsyncMarketDataFetcher:
+    """Zero-latency fake provider so timings reflect only our own code"""
+    return market_data.AsyncMarketDataFetcher(market_data.FakeMarketDataProvider(latency=0.0))
+
+
+def _quartiles(samples: List[float]) -> Dict[str, float]:
+    q1, median, q3 = statistics.quantiles(samples, n=4, method="inclusive")
+    return {"median": median, "q1": q1, "q3": q3, "iqr": q3 - q1}
+
+
+def measure(fn: Callable, repeats: int, min_sample_seconds: float) -> Dict:
+    """Per-call seconds over `repeats` samples, each looping long enough to time reliably"""
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()  # warm caches and imports
+
+        # Calibrate loop count, timeit.autorange style
+        number = 1
+        while True:
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            if time.perf_counter() - started >= min_sample_seconds or number >= 1 << 16:
+                break
+            number *= 2
+
+        # Like timeit, keep collector pauses out of the samples
+        gc_was_enabled = gc.isenabled()
+        gc.collect()
+        gc.disable()
+        try:
+            samples = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                for _ in range(number):
+                    fn()
+                samples.append((time.perf_counter() - started) / number)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    return {**_quartiles(samples), "repeats": repeats, "number": number}
+
+
+def run_benchmarks(names: List[str], repeats: int, min_sample_seconds: float) -> Dict[str, Dict]:
+    market_data.set_default_fetcher(_offline_fetcher())
+    results = {CALIBRATION: measure(_calibration, repeats, min_sample_seconds)}
+    for name in names:
+        results[name] = measure(BENCHMARKS[name], repeats, min_sample_seconds)
+        print(f"⏱️  {name}: median {results[name]['median'] * 1e3:.3f} ms "
+              f"(IQR {results[name]['iqr'] * 1e3:.3f} ms, {results[name]['number']} loops x {repeats})")
+    market_data.set_default_fetcher(None)
+    return results
+
+
+def run_in_processes(names: List[str], processes: int, repeats: int,
+                     min_sample_seconds: float) -> Dict[str, Dict]:
+    """Median per fresh interpreter, over `processes` interpreters
+
+    Samples inside one process share its heap layout, hash seed and CPU
+    placement; only separate processes show the run-to-run spread.
+    """
+
+    medians = {name: [] for name in names}
+    relative = {name: [] for name in names}
+    for run in range(processes):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "run.json")
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker-output", output,
+                 "--repeats", str(repeats), "--min-sample-seconds", str(min_sample_seconds),
+                 "--only", *names],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            if completed.returncode != 0:
+                print(completed.stdout)
+                raise RuntimeError(f"Benchmark process {run + 1} exited with {completed.returncode}")
+            with open(output) as f:
+                result = json.load(f)
+        for name in names:
+            medians[name].append(result[name]["median"])
+            relative[name].append(result[name]["median"] / result[CALIBRATION]["median"])
+        print(f"⏱️  Process {run + 1}/{processes} done")
+
+    summary = {}
+    for name in names:
+        runs = relative[name]
+        summary[name] = {"median_seconds": statistics.median(medians[name]),
+                         "median": statistics.median(runs), "min": min(runs), "max": max(runs), "runs": runs}
+        print(f"⏱️  {name}: median {summary[name]['median_seconds'] * 1e3:.3f} ms, "
+              f"{summary[name]['median']:.3f} calibration units "
+              f"(process range {summary[name]['min']:.3f}-{summary[name]['max']:.3f})")
+    return summary
+
+
+def compare(current: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[Dict]:
+    """Classify each benchmark as ok, regressed, improved or new"""
+
+    rows = []
+    for name, stats in current.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append({"name": name, "status": "new", "ratio": None})
+            continue
+
+        ratio = stats["median"] / base["median"] if base["median"] else float("inf")
+        # Compared across the per-process (calibrated) medians, not within-process quartiles
+        separated_up = stats["min"] > base["max"]
+        separated_down = stats["max"] < base["min"]
+
+        if ratio > 1 + threshold and separated_up:
+            status = "regressed"
+        elif ratio < 1 / (1 + threshold) and separated_down:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append({"name": name, "status": status, "ratio": ratio})
+    return rows
+
+
+def load_baseline(path: str) -> Dict[str, Dict]:
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != BASELINE_VERSION:
+        raise ValueError(f"Baseline version {data.get('version')} predates per-process medians")
+    return data["benchmarks"]
+
+
+def save_baseline(path: str, results: Dict[str, Dict]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "version": BASELINE_VERSION,
+            "created": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "processes": len(next(iter(results.values()))["runs"]) if results else 0,
+            "benchmarks": results
+        }, f, indent=2)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare MILO stage latency against a stored baseline")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Record the current run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="Allowed median slowdown before failing (0.5 = 50%%)")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES,
+                        help="Fresh interpreter processes to sample (one median each)")
+    parser.add_argument("--repeats", type=int, default=15)
+    parser.add_argument("--min-sample-seconds", type=float, default=0.05)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS),
+                        help="Run a subset of benchmarks")
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    names = args.only or list(BENCHMARKS)
+
+    if args.worker_output:
+        # One sampled process of run_in_processes
+        with open(args.worker_output, "w") as f:
+            json.dump(run_benchmarks(names, args.repeats, args.min_sample_seconds), f)
+        return 0
+
+    if not args.update_baseline and not os.path.exists(args.baseline):
+        print(f"❌ No baseline at {args.baseline}. Baselines are machine-specific and not committed - "
+              f"record one on the machine that runs this gate first:\n"
+              f"    python bench_regression.py --update-baseline --baseline {args.baseline}")
+        return 2
+
+    try:
+        baseline = None if args.update_baseline else load_baseline(args.baseline)
+    except ValueError as e:
+        print(f"❌ {e} - re-record it with --update-baseline")
+        return 2
+
+    results = run_in_processes(names, args.processes, args.repeats, args.min_sample_seconds)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results)
+        print(f"✅ Baseline written to {args.baseline}")
+        return 0
+
+    rows = compare(results, baseline, args.threshold)
+    icons = {"ok": "✅", "improved": "🚀", "regressed": "❌", "new": "🆕"}
+    print("\n" + "=" * 60)
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}x" if row["ratio"] is not None else "-"
+        print(f"{icons[row['status']]} {row['name']:<26} {ratio:>8}  {row['status']}")
+    print("=" * 60)
+
+    regressed = [row["name"] for row in rows if row["status"] == "regressed"]
+    if regressed:
+        print(f"❌ Latency regression beyond {args.threshold:.0%}: {', '.join(regressed)}")
+        return 1
+    print("✅ No latency regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
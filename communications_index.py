@@ -0,0 +1,173 @@
+"""
+MILO Communications Index - Precomputed lookup structures over client communications
+Built once per process, then shared read-only by the analysis pipeline, batch
+workers and services instead of rescanning every record on every query
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import bisect
+
+DEFAULT_CLIENT = "Smith Family Trust"
+
+# Themes that earn the focus bonus in analyze_communications
+FOCUS_THEMES = {
+    "esg_sustainability": ["ESG_investing", "values_alignment", "environmental_concerns",
+                           "ESG_transition", "ESG_performance", "ESG_expansion"],
+    "performance": ["portfolio_performance", "market_volatility"],
+    "family_personal": ["family_involvement", "college_planning", "education_planning",
+                        "daughter_influence", "Northwestern_acceptance", "family_milestone",
+                        "Emma_first_meeting", "family_collaboration"],
+    "risk_volatility": ["market_volatility",
+                        "risk_management", "banking_sector_concerns"]
+}
+
+FOCUS_BONUS = 10
+KEYWORD_BONUS = 2
+BASE_RELEVANCE = 1
+
+
+class CommunicationsIndex:
+    """Inverted token index, theme aggregates and date/client orderings over records"""
+
+    def __init__(self, records: List[Dict], default_client: str = DEFAULT_CLIENT, content_store=None):
+        # Copied, so add() never grows the caller's list
+        self.records = list(records)
+        self.default_client = default_client
+        self.content_store = None
+        self.clients: List[str] = []
+
+        # Unique whitespace tokens joined by newlines: a query word (which never
+        # contains whitespace) is a substring of the full text exactly when it is
+        # a substring of this, at a fraction of the size
+        self.search_vocab: List[str] = []
+        self.postings: Dict[str, List[int]] = {}
+        self.theme_counts = Counter()
+        self.by_client: Dict[str, List[int]] = {}
+        self.focus_matches = {focus: set() for focus in FOCUS_THEMES}
+
+        for doc_id, record in enumerate(self.records):
+            self._index_record(doc_id, record)
+
+        # Record ids in chronological order (ISO dates sort lexically)
+        self.by_date = sorted(range(len(self.records)),
+                              key=lambda doc_id: self.records[doc_id].get("date", ""))
+
+        if content_store is not None:
+            self.attach_content_store(content_store)
+
+    def attach_content_store(self, content_store):
+        """Move message bodies into a ContentStore; records keep a content_ref
+        and decompress full_content only when it is read"""
+
+        self.content_store = content_store
+        self.records = [content_store.compact(record) for record in self.records]
+
+    @classmethod
+    def from_structures(cls, records: List[Dict], default_client: str, structures: Dict) -> "CommunicationsIndex":
+        """Index over records from prebuilt structures (see index_snapshot), without re-tokenizing"""
+
+        index = cls.__new__(cls)
+        index.records = list(records)
+        index.default_client = default_client
+        index.content_store = None
+        for name in ("clients", "search_vocab", "postings", "theme_counts", "by_client", "by_date", "focus_matches"):
+            setattr(index, name, structures[name])
+        return index
+
+    def _index_record(self, doc_id: int, record: Dict):
+        text = (record.get("full_content", "") + " " +
+                record.get("subject", "")).lower()
+        self._index_tokens(doc_id, record, sorted(set(text.split())))
+
+    def _index_tokens(self, doc_id: int, record: Dict, tokens: List[str]):
+        self.clients.append(record.get("client", self.default_client))
+
+        self.search_vocab.append("\n".join(tokens))
+        for token in tokens:
+            self.postings.setdefault(token, []).append(doc_id)
+
+        themes = set(record.get("key_themes", []))
+        self.theme_counts.update(record.get("key_themes", []))
+        self.by_client.setdefault(self.clients[doc_id], []).append(doc_id)
+        for focus, focus_themes in FOCUS_THEMES.items():
+            if themes & set(focus_themes):
+                self.focus_matches[focus].add(doc_id)
+
+    def add(self, record: Dict) -> int:
+        """Index one more record in place; returns its doc id"""
+
+        doc_id = len(self.records)
+        self._index_record(doc_id, record)
+        self._append(doc_id, record)
+        return doc_id
+
+    def merge(self, other: "CommunicationsIndex", count: Optional[int] = None) -> int:
+        """Append other's first count records (all by default) in place
+
+        Reuses other's token lists, so bodies are never re-read (or
+        decompressed); cost is proportional to the records merged.
+        """
+
+        count = len(other.records) if count is None else count
+        for local_id in range(count):
+            record = other.records[local_id]
+            doc_id = len(self.records)
+            vocab = other.search_vocab[local_id]
+            self._index_tokens(doc_id, record, vocab.split("\n") if vocab else [])
+            self._append(doc_id, record)
+        return count
+
+    def _append(self, doc_id: int, record: Dict):
+        self.records.append(self.content_store.compact(record) if self.content_store is not None else record)
+        bisect.insort(self.by_date, doc_id, key=lambda i: self.records[i].get("date", ""))
+
+    def next_doc_id(self) -> int:
+        return len(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def candidates(self, client: Optional[str] = None, start_date: Optional[str] = None,
+                   end_date: Optional[str] = None) -> List[int]:
+        """Record ids for a client and inclusive ISO date window, in input order"""
+
+        doc_ids = self.by_client.get(client, []) if client else range(len(self.records))
+        return [doc_id for doc_id in doc_ids
+                if (start_date is None or self.records[doc_id].get("date", "") >= start_date)
+                and (end_date is None or self.records[doc_id].get("date", "") <= end_date)]
+
+    def client_names(self) -> List[str]:
+        return sorted(self.by_client)
+
+    def latest_date(self) -> Optional[str]:
+        return self.records[self.by_date[-1]].get("date") if self.by_date else None
+
+    def score(self, query: str, focus: str, doc_ids: Optional[List[int]] = None,
+              limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(doc_id, relevance_score) pairs, best first, ties kept in input order"""
+
+        if doc_ids is None:
+            doc_ids = range(len(self.records))
+
+        query_words = [word for word in query.lower().split() if len(word) > 3]
+        focus_matches = self.focus_matches.get(focus, set())
+
+        scored = []
+        for doc_id in doc_ids:
+            relevance_score = BASE_RELEVANCE
+            if doc_id in focus_matches:
+                relevance_score += FOCUS_BONUS
+
+            vocab = self.search_vocab[doc_id]
+            for word in query_words:
+                if word in vocab:
+                    relevance_score += KEYWORD_BONUS
+
+            scored.append((doc_id, relevance_score))
+
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return scored if limit is None else scored[:limit]
+
+    def most_frequent_themes(self, limit: int = 4) -> List[Tuple[str, int]]:
+        return self.theme_counts.most_common(limit)
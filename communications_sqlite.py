@@ -0,0 +1,416 @@
+"""
+MILO Communications SQLite Store - Single-file FTS5 backend for communications search
+Durable alternative to the in-memory CommunicationsIndex with the same lookup
+surface: bm25-ranked full-text search over subject and content, indexed
+client/date/type/urgency columns and a JSON tags table for themes and entities
+
+Select it with MILO_COMMS_BACKEND=sqlite (database path in MILO_COMMS_DB).
+"""
+
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+from communications_index import (BASE_RELEVANCE, DEFAULT_CLIENT, FOCUS_BONUS,
+                                  FOCUS_THEMES)
+
+COMMS_BACKEND_ENV = "MILO_COMMS_BACKEND"
+COMMS_DB_ENV = "MILO_COMMS_DB"
+DEFAULT_DB_PATH = "communications.db"
+
+SCHEMA_VERSION = 3
+INSERT_BATCH_SIZE = 1000
+
+# bm25 column weights: a subject hit counts double a body hit
+BM25_WEIGHTS = (2.0, 1.0)
+# FTS5's fixed bm25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS communications (
+    id INTEGER PRIMARY KEY,
+    client TEXT NOT NULL,
+    date TEXT NOT NULL,
+    type TEXT,
+    urgency TEXT,
+    sentiment TEXT,
+    subject TEXT,
+    full_content TEXT,
+    thread_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_communications_client_date ON communications (client, date);
+CREATE INDEX IF NOT EXISTS idx_communications_date ON communications (date);
+CREATE INDEX IF NOT EXISTS idx_communications_type ON communications (type);
+CREATE INDEX IF NOT EXISTS idx_communications_urgency ON communications (urgency);
+CREATE INDEX IF NOT EXISTS idx_communications_thread ON communications (thread_id);
+
+CREATE TABLE IF NOT EXISTS communication_tags (
+    communication_id INTEGER PRIMARY KEY REFERENCES communications (id),
+    themes TEXT NOT NULL DEFAULT '[]',
+    entities TEXT NOT NULL DEFAULT '[]',
+    client_requests TEXT NOT NULL DEFAULT '[]'
+);
+
+-- Themes normalized for indexed focus lookups; communication_tags keeps the lists
+CREATE TABLE IF NOT EXISTS communication_themes (
+    theme TEXT NOT NULL,
+    communication_id INTEGER NOT NULL REFERENCES communications (id),
+    PRIMARY KEY (theme, communication_id)
+) WITHOUT ROWID;
+
+-- External-content FTS table: text lives once, in communications
+CREATE VIRTUAL TABLE IF NOT EXISTS communications_fts USING fts5 (
+    subject, full_content, content='communications', content_rowid='id'
+);
+"""
+
+_QUERY_WORD = re.compile(r"\w+")
+# unicode61 tokens: runs of letters and digits
+_FTS_TOKEN = re.compile(r"[^\W_]+")
+
+
+def fts_query(query: str) -> Optional[str]:
+    """OR of quoted query words longer than 3 chars, matching the in-memory scoring rule"""
+
+    words = sorted({word for word in _QUERY_WORD.findall(query.lower()) if len(word) > 3})
+    if not words:
+        return None
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+def fts_tokens(text: str) -> List[str]:
+    """Tokens as FTS5's default unicode61 tokenizer produces them (case folded, diacritics removed)"""
+
+    text = unicodedata.normalize("NFD", (text or "").lower())
+    text = "".join(char for char in text if unicodedata.category(char) != "Mn")
+    return _FTS_TOKEN.findall(text)
+
+
+def fts_columns(record: Dict) -> Tuple[List[str], List[str]]:
+    """(subject, full_content) tokens of a record, for score_records"""
+
+    return fts_tokens(record.get("subject", "")), fts_tokens(record.get("full_content", ""))
+
+
+def _phrase_hits(tokens: List[str], phrase: List[str]) -> int:
+    return sum(1 for i in range(len(tokens) - len(phrase) + 1) if tokens[i:i + len(phrase)] == phrase)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """SQLite varint at pos; returns (value, next pos)"""
+
+    value = 0
+    for i in range(8):
+        byte = data[pos + i]
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos + i + 1
+    return (value << 8) | data[pos + 8], pos + 9
+
+
+class _RecordView:
+    """Sequence-like access to records by id without loading the table"""
+
+    def __init__(self, store: "SqliteCommunicationsStore"):
+        self._store = store
+
+    def __getitem__(self, doc_id: int) -> Dict:
+        record = self._store.get(doc_id)
+        if record is None:
+            raise IndexError(doc_id)
+        return record
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+
+class SqliteCommunicationsStore:
+    """CommunicationsIndex-compatible search over a WAL-mode SQLite database
+
+    Connections are per thread (and re-opened after fork), so Streamlit
+    sessions, service workers and batch processes can all read concurrently.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.records = _RecordView(self)
+
+        conn = self._connection()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        with conn:
+            if version == 1:
+                conn.execute("ALTER TABLE communications ADD COLUMN thread_id TEXT")
+            conn.executescript(SCHEMA)
+            if 0 < version < 3:
+                conn.execute("""INSERT OR IGNORE INTO communication_themes
+                                SELECT theme.value, t.communication_id
+                                FROM communication_tags t, json_each(t.themes) theme""")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM communications").fetchone()[0]
+
+    def add_records(self, records: Iterable[Dict], default_client: str = DEFAULT_CLIENT,
+                    batch_size: int = INSERT_BATCH_SIZE) -> int:
+        """Batched inserts, one transaction per batch; returns the number added"""
+
+        conn = self._connection()
+        added = 0
+        batch = []
+
+        def flush():
+            # IMMEDIATE takes the write lock before ids are allocated, so
+            # concurrent writers in other processes cannot claim the same ids
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute("SELECT COALESCE(MAX(id), 0) FROM communications")
+                next_id = cursor.fetchone()[0] + 1
+                rows = []
+                tags = []
+                themes = []
+                for offset, record in enumerate(batch):
+                    doc_id = next_id + offset
+                    rows.append((doc_id, record.get("client", default_client), record.get("date", ""),
+                                 record.get("type"), record.get("urgency"), record.get("sentiment"),
+                                 record.get("subject", ""), record.get("full_content", ""),
+                                 record.get("thread_id")))
+                    tags.append((doc_id, json.dumps(record.get("key_themes", [])),
+                                 json.dumps(record.get("entities", [])),
+                                 json.dumps(record.get("client_requests", []))))
+                    themes.extend((theme, doc_id) for theme in set(record.get("key_themes", [])))
+                conn.executemany(
+                    """INSERT INTO communications
+                       (id, client, date, type, urgency, sentiment, subject, full_content, thread_id)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+                conn.executemany("INSERT INTO communication_tags VALUES (?, ?, ?, ?)", tags)
+                conn.executemany("INSERT INTO communication_themes VALUES (?, ?)", themes)
+                conn.executemany(
+                    "INSERT INTO communications_fts (rowid, subject, full_content) VALUES (?, ?, ?)",
+                    [(row[0], row[6], row[7]) for row in rows])
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            batch.clear()
+
+        for record in records:
+            batch.append(record)
+            added += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return added
+
+    def get(self, doc_id: int) -> Optional[Dict]:
+        row = self._connection().execute(
+            """SELECT c.*, t.themes, t.entities, t.client_requests
+               FROM communications c LEFT JOIN communication_tags t ON t.communication_id = c.id
+               WHERE c.id = ?""", (doc_id,)).fetchone()
+        return self._to_record(row) if row is not None else None
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> Dict:
+        record = {
+            "date": row["date"],
+            "type": row["type"],
+            "subject": row["subject"],
+            "full_content": row["full_content"],
+            "sentiment": row["sentiment"],
+            "key_themes": json.loads(row["themes"] or "[]"),
+            "entities": json.loads(row["entities"] or "[]"),
+            "client_requests": json.loads(row["client_requests"] or "[]"),
+            "urgency": row["urgency"],
+            "client": row["client"]
+        }
+        if row["thread_id"]:
+            record["thread_id"] = row["thread_id"]
+        return record
+
+    def next_doc_id(self) -> int:
+        return self._connection().execute("SELECT COALESCE(MAX(id), 0) + 1 FROM communications").fetchone()[0]
+
+    def client_names(self) -> List[str]:
+        return [row[0] for row in self._connection().execute(
+            "SELECT DISTINCT client FROM communications ORDER BY client")]
+
+    def latest_date(self) -> Optional[str]:
+        return self._connection().execute("SELECT MAX(date) FROM communications").fetchone()[0]
+
+    def candidates(self, client: Optional[str] = None, start_date: Optional[str] = None,
+                   end_date: Optional[str] = None) -> List[int]:
+        """Record ids for a client and inclusive ISO date window, in insertion order"""
+
+        clauses, params = [], []
+        for clause, value in (("client = ?", client), ("date >= ?", start_date), ("date <= ?", end_date)):
+            if value:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return [row[0] for row in self._connection().execute(
+            f"SELECT id FROM communications {where} ORDER BY id", params)]
+
+    def score(self, query: str, focus: str, doc_ids: Optional[List[int]] = None,
+              limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(doc_id, relevance), best first: focus theme bonus plus bm25 text relevance
+
+        Only FTS matches and focus-theme records are scored (both from
+        indexes); records with neither are still returned after them (base
+        relevance), ties in id order, like the in-memory index.
+        """
+
+        match = fts_query(query)
+        params = {"focus_themes": json.dumps(FOCUS_THEMES.get(focus, [])), "match": match}
+
+        if match is not None:
+            matched = (f"SELECT rowid AS id, bm25(communications_fts, {BM25_WEIGHTS[0]}, {BM25_WEIGHTS[1]}) AS rank "
+                       "FROM communications_fts WHERE communications_fts MATCH :match")
+        else:
+            matched = "SELECT NULL AS id, NULL AS rank WHERE 0"
+        focus_themes = "SELECT value FROM json_each(:focus_themes)"
+
+        sql = [f"""
+            WITH matched AS ({matched}),
+                 candidates(id) AS (
+                     SELECT id FROM matched
+                     UNION
+                     SELECT communication_id FROM communication_themes WHERE theme IN ({focus_themes}))
+            SELECT c.id,
+                   EXISTS (SELECT 1 FROM communication_themes t
+                           WHERE t.theme IN ({focus_themes}) AND t.communication_id = c.id) AS focus_match,
+                   m.rank
+            FROM candidates c LEFT JOIN matched m ON m.id = c.id"""]
+        if doc_ids is not None:
+            sql.append("WHERE c.id IN (SELECT value FROM json_each(:doc_ids))")
+            params["doc_ids"] = json.dumps(list(doc_ids))
+
+        # bm25 is negative (never zero), so every candidate outranks the rest
+        sql.append(f"ORDER BY (focus_match * {FOCUS_BONUS}) - COALESCE(m.rank, 0) DESC, c.id")
+        if limit is not None:
+            sql.append("LIMIT :limit")
+            params["limit"] = limit
+
+        conn = self._connection()
+        scored = [(row[0], round(BASE_RELEVANCE + FOCUS_BONUS * row[1] - (row[2] or 0.0), 2))
+                  for row in conn.execute("\n".join(sql), params)]
+        if limit is not None and len(scored) >= limit:
+            return scored
+
+        # Fewer candidates than asked for: pad with unscored records in id order
+        fill = ["SELECT id FROM communications WHERE id NOT IN (SELECT value FROM json_each(:scored))"]
+        if doc_ids is not None:
+            fill.append("AND id IN (SELECT value FROM json_each(:doc_ids))")
+        fill.append("ORDER BY id")
+        params["scored"] = json.dumps([doc_id for doc_id, _ in scored])
+        if limit is not None:
+            fill.append("LIMIT :limit")
+            params["limit"] = limit - len(scored)
+        scored += [(row[0], round(float(BASE_RELEVANCE), 2)) for row in conn.execute("\n".join(fill), params)]
+        return scored
+
+    def _fts_totals(self) -> Tuple[int, int]:
+        """(rows, tokens across all columns) from the FTS5 averages record"""
+
+        row = self._connection().execute("SELECT block FROM communications_fts_data WHERE id = 1").fetchone()
+        if row is None or not row[0]:
+            return 0, 0
+        rows, pos = _read_varint(row[0], 0)
+        tokens = 0
+        for _ in BM25_WEIGHTS:
+            column_tokens, pos = _read_varint(row[0], pos)
+            tokens += column_tokens
+        return rows, tokens
+
+    def score_records(self, query: str, focus: str, records: List[Dict],
+                      columns: Optional[List[Tuple[List[str], List[str]]]] = None) -> List[float]:
+        """score() relevance for records not yet in the store, as if they had been added
+
+        Applies FTS5's bm25 to the records with corpus statistics (row count,
+        average length, rows per phrase) taken over the store plus records, so
+        a logged record keeps its score once it is compacted in. columns are
+        the records' fts_columns, when already tokenized.
+        """
+
+        columns = [fts_columns(record) for record in records] if columns is None else columns
+        focus_themes = set(FOCUS_THEMES.get(focus, []))
+        match = fts_query(query)
+        phrases = [] if match is None else [phrase for phrase in map(fts_tokens, match.split(" OR ")) if phrase]
+
+        rows, tokens = self._fts_totals()
+        rows += len(records)
+        tokens += sum(len(subject) + len(content) for subject, content in columns)
+        average_length = tokens / rows if rows else 0.0
+
+        conn = self._connection()
+        idfs = []
+        hits = []
+        for phrase in phrases:
+            phrase_hits = [[_phrase_hits(column, phrase) for column in doc_columns] for doc_columns in columns]
+            matching = conn.execute("SELECT COUNT(*) FROM communications_fts WHERE communications_fts MATCH ?",
+                                    (f'"{" ".join(phrase)}"',)).fetchone()[0]
+            matching += sum(1 for doc_hits in phrase_hits if any(doc_hits))
+            idf = math.log((rows - matching + 0.5) / (matching + 0.5))
+            idfs.append(idf if idf > 0 else 1e-6)
+            hits.append(phrase_hits)
+
+        relevances = []
+        for doc, (record, doc_columns) in enumerate(zip(records, columns)):
+            length = sum(len(column) for column in doc_columns)
+            bm25 = 0.0
+            for idf, phrase_hits in zip(idfs, hits):
+                freq = sum(weight * count for weight, count in zip(BM25_WEIGHTS, phrase_hits[doc]))
+                if freq:
+                    bm25 += idf * freq * (BM25_K1 + 1) / (
+                        freq + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+            focus_match = bool(focus_themes & set(record.get("key_themes", [])))
+            relevances.append(round(BASE_RELEVANCE + FOCUS_BONUS * focus_match + bm25, 2))
+        return relevances
+
+    @property
+    def theme_counts(self) -> Counter:
+        return Counter(dict(self._connection().execute(
+            """SELECT theme.value, COUNT(*) FROM communication_tags t, json_each(t.themes) theme
+               GROUP BY theme.value""").fetchall()))
+
+    def most_frequent_themes(self, limit: int = 4) -> List[Tuple[str, int]]:
+        return [(row[0], row[1]) for row in self._connection().execute(
+            """SELECT theme.value, COUNT(*) AS n FROM communication_tags t, json_each(t.themes) theme
+               GROUP BY theme.value ORDER BY n DESC, theme.value LIMIT ?""", (limit,))]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def open_store(path: Optional[str] = None, seed_records: Optional[List[Dict]] = None) -> SqliteCommunicationsStore:
+    """Open (creating if needed) the store; an empty database is loaded from seed_records"""
+
+    store = SqliteCommunicationsStore(path or os.environ.get(COMMS_DB_ENV, DEFAULT_DB_PATH))
+    if seed_records and len(store) == 0:
+        store.add_records(seed_records)
+    return store
+
+
+def sqlite_backend_selected() -> bool:
+    return os.environ.get(COMMS_BACKEND_ENV, "memory").lower() == "sqlite"
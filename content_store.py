@@ -0,0 +1,297 @@
+"""
+MILO Content Store - Compressed, content-addressed storage for message bodies
+full_content is by far the largest field of a communication, yet only the few
+records shown in the timeline or packed into an LLM prompt ever need it.
+Bodies are compressed with a dictionary trained on the corpus (zstd when
+installed, zlib with a preset dictionary otherwise), stored once per distinct
+text, and decompressed only when a record's full_content is read; the index
+keeps tokens and metadata.
+
+MILO_CONTENT_STORE=memory keeps compressed blobs in memory;
+MILO_CONTENT_STORE=<dir> writes them to disk so nothing stays resident.
+"""
+
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional
+import hashlib
+import os
+import re
+import threading
+import zlib
+
+from milo_tracing import record_cache
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+CONTENT_STORE_ENV = "MILO_CONTENT_STORE"
+
+# zlib only looks back 32 KB, so a larger preset dictionary is wasted
+DICTIONARY_SIZE = 32 * 1024
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 9
+DECOMPRESSED_CACHE_SIZE = 64
+
+# Blob layout: codec byte, 8-byte dictionary id (zeros for none), payload
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+_NO_DICTIONARY = bytes(8)
+
+_WORD_RUN = re.compile(r"\S+(?:\s+\S+){0,3}")
+
+
+def build_raw_dictionary(samples: Iterable[str], size: int = DICTIONARY_SIZE) -> bytes:
+    """Preset dictionary of the lines and phrases that recur across samples
+
+    Greetings, sign-offs, headers and fund names repeat from message to
+    message; seeding the compressor with them lets even short bodies
+    back-reference instead of spelling them out. Most frequent content goes
+    last, where match offsets are shortest.
+    """
+
+    line_counts = Counter()
+    phrase_counts = Counter()
+    for sample in samples:
+        line_counts.update({line.strip() for line in sample.splitlines() if len(line.strip()) > 8})
+        phrase_counts.update(set(_WORD_RUN.findall(sample)))
+
+    recurring = {phrase: count for phrase, count in phrase_counts.items() if count > 1}
+    recurring.update((line, count) for line, count in line_counts.items() if count > 1)
+
+    chosen, total = [], 0
+    for piece in sorted(recurring, key=recurring.get, reverse=True):
+        encoded = piece.encode() + b"\n"
+        if total + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        total += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+class ContentStore:
+    """Blobs keyed by sha256 of the text, compressed with a shared dictionary
+
+    Identical bodies (forwards, resends) are stored once. Blobs carry the id
+    of the dictionary they were compressed with, so retraining never strands
+    older blobs.
+    """
+
+    def __init__(self, root: Optional[str] = None, use_zstd: bool = ZSTD_AVAILABLE):
+        self.root = root
+        self.use_zstd = use_zstd and ZSTD_AVAILABLE
+        self._blobs: Dict[str, bytes] = {}
+        self._dictionaries: Dict[bytes, bytes] = {}
+        self.dictionary_id: Optional[bytes] = None
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._local = threading.local()
+        self.stats = {"blobs": 0, "raw_bytes": 0, "stored_bytes": 0, "decompressions": 0}
+
+        if root is not None:
+            os.makedirs(os.path.join(root, "dicts"), exist_ok=True)
+
+    # ------------------------------------------------------------ dictionaries
+
+    def train(self, samples: List[str], size: int = DICTIONARY_SIZE) -> bytes:
+        """Train (or rebuild) the dictionary new blobs are compressed with"""
+
+        dictionary = None
+        if self.use_zstd:
+            try:
+                trained = zstandard.train_dictionary(size, [sample.encode() for sample in samples if sample])
+                dictionary = trained.as_bytes()
+            except zstandard.ZstdError:
+                # Too few samples to train; zstd accepts raw content dictionaries too
+                dictionary = None
+        if dictionary is None:
+            dictionary = build_raw_dictionary(samples, size)
+
+        dictionary_id = hashlib.sha256(dictionary).digest()[:8]
+        with self._lock:
+            self._dictionaries[dictionary_id] = dictionary
+            self.dictionary_id = dictionary_id
+        if self.root is not None:
+            _write_atomic(os.path.join(self.root, "dicts", dictionary_id.hex()), dictionary)
+        return dictionary_id
+
+    def _dictionary(self, dictionary_id: bytes) -> bytes:
+        dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None and self.root is not None:
+            with open(os.path.join(self.root, "dicts", dictionary_id.hex()), "rb") as f:
+                dictionary = f.read()
+            self._dictionaries[dictionary_id] = dictionary
+        if dictionary is None:
+            raise KeyError(f"Unknown content dictionary {dictionary_id.hex()}")
+        return dictionary
+
+    # zstd contexts are not thread-safe; keep one per thread and dictionary
+    def _zstd(self, kind: str, dictionary_id: bytes):
+        key = (kind, dictionary_id)
+        contexts = self._local.__dict__.setdefault("contexts", {})
+        if key not in contexts:
+            data = zstandard.ZstdCompressionDict(
+                self._dictionary(dictionary_id), dict_type=zstandard.DICT_TYPE_AUTO)
+            contexts[key] = (zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=data) if kind == "c"
+                             else zstandard.ZstdDecompressor(dict_data=data))
+        return contexts[key]
+
+    # ------------------------------------------------------------------ blobs
+
+    def _compress(self, data: bytes) -> bytes:
+        dictionary_id = self.dictionary_id
+        if dictionary_id is None:
+            codec, dictionary_id, payload = CODEC_ZLIB, _NO_DICTIONARY, zlib.compress(data, ZLIB_LEVEL)
+        elif self.use_zstd:
+            codec, payload = CODEC_ZSTD, self._zstd("c", dictionary_id).compress(data)
+        else:
+            compressor = zlib.compressobj(ZLIB_LEVEL, zdict=self._dictionary(dictionary_id))
+            codec, payload = CODEC_ZLIB, compressor.compress(data) + compressor.flush()
+        # Tiny bodies can come out larger; store those as-is
+        if len(payload) >= len(data):
+            return bytes([CODEC_RAW]) + _NO_DICTIONARY + data
+        return bytes([codec]) + dictionary_id + payload
+
+    def _decompress(self, blob: bytes) -> bytes:
+        codec, dictionary_id, payload = blob[0], blob[1:9], blob[9:]
+        if codec == CODEC_RAW:
+            return payload
+        if codec == CODEC_ZSTD:
+            return self._zstd("d", dictionary_id).decompress(payload)
+        if dictionary_id == _NO_DICTIONARY:
+            return zlib.decompress(payload)
+        decompressor = zlib.decompressobj(zdict=self._dictionary(dictionary_id))
+        return decompressor.decompress(payload) + decompressor.flush()
+
+    def _blob_path(self, ref: str) -> str:
+        return os.path.join(self.root, ref[:2], ref + ".blob")
+
+    def put(self, text: str) -> str:
+        """Store text (once per distinct body); returns its content ref"""
+
+        data = text.encode()
+        ref = hashlib.sha256(data).hexdigest()
+        if ref in self:
+            return ref
+
+        blob = self._compress(data)
+        with self._lock:
+            if self.root is None:
+                self._blobs[ref] = blob
+            else:
+                path = self._blob_path(ref)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                _write_atomic(path, blob)
+            self.stats["blobs"] += 1
+            self.stats["raw_bytes"] += len(data)
+            self.stats["stored_bytes"] += len(blob)
+        return ref
+
+    def get(self, ref: str) -> str:
+        with self._lock:
+            text = self._cache.get(ref)
+            if text is not None:
+                self._cache.move_to_end(ref)
+        record_cache("content", text is not None)
+        if text is not None:
+            return text
+
+        if self.root is None:
+            blob = self._blobs[ref]
+        else:
+            with open(self._blob_path(ref), "rb") as f:
+                blob = f.read()
+        text = self._decompress(blob).decode()
+
+        with self._lock:
+            self.stats["decompressions"] += 1
+            self._cache[ref] = text
+            while len(self._cache) > DECOMPRESSED_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return text
+
+    def __contains__(self, ref: str) -> bool:
+        if self.root is None:
+            return ref in self._blobs
+        return os.path.exists(self._blob_path(ref))
+
+    @property
+    def resident_bytes(self) -> int:
+        """Compressed bytes held in memory (zero for an on-disk store)"""
+
+        return sum(len(blob) for blob in self._blobs.values())
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.stats["raw_bytes"] / max(self.stats["stored_bytes"], 1)
+
+    def compact(self, record: Dict) -> "LazyContentRecord":
+        if isinstance(record, LazyContentRecord):
+            return record
+        return LazyContentRecord(record, self)
+
+
+class LazyContentRecord(dict):
+    """A record whose full_content lives in a ContentStore
+
+    Reading record["full_content"] or record.get("full_content") decompresses
+    it on demand; the dict itself only holds metadata and a content_ref, so
+    copies ({**record}) and JSON dumps leave the body behind.
+    """
+
+    __slots__ = ("_store",)
+
+    def __init__(self, record: Dict, store: ContentStore):
+        super().__init__((key, value) for key, value in record.items() if key != "full_content")
+        self["content_ref"] = store.put(record.get("full_content") or "")
+        self._store = store
+
+    def __getitem__(self, key):
+        if key == "full_content":
+            return self._store.get(dict.__getitem__(self, "content_ref"))
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == "full_content":
+            return self["full_content"]
+        return dict.get(self, key, default)
+
+    def __contains__(self, key) -> bool:
+        return key == "full_content" or dict.__contains__(self, key)
+
+    def materialize(self) -> Dict:
+        """Plain dict copy with the body decompressed"""
+
+        record = {key: value for key, value in self.items() if key != "content_ref"}
+        record["full_content"] = self["full_content"]
+        return record
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_content_store() -> Optional[ContentStore]:
+    """Store named by MILO_CONTENT_STORE ("memory" or a directory), once per process"""
+
+    global _default_store
+
+    location = os.environ.get(CONTENT_STORE_ENV)
+    if not location:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ContentStore(None if location == "memory" else location)
+            codec = "zstd" if _default_store.use_zstd else "zlib (zstandard not installed)"
+            print(f"✅ Content store using {codec} dictionary compression")
+    return _default_store
@@ -0,0 +1,218 @@
+"""
+MILO Context Packer - Token-budgeted communications context for agent prompts
+Ranks communications against the query with the shared index, then adds full
+text, matching paragraphs or one-line summaries for the most relevant records
+until the task's token budget is spent
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import hashlib
+import threading
+
+from communications_index import CommunicationsIndex
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# Rough English average, used when tiktoken or its encoding files are unavailable
+CHARS_PER_TOKEN = 4
+
+# Per-task prompt budgets for packed communications
+TASK_TOKEN_BUDGETS = {
+    "communications": 3000,
+    "meeting_prep": 1200
+}
+DEFAULT_TOKEN_BUDGET = 2000
+
+TOKEN_CACHE_SIZE = 10000
+
+
+class TokenCounter:
+    """tiktoken counts memoized by content hash; falls back to a length estimate"""
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, cache_size: int = TOKEN_CACHE_SIZE):
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self._encoding = None
+        self._encoding_loaded = False
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self) -> bool:
+        return self._load_encoding() is not None
+
+    def _load_encoding(self):
+        if not self._encoding_loaded:
+            if TIKTOKEN_AVAILABLE:
+                try:
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    # Encodings are downloaded on first use, which fails offline
+                    print(f"⚠️ tiktoken encoding unavailable ({type(e).__name__}) - estimating tokens")
+            self._encoding_loaded = True
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        encoding = self._load_encoding()
+        if encoding is not None:
+            tokens = len(encoding.encode(text, disallowed_special=()))
+        else:
+            tokens = -(-len(text) // CHARS_PER_TOKEN)
+
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+
+_default_counter = None
+_default_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """Process-wide counter so the token cache is shared by every prompt"""
+
+    global _default_counter
+
+    with _default_counter_lock:
+        if _default_counter is None:
+            _default_counter = TokenCounter()
+    return _default_counter
+
+
+def _header(record: Dict) -> str:
+    return f"[{record.get('date', '')}] {record.get('type', 'note')}: {record.get('subject', '')}"
+
+
+def summarize_record(record: Dict) -> str:
+    """One-line stand-in for a record whose full text does not fit"""
+
+    parts = [_header(record)]
+    if record.get("summary"):
+        parts.append(record["summary"])
+    if record.get("key_themes"):
+        parts.append("themes: " + ", ".join(record["key_themes"]))
+    if record.get("client_requests"):
+        parts.append("requests: " + "; ".join(record["client_requests"]))
+    return " | ".join(parts)
+
+
+def format_full(record: Dict) -> str:
+    body = record.get("full_content") or record.get("summary", "")
+    return f"{_header(record)}\n{body.strip()}"
+
+
+def chunk_record(record: Dict) -> List[str]:
+    """Paragraph chunks of a record's full text"""
+
+    body = record.get("full_content") or ""
+    return [chunk.strip() for chunk in body.split("\n\n") if chunk.strip()]
+
+
+class ContextPacker:
+    """Greedy budget fill over index-ranked communications"""
+
+    def __init__(self, index: CommunicationsIndex, counter: Optional[TokenCounter] = None):
+        self.index = index
+        self.counter = counter or get_token_counter()
+
+    def excerpt(self, record: Dict, query: str, budget: int) -> Optional[str]:
+        """Header plus the query-matching paragraphs that fit, in original order"""
+
+        query_words = [word for word in query.lower().split() if len(word) > 3]
+        chunks = chunk_record(record)
+        ranked = sorted(range(len(chunks)), reverse=True,
+                        key=lambda i: sum(word in chunks[i].lower() for word in query_words))
+
+        header = _header(record)
+        used = self.counter.count(header)
+        chosen = []
+        for i in ranked:
+            if not any(word in chunks[i].lower() for word in query_words):
+                break
+            tokens = self.counter.count(chunks[i]) + 1
+            if used + tokens <= budget:
+                chosen.append(i)
+                used += tokens
+
+        if not chosen:
+            return None
+        return header + "\n" + "\n[...]\n".join(chunks[i] for i in sorted(chosen))
+
+    def pack(self, query: str, budget: int = DEFAULT_TOKEN_BUDGET, focus: str = "general",
+             doc_ids: Optional[List[int]] = None, chronological: bool = True,
+             top_k: Optional[int] = None) -> Dict:
+        """Best-first: full text if it fits, else matching paragraphs, else the summary
+
+        Records that fit in no form are skipped without stopping the fill - a
+        later, shorter record may still fit. Only the top_k ranked records are
+        considered when top_k is set. The packed text is emitted in date order
+        unless chronological=False.
+        """
+
+        separator_tokens = self.counter.count("\n\n")
+        used = 0
+        included = []
+        dropped = []
+
+        ranked = self.index.score(query, focus, doc_ids)
+        if top_k is not None:
+            dropped = [doc_id for doc_id, _ in ranked[top_k:]]
+            ranked = ranked[:top_k]
+
+        for doc_id, relevance in ranked:
+            record = self.index.records[doc_id]
+            separator = separator_tokens if included else 0
+            forms = (
+                ("full", lambda: format_full(record)),
+                ("excerpt", lambda: self.excerpt(record, query, budget - used - separator)),
+                ("summary", lambda: summarize_record(record))
+            )
+
+            for mode, render in forms:
+                text = render()
+                if text is None:
+                    continue
+                tokens = self.counter.count(text) + separator
+                if used + tokens <= budget:
+                    included.append({"doc_id": doc_id, "mode": mode, "relevance": relevance,
+                                     "tokens": tokens, "text": text})
+                    used += tokens
+                    break
+            else:
+                dropped.append(doc_id)
+
+        if chronological:
+            included.sort(key=lambda item: self.index.records[item["doc_id"]].get("date", ""))
+
+        return {
+            "text": "\n\n".join(item["text"] for item in included),
+            "tokens": used,
+            "budget": budget,
+            "exact_tokens": self.counter.exact,
+            "included": included,
+            "dropped": dropped
+        }
+
+
+def pack_for_task(index: CommunicationsIndex, task: str, query: str, focus: str = "general",
+                  doc_ids: Optional[List[int]] = None, top_k: Optional[int] = None) -> Dict:
+    """Pack communications with the budget configured for a crew task"""
+
+    budget = TASK_TOKEN_BUDGETS.get(task, DEFAULT_TOKEN_BUDGET)
+    return ContextPacker(index).pack(query, budget, focus, doc_ids, top_k=top_k)
@@ -0,0 +1,162 @@
+"""
+MILO Crew Streaming - Token-level crew output for the dashboard
+Listens on crewai's event bus for LLM stream chunks and task completions,
+routes them to the stream of the crew that produced them, and lets the
+Streamlit script thread drain them from a queue while the crew runs in a
+worker thread
+"""
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+import queue
+import threading
+
+# The event bus moved between crewai releases
+try:
+    from crewai.events import crewai_event_bus, LLMStreamChunkEvent, TaskCompletedEvent
+    STREAMING_AVAILABLE = True
+except ImportError:
+    try:
+        from crewai.utilities.events import crewai_event_bus, LLMStreamChunkEvent, TaskCompletedEvent
+        STREAMING_AVAILABLE = True
+    except ImportError:
+        STREAMING_AVAILABLE = False
+
+# Event kinds put on a CrewStream queue as (kind, agent_role, payload)
+CHUNK = "chunk"
+TASK_DONE = "task_done"
+DONE = "done"
+ERROR = "error"
+
+
+class CrewStream:
+    """Queue of streamed events for one crew run"""
+
+    def __init__(self):
+        self.events: "queue.Queue[Tuple[str, Optional[str], object]]" = queue.Queue()
+        self.agent_ids = set()
+        self.agent_roles = set()
+        self.result = None
+        self.error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, kind: str, agent_role: Optional[str], payload):
+        self.events.put((kind, agent_role, payload))
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def drain(self, timeout: float = 0.1) -> Iterator[Tuple[str, Optional[str], object]]:
+        """Yield queued events, waiting up to timeout for the first one"""
+
+        try:
+            yield self.events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            try:
+                yield self.events.get_nowait()
+            except queue.Empty:
+                return
+
+
+class _StreamRouter:
+    """Process-wide event bus listener; the bus is global, streams are per run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = []
+        self._registered = False
+
+    def _register_handlers(self):
+        if self._registered:
+            return
+
+        @crewai_event_bus.on(LLMStreamChunkEvent)
+        def on_chunk(source, event):
+            stream = self._route(event)
+            if stream is not None:
+                stream.put(CHUNK, getattr(event, "agent_role", None), event.chunk)
+
+        # Cache hits and non-streaming models still surface each task's output
+        @crewai_event_bus.on(TaskCompletedEvent)
+        def on_task_completed(source, event):
+            output = event.output
+            stream = self._route(event, getattr(output, "agent", None))
+            if stream is not None:
+                stream.put(TASK_DONE, getattr(output, "agent", None), getattr(output, "raw", str(output)))
+
+        self._registered = True
+
+    def _route(self, event, agent_role: Optional[str] = None) -> Optional[CrewStream]:
+        agent_id = getattr(event, "agent_id", None)
+        agent_role = agent_role or getattr(event, "agent_role", None)
+        with self._lock:
+            for stream in self._streams:
+                if agent_id is not None and str(agent_id) in stream.agent_ids:
+                    return stream
+            # Older events carry no agent id; a role match is only unambiguous
+            # when a single run is streaming
+            if len(self._streams) == 1:
+                stream = self._streams[0]
+                if agent_role is None or agent_role in stream.agent_roles or not stream.agent_roles:
+                    return stream
+        return None
+
+    @contextmanager
+    def bind(self, stream: CrewStream, crew):
+        with self._lock:
+            self._register_handlers()
+            stream.agent_ids = {str(agent.id) for agent in crew.agents}
+            stream.agent_roles = {agent.role for agent in crew.agents}
+            self._streams.append(stream)
+        try:
+            yield stream
+        finally:
+            with self._lock:
+                self._streams.remove(stream)
+
+
+_router = _StreamRouter()
+
+
+def bind_stream(stream: CrewStream, crew):
+    """Route the crew's events into stream for the duration of the block"""
+
+    return _router.bind(stream, crew)
+
+
+def stream_annual_review_prep(client_name: str, query: str, timeout: Optional[float] = None) -> CrewStream:
+    """Start the review crew in a worker thread and return its event stream"""
+
+    from milo_agents import execute_annual_review_prep
+
+    stream = CrewStream()
+
+    def run():
+        try:
+            stream.result = execute_annual_review_prep(client_name, query, timeout=timeout, stream=stream)
+            stream.put(DONE, None, stream.result)
+        except Exception as e:
+            stream.error = str(e)
+            stream.put(ERROR, None, stream.error)
+
+    stream._thread = threading.Thread(target=run, name="milo-crew-stream", daemon=True)
+    stream._thread.start()
+    return stream
+
+
+def collect_agent_text(texts: Dict[str, str], event) -> Optional[str]:
+    """Fold one event into per-agent text; returns the agent role it touched"""
+
+    kind, agent_role, payload = event
+    agent_role = agent_role or "MILO crew"
+    if kind == CHUNK:
+        texts[agent_role] = texts.get(agent_role, "") + str(payload)
+    elif kind == TASK_DONE:
+        # The final task output supersedes the raw token stream (tool calls, thoughts)
+        texts[agent_role] = str(payload)
+    else:
+        return None
+    return agent_role
@@ -295,6 +295,269 @@ def generate_comprehensive_mock_results(query: str, focus: str):
         }
     }
 
+# ============================================================================
+# PERFORMANCE DIAGNOSTICS
+# ============================================================================
+
+DIAGNOSTIC_STAGES = ["query_parsing", "retrieval",
+                     "market_data_fetch", "portfolio_math", "meeting_prep"]
+# Caches that always get a tile; any other cache with lookups (e.g. content) is added after these
+EXPECTED_CACHES = ["prices", "portfolio", "llm"]
+
+
+def _percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty sample"""
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def _process_memory_mb() -> dict:
+    """Current and peak resident memory of this Streamlit process"""
+
+    memory = {"current_rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        memory["current_rss_mb"] = resident_pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        memory["peak_rss_mb"] = peak / 1e6 if os.uname().sysname == "Darwin" else peak * 1024 / 1e6
+    except (ImportError, AttributeError):
+        pass
+    return memory
+
+
+def trace_stage_seconds(trace_id) -> dict:
+    """Seconds per pipeline stage (summed over nested spans) in one recorded analysis trace"""
+
+    import milo_tracing
+
+    for trace in milo_tracing.recent_traces():
+        if trace["trace_id"] != trace_id:
+            continue
+        totals = {}
+        pending = list(trace["children"])
+        while pending:
+            child = pending.pop()
+            totals[child["name"]] = totals.get(child["name"], 0.0) + (child["duration"] or 0.0)
+            pending.extend(child["children"])
+        return totals
+    return {}
+
+
+def collect_diagnostics() -> dict:
+    """Snapshot of pipeline timing, cache and index instrumentation"""
+
+    import milo_tracing
+    import market_data
+    import enhanced_milo_agents
+    import portfolio_analyzer
+
+    requests = []
+    for trace in milo_tracing.recent_traces():
+        if trace["name"] != "analysis":
+            continue
+        row = {"trace_id": trace["trace_id"],
+               "started": datetime.fromtimestamp(trace["start"]).strftime("%H:%M:%S"),
+               "total_ms": trace["duration"] * 1000}
+        for child in trace["children"]:
+            if child["name"] in DIAGNOSTIC_STAGES:
+                row[child["name"] + "_ms"] = child["duration"] * 1000
+                if child["name"] == "market_data_fetch":
+                    row["price_cache"] = child["labels"].get("cache", "")
+        row["error"] = trace.get("error") or ""
+        requests.append(row)
+
+    stage_summary = []
+    for stage in ["total"] + DIAGNOSTIC_STAGES:
+        samples = [row[stage + "_ms"] for row in requests if stage + "_ms" in row]
+        stage_summary.append({
+            "stage": stage,
+            "requests": len(samples),
+            "p50_ms": _percentile(samples, 50),
+            "p95_ms": _percentile(samples, 95),
+            "max_ms": max(samples) if samples else 0.0
+        })
+
+    fetcher = market_data.get_default_fetcher()
+    index = enhanced_milo_agents.get_communications_index()
+    indexes = {"communications": len(index)}
+    if hasattr(index, "postings"):
+        indexes["communication_tokens"] = len(index.postings)
+    content_store = getattr(getattr(index, "main", index), "content_store", None)
+    if content_store is not None:
+        indexes["content_compression_ratio"] = round(content_store.compression_ratio, 2)
+        indexes["content_resident_kb"] = round(content_store.resident_bytes / 1024, 1)
+    if hasattr(index, "delta"):
+        indexes["ingest_delta"] = len(index.delta)
+        indexes["ingest_compactions"] = index.stats["compactions"]
+    price_store = (portfolio_analyzer.get_default_price_store()
+                   if portfolio_analyzer.PRICE_STORE_AVAILABLE else None)
+    if price_store is not None:
+        indexes["price_store_tickers"] = len(price_store)
+        indexes["price_store_days"] = len(price_store.dates)
+        indexes["price_store_mb"] = price_store.nbytes / 1e6
+
+    return {
+        "requests": requests,
+        "stage_summary": stage_summary,
+        "caches": milo_tracing.cache_stats(),
+        "provider": {
+            "name": getattr(fetcher.provider, "name", "none"),
+            "circuit": fetcher.breaker.state,
+            **fetcher.stats
+        },
+        "indexes": indexes,
+        "memory": _process_memory_mb()
+    }
+
+
+def show_performance_diagnostics():
+    """Ops view of real latencies, cache effectiveness and resource use"""
+
+    st.markdown('<h1 class="main-header">🩺 MILO Performance Diagnostics</h1>',
+                unsafe_allow_html=True)
+    st.caption("Live instrumentation from this server process - all sessions, most recent 200 analyses")
+
+    try:
+        diagnostics = collect_diagnostics()
+    except ImportError as e:
+        st.error(f"❌ Instrumentation unavailable: {e}")
+        return
+
+    if st.button("🔄 Refresh"):
+        st.rerun()
+
+    summary = pd.DataFrame(diagnostics["stage_summary"]).set_index("stage")
+    requests = diagnostics["requests"]
+
+    # Where the time goes: provider vs our own code
+    st.subheader("⏱️ Latency by Stage")
+    if requests:
+        total = summary.loc["total", "p95_ms"]
+        fetch = summary.loc["market_data_fetch", "p95_ms"]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("p50 Analysis", f"{summary.loc['total', 'p50_ms']:.1f} ms")
+        with col2:
+            st.metric("p95 Analysis", f"{total:.1f} ms")
+        with col3:
+            share = fetch / total * 100 if total else 0.0
+            st.metric("Market Data Share of p95", f"{share:.0f}%",
+                      "Provider-bound" if share >= 50 else "Code-bound", delta_color="off")
+
+        st.dataframe(summary.style.format("{:.2f}", subset=["p50_ms", "p95_ms", "max_ms"]),
+                     use_container_width=True)
+
+        stage_columns = [stage + "_ms" for stage in DIAGNOSTIC_STAGES]
+        recent = pd.DataFrame(requests)
+        st.bar_chart(recent.reindex(columns=stage_columns).fillna(0.0))
+
+        with st.expander("Recent requests", expanded=False):
+            st.dataframe(recent, use_container_width=True)
+    else:
+        st.info("No analyses recorded yet in this process - run one from the Client Dashboard.")
+
+    st.subheader("🗄️ Cache Hit Rates")
+    caches = diagnostics["caches"]
+    cache_names = EXPECTED_CACHES + sorted(set(caches) - set(EXPECTED_CACHES))
+    cache_cols = st.columns(len(cache_names))
+    for col, name in zip(cache_cols, cache_names):
+        with col:
+            stats = caches.get(name)
+            if stats:
+                st.metric(name.title(), f"{stats['hit_rate'] * 100:.0f}%",
+                          f"{stats['hit']:.0f} hits / {stats['miss']:.0f} misses", delta_color="off")
+            else:
+                st.metric(name.title(), "—", "No lookups recorded", delta_color="off")
+
+    st.subheader("🌐 Market Data Provider")
+    provider = diagnostics["provider"]
+    circuit_icon = {"closed": "✅", "half_open": "🟡", "open": "🔴"}.get(provider["circuit"], "⚪")
+    st.markdown(f"**Provider:** {provider['name']} | **Circuit:** {circuit_icon} {provider['circuit']}")
+    st.dataframe(pd.DataFrame([{k: v for k, v in provider.items() if k not in ("name", "circuit")}]),
+                 use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("📚 Index Sizes")
+        for name, value in diagnostics["indexes"].items():
+            st.metric(name.replace("_", " ").title(),
+                      f"{value:.1f}" if isinstance(value, float) else f"{value:,}")
+    with col2:
+        st.subheader("💾 Memory")
+        memory = diagnostics["memory"]
+        for name, value in memory.items():
+            st.metric(name.replace("_", " ").upper().replace("MB", "(MB)"),
+                      f"{value:.1f}" if value is not None else "n/a")
+
+
+# ============================================================================
+# LIVE CREW STREAMING
+# ============================================================================
+
+try:
+    import crew_streaming
+    CREW_STREAMING_AVAILABLE = crew_streaming.STREAMING_AVAILABLE
+except ImportError:
+    CREW_STREAMING_AVAILABLE = False
+
+# Set to 1 to run the real CrewAI crew (needs model credentials) with live output
+DASHBOARD_CREW_ENV = "MILO_DASHBOARD_CREW"
+STREAM_REFRESH_SECONDS = 0.1
+
+
+def show_streaming_crew_output(client_name: str, query: str) -> bool:
+    """Render each agent's output as tokens arrive; False if the crew failed"""
+
+    st.subheader("🔴 Live Crew Output")
+    status_text = st.empty()
+    status_text.markdown("**Starting crew...**")
+
+    started = time.perf_counter()
+    first_content = None
+    placeholders = {}
+    texts = {}
+
+    stream = crew_streaming.stream_annual_review_prep(client_name, query)
+
+    # Widgets may only be touched from the script thread, so poll the queue here
+    while stream.running or not stream.events.empty():
+        touched = set()
+        for event in stream.drain(STREAM_REFRESH_SECONDS):
+            agent_role = crew_streaming.collect_agent_text(texts, event)
+            if agent_role is not None:
+                touched.add(agent_role)
+
+        for agent_role in touched:
+            if agent_role not in placeholders:
+                st.markdown(f"**🤖 {agent_role}**")
+                placeholders[agent_role] = st.empty()
+            placeholders[agent_role].markdown(texts[agent_role])
+
+        if touched and first_content is None:
+            first_content = time.perf_counter() - started
+        if first_content is not None:
+            status_text.markdown(f"**Streaming...** first output after {first_content:.1f}s")
+
+    if stream.error:
+        status_text.empty()
+        st.warning(f"⚠️ CrewAI execution error: {stream.error[:100]}...")
+        return False
+
+    status_text.markdown(f"**✅ Crew complete in {time.perf_counter() - started:.1f}s** "
+                         f"(first output after {(first_content or 0):.1f}s)")
+    return True
+
+
 # ============================================================================
 # MAIN STREAMLIT APPLICATION
 # ============================================================================
@@ -303,6 +566,12 @@ def generate_comprehensive_mock_results(query: str, focus: str):
 def main():
     """Main Streamlit application - 100% Cloud compatible"""
 
+    page = st.sidebar.radio(
+        "🧭 View", ["Client Dashboard", "Performance Diagnostics"], key="page")
+    if page == "Performance Diagnostics":
+        show_performance_diagnostics()
+        return
+
     # Header
     st.markdown('<h1 class="main-header">🤖 MILO Client Intelligence Dashboard</h1>',
                 unsafe_allow_html=True)
@@ -533,6 +802,17 @@ def run_crewai_milo_analysis(client_name: str, query: str):
     </div>
     """, unsafe_allow_html=True)
 
+    # Real crew with token streaming, when enabled and installed
+    if CREW_STREAMING_AVAILABLE and os.environ.get(DASHBOARD_CREW_ENV) == "1":
+        if show_streaming_crew_output(client_name, query):
+            st.info("📊 Displaying comprehensive analysis results...")
+            agent_results = generate_comprehensive_mock_results(
+                query, query_analysis['focus'])
+            display_comprehensive_milo_results(
+                agent_results, client_name, query, query_analysis)
+            return
+        st.info("📋 Falling back to the simulated agent workflow")
+
     # Enhanced progress tracking
     progress_bar = st.progress(0)
     status_text = st.empty()
@@ -548,28 +828,26 @@ def run_crewai_milo_analysis(client_name: str, query: str):
         {
             "name": "Communications Intelligence Analyst",
             "task": f"Analyzing 8 detailed communications for {query_analysis['focus'].lower()} patterns...",
-            "description": f"Processing rich communication dataset with keyword analysis focused on {query_analysis['focus'].lower()}"
+            "description": f"Processing rich communication dataset with keyword analysis focused on {query_analysis['focus'].lower()}",
+            "stages": ["retrieval"]
         },
         {
             "name": "Portfolio Performance Intelligence Analyst",
             "task": f"Comprehensive {query_analysis['focus'].lower()}-focused performance analysis...",
-            "description": f"Real market data analysis with emphasis on {query_analysis['focus'].lower()} aspects"
+            "description": f"Real market data analysis with emphasis on {query_analysis['focus'].lower()} aspects",
+            "stages": ["market_data_fetch", "portfolio_math"]
         },
         {
             "name": "Meeting Preparation Intelligence Specialist",
             "task": f"Creating {query_analysis['focus'].lower()}-focused meeting materials...",
-            "description": f"Generating targeted materials for {query_analysis['focus'].lower()} discussions"
+            "description": f"Generating targeted materials for {query_analysis['focus'].lower()} discussions",
+            "stages": ["meeting_prep"]
         }
     ]
 
-    # Execute agent workflow simulation
+    # Agents show as working while the real pipeline runs
+    status_text.markdown(f"**CrewAI Agents 1-{len(agents_info)}**: working")
     for i, agent_info in enumerate(agents_info):
-        # Update progress
-        progress = (i + 1) / len(agents_info)
-        progress_bar.progress(progress)
-        status_text.markdown(f"**CrewAI Agent {i+1}/3**: {agent_info['name']}")
-
-        # Show agent working
         agent_containers[i].markdown(f"""
         <div class="agent-working">
             <strong>🔄 {agent_info['name']}</strong><br>
@@ -578,21 +856,7 @@ def run_crewai_milo_analysis(client_name: str, query: str):
         </div>
         """, unsafe_allow_html=True)
 
-        # Realistic processing time
-        processing_time = 2.5 + i * 0.7
-        time.sleep(processing_time)
-
-        # Show completion
-        agent_containers[i].markdown(f"""
-        <div class="agent-complete">
-            <strong>✅ {agent_info['name']}</strong><br>
-            CrewAI analysis complete<br>
-            <small><em>Processing time: {processing_time:.1f}s</em></small>
-        </div>
-        """, unsafe_allow_html=True)
-
-    progress_bar.progress(1.0)
-    status_text.markdown("**✅ CrewAI Analysis Complete!**")
+    stage_seconds = {}
 
     # Try to run real CrewAI agents
     try:
@@ -605,6 +869,8 @@ def run_crewai_milo_analysis(client_name: str, query: str):
             result = execute_enhanced_milo_analysis(client_name, query)
 
         st.success("✅ CrewAI analysis completed!")
+        if result:
+            stage_seconds = trace_stage_seconds(result.get("trace_id"))
 
         # Display agent output
         if result:
@@ -621,6 +887,26 @@ def run_crewai_milo_analysis(client_name: str, query: str):
         st.warning(f"⚠️ CrewAI execution error: {str(e)[:100]}...")
         st.info("📋 Using fallback mock results")
 
+    # Each agent reports the measured time of its pipeline stages
+    for i, agent_info in enumerate(agents_info):
+        progress_bar.progress((i + 1) / len(agents_info))
+        stages = [stage for stage in agent_info["stages"] if stage in stage_seconds]
+        if stages:
+            breakdown = ", ".join(f"{stage} {stage_seconds[stage] * 1000:.0f} ms" for stage in stages)
+            timing = f"Processing time: {sum(stage_seconds[stage] for stage in stages) * 1000:.0f} ms ({breakdown})"
+        else:
+            timing = "No stage timing recorded"
+        agent_containers[i].markdown(f"""
+        <div class="agent-complete">
+            <strong>✅ {agent_info['name']}</strong><br>
+            CrewAI analysis complete<br>
+            <small><em>{timing}</em></small>
+        </div>
+        """, unsafe_allow_html=True)
+
+    progress_bar.progress(1.0)
+    status_text.markdown("**✅ CrewAI Analysis Complete!**")
+
     # Always show results (either from CrewAI or fallback)
     st.info("📊 Displaying comprehensive analysis results...")
     agent_results = generate_comprehensive_mock_results(
@@ -0,0 +1,14 @@
+"""
+MILO Fund Universe - The funds MILO tracks and their asset classes
+Plain constants with no imports, shared by the portfolio analyzer and the
+ingest tagger (whose pool workers should not load the market data stack)
+"""
+
+ASSET_CLASSES = {
+    "VTSAX": "equity",
+    "VTIAX": "equity",
+    "VSGX": "equity",
+    "VBTLX": "fixed_income",
+    "VTABX": "fixed_income",
+    "VGSLX": "alternatives"
+}
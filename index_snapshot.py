@@ -0,0 +1,320 @@
+"""
+MILO Index Snapshots - Versioned on-disk copies of the prebuilt search structures
+Saves the communications inverted index, theme aggregates, date ordering and
+the query keyword automaton once, then loads them at startup instead of
+re-tokenizing every record. Integer arrays are .npy files opened with mmap;
+every file is checksummed in the manifest and verified on load.
+
+Snapshots live in <root>/v-<source version>/, where the source version hashes
+the records and the vocabularies the structures are built from, so a rebuild
+happens only when the data (or format) changes.
+
+Usage:
+    MILO_INDEX_SNAPSHOT_DIR=.index_snapshot streamlit run enhanced_streamlit_app.py
+    python index_snapshot.py .index_snapshot            # prebuild during deploy
+"""
+
+from collections import Counter
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Dict, List, Optional
+import bisect
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from communications_index import DEFAULT_CLIENT, FOCUS_THEMES, CommunicationsIndex
+from keyword_automaton import QUERY_CATEGORIES, KeywordAutomaton, QueryClassifier
+from milo_tracing import span
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+
+# Environment variable naming the snapshot root; unset disables snapshots
+INDEX_SNAPSHOT_ENV = "MILO_INDEX_SNAPSHOT_DIR"
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing, stale or fails its checksums"""
+
+
+def source_version(records: List[Dict], default_client: str = DEFAULT_CLIENT) -> str:
+    """Hash of everything the snapshot structures are derived from"""
+
+    payload = {
+        "format": SNAPSHOT_FORMAT_VERSION,
+        "records": records,
+        "default_client": default_client,
+        "focus_themes": FOCUS_THEMES,
+        "query_categories": QUERY_CATEGORIES
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CsrPostings(Mapping):
+    """token -> doc ids over a sorted vocabulary and memory-mapped CSR arrays
+
+    Tokens added after loading (CommunicationsIndex.add) go to an in-memory
+    overlay, so the mapped arrays are never written.
+    """
+
+    def __init__(self, vocab: List[str], ptr: np.ndarray, ids: np.ndarray):
+        self.vocab = vocab
+        self.ptr = ptr
+        self.ids = ids
+        self._overlay: Dict[str, List[int]] = {}
+
+    def _slot(self, token: str) -> Optional[int]:
+        i = bisect.bisect_left(self.vocab, token)
+        return i if i < len(self.vocab) and self.vocab[i] == token else None
+
+    def __getitem__(self, token: str) -> List[int]:
+        if token in self._overlay:
+            return self._overlay[token]
+        i = self._slot(token)
+        if i is None:
+            raise KeyError(token)
+        return self.ids[self.ptr[i]:self.ptr[i + 1]].tolist()
+
+    def __contains__(self, token) -> bool:
+        return token in self._overlay or self._slot(token) is not None
+
+    def __iter__(self):
+        yield from self.vocab
+        yield from (token for token in self._overlay if self._slot(token) is None)
+
+    def __len__(self) -> int:
+        return len(self.vocab) + sum(1 for token in self._overlay if self._slot(token) is None)
+
+    def setdefault(self, token: str, default: List[int]) -> List[int]:
+        if token not in self._overlay:
+            self._overlay[token] = self[token] if token in self else default
+        return self._overlay[token]
+
+
+class IndexSnapshot:
+    """Structures loaded from one snapshot version directory"""
+
+    def __init__(self, path: str, manifest: Dict, communications_index: CommunicationsIndex,
+                 automaton: KeywordAutomaton):
+        self.path = path
+        self.manifest = manifest
+        self.communications_index = communications_index
+        self.automaton = automaton
+
+    @property
+    def version(self) -> str:
+        return self.manifest["source_version"]
+
+    def query_classifier(self) -> QueryClassifier:
+        return QueryClassifier(automaton=self.automaton)
+
+
+def _version_dir(root: str, version: str) -> str:
+    return os.path.join(root, f"v-{version[:16]}")
+
+
+def write_snapshot(root: str, records: List[Dict], default_client: str = DEFAULT_CLIENT) -> str:
+    """Build every structure from records and write a new snapshot; returns its path"""
+
+    return write_index_snapshot(root, CommunicationsIndex(records, default_client))
+
+
+def write_index_snapshot(root: str, index: CommunicationsIndex, records: Optional[List[Dict]] = None) -> str:
+    """Snapshot an already-built index without re-tokenizing; returns its path
+
+    records (default index.records) are what records.json stores, e.g. the
+    index's records with bodies materialized from a content store.
+    """
+
+    records = index.records if records is None else records
+    default_client = index.default_client
+    version = source_version(records, default_client)
+    path = _version_dir(root, version)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    automaton = QueryClassifier().automaton
+
+    vocab = sorted(index.postings)
+    postings = [index.postings[token] for token in vocab]
+    arrays = {
+        "postings_ptr": np.concatenate([[0], np.cumsum([len(ids) for ids in postings])]).astype(np.int64),
+        "postings_ids": np.fromiter((doc_id for ids in postings for doc_id in ids), dtype=np.int32),
+        "by_date": np.asarray(index.by_date, dtype=np.int32),
+        **{f"automaton_{name}": array for name, array in automaton.to_arrays().items()}
+    }
+    documents = {
+        "records.json": records,
+        "structures.json": {
+            "clients": index.clients,
+            "search_vocab": index.search_vocab,
+            "postings_vocab": vocab,
+            "theme_counts": dict(index.theme_counts),
+            "by_client": index.by_client,
+            "focus_matches": {focus: sorted(ids) for focus, ids in index.focus_matches.items()},
+            "automaton_keywords": automaton.keywords
+        }
+    }
+
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + ".npy"), array)
+    for name, document in documents.items():
+        with open(os.path.join(tmp_path, name), "w") as f:
+            json.dump(document, f)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "source_version": version,
+        "default_client": default_client,
+        "built_at": datetime.now().isoformat(),
+        "counts": {"records": len(records), "tokens": len(vocab), "automaton_states": len(automaton)},
+        "files": {name: _file_checksum(os.path.join(tmp_path, name)) for name in sorted(os.listdir(tmp_path))}
+    }
+    # Manifest last: a directory without one is never loaded
+    with open(os.path.join(tmp_path, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_snapshot(path: str, expected_version: Optional[str] = None, verify: bool = True) -> IndexSnapshot:
+    """Load one snapshot directory; raises SnapshotError if it is unusable"""
+
+    try:
+        with open(os.path.join(path, MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"No readable snapshot manifest in {path}: {e}")
+
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format_version')} in {path}")
+    if expected_version is not None and manifest.get("source_version") != expected_version:
+        raise SnapshotError(f"Snapshot in {path} was built from different source data")
+
+    if verify:
+        for name, checksum in manifest["files"].items():
+            try:
+                actual = _file_checksum(os.path.join(path, name))
+            except OSError as e:
+                raise SnapshotError(f"Snapshot file {name} unreadable: {e}")
+            if actual != checksum:
+                raise SnapshotError(f"Snapshot file {name} failed its checksum")
+
+    def array(name: str) -> np.ndarray:
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+    with open(os.path.join(path, "records.json")) as f:
+        records = json.load(f)
+    with open(os.path.join(path, "structures.json")) as f:
+        structures = json.load(f)
+
+    index = CommunicationsIndex.from_structures(records, manifest["default_client"], {
+        "clients": structures["clients"],
+        "search_vocab": structures["search_vocab"],
+        "postings": CsrPostings(structures["postings_vocab"], array("postings_ptr"), array("postings_ids")),
+        "theme_counts": Counter(structures["theme_counts"]),
+        "by_client": structures["by_client"],
+        "by_date": array("by_date").tolist(),
+        "focus_matches": {focus: set(ids) for focus, ids in structures["focus_matches"].items()}
+    })
+    automaton = KeywordAutomaton.from_arrays(
+        structures["automaton_keywords"], array("automaton_edges"),
+        array("automaton_output_ptr"), array("automaton_output_ids"))
+
+    return IndexSnapshot(path, manifest, index, automaton)
+
+
+def load_or_build(root: str, records: List[Dict], default_client: str = DEFAULT_CLIENT) -> IndexSnapshot:
+    """Load the snapshot for these records, rebuilding (and pruning old versions) if needed"""
+
+    version = source_version(records, default_client)
+    path = _version_dir(root, version)
+
+    with span("index_snapshot_load") as load_span:
+        try:
+            snapshot = read_snapshot(path, expected_version=version)
+            load_span.set_label("cache", "hit")
+            return snapshot
+        except SnapshotError as e:
+            load_span.set_label("cache", "miss")
+            if os.path.exists(path):
+                print(f"⚠️ Rebuilding index snapshot: {e}")
+
+        os.makedirs(root, exist_ok=True)
+        write_snapshot(root, records, default_client)
+        prune_snapshots(root, keep=path)
+        return read_snapshot(path, expected_version=version, verify=False)
+
+
+def prune_snapshots(root: str, keep: str):
+    """Remove every version directory under root except keep"""
+
+    for name in os.listdir(root):
+        stale = os.path.join(root, name)
+        if name.startswith("v-") and stale != keep and not name.endswith(".tmp"):
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+_default_snapshot = None
+_default_snapshot_lock = threading.Lock()
+
+
+def get_default_snapshot(records: List[Dict]) -> Optional[IndexSnapshot]:
+    """Snapshot under MILO_INDEX_SNAPSHOT_DIR for records, once per process; None if unset"""
+
+    global _default_snapshot
+
+    root = os.environ.get(INDEX_SNAPSHOT_ENV)
+    if not root:
+        return None
+
+    with _default_snapshot_lock:
+        if _default_snapshot is None:
+            try:
+                _default_snapshot = load_or_build(root, records)
+                print(f"✅ Index snapshot {_default_snapshot.version[:12]} loaded from {_default_snapshot.path}")
+            except OSError as e:
+                print(f"❌ Index snapshot unavailable, building in memory: {e}")
+                return None
+    return _default_snapshot
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prebuild the MILO index snapshot")
+    parser.add_argument("root", help="Snapshot root directory")
+    parser.add_argument("--verify", action="store_true",
+                        help="Check the current snapshot instead of building one")
+    args = parser.parse_args()
+
+    from enhanced_milo_agents import ENHANCED_COMMUNICATIONS_DATA
+
+    if args.verify:
+        version = source_version(ENHANCED_COMMUNICATIONS_DATA)
+        try:
+            snapshot = read_snapshot(_version_dir(args.root, version), expected_version=version)
+        except SnapshotError as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
+        print(f"✅ Snapshot {snapshot.version[:12]} OK: {snapshot.manifest['counts']}")
+    else:
+        snapshot = load_or_build(args.root, ENHANCED_COMMUNICATIONS_DATA)
+        print(f"🚀 Snapshot {snapshot.version[:12]} ready in {snapshot.path}: {snapshot.manifest['counts']}")
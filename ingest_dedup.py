@@ -0,0 +1,241 @@
+"""
+MILO Ingest Dedup - Quoted-reply and signature stripping, threading and
+near-duplicate detection for incoming communications
+Email threads repeat the quoted history of every earlier message; indexing
+that text inflates scoring work and storage and double-counts keyword hits.
+Each new message keeps only its own text, is assigned to a thread, and is
+dropped when MinHash/LSH finds a near-identical message already indexed
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import re
+
+import numpy as np
+
+NUM_PERM = 128
+LSH_BANDS = 16
+SHINGLE_WORDS = 5
+
+# Estimated Jaccard similarity at or above which a message is a near-duplicate
+NEAR_DUPLICATE_THRESHOLD = 0.85
+
+# Mersenne prime for the universal hash family; with 32-bit shingle hashes
+# a * x + b stays below 2**63, so uint64 arithmetic never overflows
+_PRIME = (1 << 31) - 1
+
+# Start of quoted history: Gmail/Apple "On ... wrote:" (possibly wrapped onto a
+# second line), Outlook separators and forwarded-message banners
+_REPLY_HEADER = re.compile(
+    r"^[ \t]*(?:On\b[^\n]*(?:\n[^\n]*)?\bwrote:[ \t]*$"
+    r"|-{2,}[ \t]*(?:Original|Forwarded) Message[ \t]*-{2,}"
+    r"|_{10,}[ \t]*$"
+    r"|From:[^\n]*\n(?:[^\n]*\n)?(?:Sent|Date):)",
+    re.IGNORECASE | re.MULTILINE)
+_QUOTED_LINE = re.compile(r"^[ \t]*>[^\n]*\n?", re.MULTILINE)
+_SIGNATURE_DELIMITER = re.compile(r"^-- ?$", re.MULTILINE)
+_MOBILE_FOOTER = re.compile(r"^[ \t]*Sent from my [^\n]*$", re.IGNORECASE | re.MULTILINE)
+_VALEDICTION = re.compile(
+    r"^[ \t]*(?:best(?: regards| wishes)?|(?:kind |warm |warmest )?regards|thanks(?: again)?|thank you"
+    r"|sincerely|cheers|all the best|talk soon)[ \t]*[,.!]?[ \t]*$", re.IGNORECASE)
+# A sign-off is only cut when this few short lines (name, title, phone) follow it
+_MAX_SIGNATURE_LINES = 4
+_MAX_SIGNATURE_LINE_LENGTH = 60
+
+_SUBJECT_PREFIX = re.compile(r"^\s*(?:(?:re|fw|fwd|aw)\s*(?:\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+
+
+def strip_quoted_reply(text: str) -> str:
+    """The new part of a message: quoted history and '>' lines removed"""
+
+    match = _REPLY_HEADER.search(text)
+    if match:
+        text = text[:match.start()]
+    return _QUOTED_LINE.sub("", text)
+
+
+def strip_signature(text: str) -> str:
+    """Drop a '-- ' signature block, mobile footers and a trailing sign-off"""
+
+    match = _SIGNATURE_DELIMITER.search(text)
+    if match:
+        text = text[:match.start()]
+    text = _MOBILE_FOOTER.sub("", text)
+
+    lines = text.rstrip().split("\n")
+    for i in range(len(lines) - 1, max(len(lines) - 2 - _MAX_SIGNATURE_LINES, -1), -1):
+        if _VALEDICTION.match(lines[i]):
+            trailer = [line for line in lines[i + 1:] if line.strip()]
+            if all(len(line) <= _MAX_SIGNATURE_LINE_LENGTH for line in trailer):
+                lines = lines[:i]
+            break
+    return "\n".join(lines).strip()
+
+
+def clean_content(text: str) -> str:
+    return strip_signature(strip_quoted_reply(text or ""))
+
+
+def normalize_subject(subject: str) -> str:
+    """Subject with reply/forward prefixes removed, for thread matching"""
+
+    return " ".join(_SUBJECT_PREFIX.sub("", subject or "").lower().split())
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, vectorized with numpy"""
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle_words: int = SHINGLE_WORDS, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        if len(words) <= self.shingle_words:
+            return [" ".join(words)] if words else []
+        return [" ".join(words[i:i + self.shingle_words])
+                for i in range(len(words) - self.shingle_words + 1)]
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = set(self.shingles(text))
+        if not shingles:
+            return np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "little")
+             for shingle in shingles),
+            dtype=np.uint64, count=len(shingles))
+        # (num_perm x shingles) permuted hashes, min over shingles
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % np.uint64(_PRIME)
+        return permuted.min(axis=1)
+
+    @staticmethod
+    def similarity(left: np.ndarray, right: np.ndarray) -> float:
+        """Estimated Jaccard similarity of the two shingle sets"""
+
+        return float(np.mean(left == right))
+
+
+class LshIndex:
+    """Banded locality-sensitive hashing over MinHash signatures"""
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = LSH_BANDS):
+        if num_perm % bands:
+            raise ValueError(f"{num_perm} permutations do not split into {bands} bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self.signatures: Dict[int, np.ndarray] = {}
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: int, signature: np.ndarray):
+        self.signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+
+    def candidates(self, signature: np.ndarray) -> List[int]:
+        found = []
+        for band, band_key in self._band_keys(signature):
+            for key in self._buckets[band].get(band_key, ()):
+                if key not in found:
+                    found.append(key)
+        return found
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+
+class IngestDeduplicator:
+    """Cleans, threads and near-duplicate-checks records before indexing
+
+    prepare() is pure and can run outside any index lock; match() and add()
+    touch the shared LSH and thread state and should run under the caller's
+    ingest lock.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, num_perm: int = NUM_PERM,
+                 bands: int = LSH_BANDS):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.lsh = LshIndex(num_perm, bands)
+        self.threads: Dict[str, List[int]] = {}
+        self._subject_threads: Dict[str, str] = {}
+        self._message_threads: Dict[str, str] = {}
+        self.stats = {"cleaned_chars": 0, "duplicates": 0, "threads": 0}
+
+    def prepare(self, record: Dict) -> Tuple[Dict, np.ndarray]:
+        """Record with quoted history and signature removed, and its signature"""
+
+        original = record.get("full_content", "")
+        content = clean_content(original)
+        cleaned = {**record, "full_content": content}
+        if len(content) < len(original):
+            cleaned["stripped_chars"] = len(original) - len(content)
+        return cleaned, self.hasher.signature(f"{normalize_subject(record.get('subject', ''))}\n{content}")
+
+    def match(self, signature: np.ndarray) -> Optional[int]:
+        """Key of an indexed near-duplicate of this signature, if any"""
+
+        best_key, best_similarity = None, self.threshold
+        for key in self.lsh.candidates(signature):
+            similarity = MinHasher.similarity(signature, self.lsh.signatures[key])
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key
+
+    def assign_thread(self, record: Dict) -> str:
+        """Thread id from In-Reply-To when known, else client + normalized subject"""
+
+        subject_key = f"{record.get('client', '')}|{normalize_subject(record.get('subject', ''))}"
+        thread_id = (record.get("thread_id")
+                     or self._message_threads.get(record.get("in_reply_to") or "")
+                     or self._subject_threads.get(subject_key))
+        if thread_id is None:
+            thread_id = hashlib.sha1(subject_key.encode()).hexdigest()[:12]
+        self._subject_threads.setdefault(subject_key, thread_id)
+        if record.get("message_id"):
+            self._message_threads[record["message_id"]] = thread_id
+        return thread_id
+
+    def add(self, key: int, record: Dict, signature: np.ndarray):
+        """Register an indexed record under key (its doc id)"""
+
+        self.lsh.add(key, signature)
+        thread = self.threads.setdefault(record["thread_id"], [])
+        if not thread:
+            self.stats["threads"] += 1
+        thread.append(key)
+        self.stats["cleaned_chars"] += record.get("stripped_chars", 0)
+
+    def process(self, key: int, record: Dict) -> Tuple[Dict, Optional[int]]:
+        """prepare + thread + match + add in one step; (record, duplicate_of)"""
+
+        cleaned, signature = self.prepare(record)
+        cleaned["thread_id"] = self.assign_thread(cleaned)
+        duplicate_of = self.match(signature)
+        if duplicate_of is not None:
+            self.stats["duplicates"] += 1
+            return cleaned, duplicate_of
+        self.add(key, cleaned, signature)
+        return cleaned, None
+
+    def thread_members(self, thread_id: str) -> List[int]:
+        return list(self.threads.get(thread_id, []))
+
+
+def dedupe_records(records: Iterable[Dict]) -> Tuple[List[Dict], Dict]:
+    """Batch form for bulk loads: cleaned, threaded, near-duplicates dropped"""
+
+    deduplicator = IngestDeduplicator()
+    kept = []
+    for record in records:
+        cleaned, duplicate_of = deduplicator.process(len(kept), record)
+        if duplicate_of is None:
+            kept.append(cleaned)
+    return kept, deduplicator.stats
@@ -0,0 +1,276 @@
+"""
+MILO Ingest Tagging - Themes, entities, sentiment and urgency for raw communications
+Fills the fields analyze_communications relies on for mail that arrives
+without hand-written tags: themes from the existing theme vocabulary (one
+keyword-automaton pass per message), rule-based entities (tickers, family
+members, institutions), a lexicon sentiment model and urgency rules.
+Hand-written tags are never overwritten.
+
+Archives are tagged in batches across a process pool, after the same
+quoted-reply stripping and near-duplicate dropping as live ingest
+(ingest_dedup.dedupe_records; --no-dedup skips it):
+    python ingest_tagging.py archive.jsonl tagged.jsonl --workers 8
+    python ingest_tagging.py archive.jsonl --sqlite communications.db
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import functools
+import json
+import os
+import re
+
+from fund_universe import ASSET_CLASSES
+from keyword_automaton import KeywordAutomaton
+
+# Theme -> trigger groups; a theme fires when every group has a matching term
+# (terms are lowercase substrings, so "volatil" covers volatile/volatility)
+THEME_RULES: Dict[str, List[List[str]]] = {
+    "ESG_investing": [["esg", "sustainable invest", "socially responsible", "impact invest"]],
+    "values_alignment": [["values", "align with", "aligned with", "alignment"]],
+    "environmental_concerns": [["environmental", "carbon", "climate", "fossil fuel", "emissions"]],
+    "ESG_transition": [["esg", "vsgx", "sustainable"], ["switch", "transition", "moved to", "replace"]],
+    "ESG_performance": [["esg", "vsgx", "sustainable"], ["performance", "performed", "return", "outperform", "underperform"]],
+    "ESG_expansion": [["esg", "green bond", "sustainable"], ["expand", "more options", "additional", "increase"]],
+    "portfolio_performance": [["return", "performance", "performed", "outperform", "underperform"]],
+    "market_volatility": [["volatil", "market drop", "downturn", "sell-off", "selloff", "correction", "turbulen"]],
+    "risk_management": [["risk", "diversif", "hedg", "defensive"]],
+    "banking_sector_concerns": [["bank"], ["concern", "worr", "contagion", "failure", "crisis", "collapse"]],
+    "international_holdings": [["international", "vtiax", "vtabx", "emerging market"]],
+    "family_involvement": [["family", "linda", "wife", "husband", "daughter", "son "], ["involve", "join", "attend", "together"]],
+    "family_collaboration": [["family"], ["team", "collaborat", "together"]],
+    "family_milestone": [["graduat", "accepted", "wedding", "retire", "birth", "milestone"]],
+    "daughter_influence": [["daughter", "emma"], ["asks", "asking", "influence", "interest", "convinc", "keeps"]],
+    "Northwestern_acceptance": [["northwestern"], ["accept", "admit", "admission"]],
+    "Emma_first_meeting": [["emma"], ["first meeting", "first review", "joined the meeting", "joined us"]],
+    "college_planning": [["college", "university", "tuition", "529", "campus"]],
+    "college_funding": [["529", "tuition", "college"], ["fund", "contribut", "pay for", "savings"]],
+    "education_planning": [["education", "tuition", "529", "financial literacy"]],
+    "rebalancing_question": [["rebalanc"]],
+    "communication_preferences": [["check-in", "check in", "call", "update"], ["frequen", "monthly", "quarterly", "more often"]],
+    "media_influence": [["news", "headline", "cnbc", "article", "reading about"]],
+    "peer_influence": [["neighbor", "friend", "colleague", "brother-in-law"]]
+}
+
+FAMILY_MEMBERS = ["Robert", "Linda", "Emma"]
+INSTITUTIONS = ["Vanguard", "Northwestern", "Fidelity", "Schwab", "Federal Reserve", "Fed", "IRS"]
+PRODUCT_TERMS = ["529 plan", "green bonds", "ESG funds", "carbon footprint", "fossil fuels",
+                 "regional banks", "Roth IRA", "index fund"]
+
+# Fund tickers we hold plus anything shaped like a mutual fund ticker (VTSAX)
+_TICKER = re.compile(r"\b(?:%s|[A-Z]{4}X)\b" % "|".join(sorted(ASSET_CLASSES)))
+_FAMILY = re.compile(r"\b(?:%s)\b" % "|".join(FAMILY_MEMBERS))
+_INSTITUTION = re.compile(
+    r"\b(?:%s|University of [A-Z][a-z]+|[A-Z][a-z]+ (?:University|College|Bank))\b" % "|".join(INSTITUTIONS))
+_PRODUCT = re.compile(r"\b(?:%s)\b" % "|".join(re.escape(term) for term in PRODUCT_TERMS), re.IGNORECASE)
+
+# Lexicon sentiment: word stem -> valence; anxiety words are tracked separately
+# because "worried but reassured" is the common shape of a client call
+POSITIVE = {"pleased": 2, "happy": 2, "great": 2, "excellent": 3, "excited": 2, "thrilled": 3,
+            "thank": 1, "appreciat": 2, "glad": 2, "proud": 2, "celebrat": 2, "confident": 2,
+            "reassur": 2, "comfortable": 1, "impressed": 2, "love": 2, "exceeded": 2, "strong": 1}
+NEGATIVE = {"disappoint": -2, "frustrat": -3, "unhappy": -2, "upset": -2, "angry": -3, "loss": -1,
+            "losing": -2, "poor": -1, "terrible": -3, "mistake": -2, "unacceptable": -3, "problem": -1}
+ANXIETY = {"worr": -2, "concern": -1, "anxious": -2, "nervous": -2, "scared": -3, "afraid": -2,
+           "panic": -3, "uncertain": -1, "fear": -2, "stress": -2}
+NEGATIONS = {"not", "no", "never", "don't", "didn't", "isn't", "wasn't", "aren't", "without", "less"}
+INTENSIFIERS = {"very": 1.5, "really": 1.5, "extremely": 2.0, "so": 1.3, "quite": 1.2, "too": 1.3}
+
+# Anxiety per 100 words at which a message reads as anxious / needs a fast reply
+ANXIOUS_LEVEL = -2.0
+URGENT_ANXIETY_LEVEL = -5.0
+
+URGENT_MARKERS = ("urgent", "asap", "as soon as possible", "immediately", "right away",
+                  "time-sensitive", "deadline", "end of day")
+REQUEST_MARKERS = ("could you", "can you", "would you", "please", "i'd like", "i would like",
+                   "let me know", "should we")
+
+_WORDS = re.compile(r"[a-z']+")
+_theme_terms = sorted({term for groups in THEME_RULES.values() for group in groups for term in group})
+_THEME_AUTOMATON = KeywordAutomaton(_theme_terms)
+_THEME_GROUPS = [
+    (theme, [frozenset(_theme_terms.index(term) for term in group) for group in groups])
+    for theme, groups in THEME_RULES.items()
+]
+
+
+def tag_themes(text: str) -> List[str]:
+    matched = _THEME_AUTOMATON.matches(text.lower())
+    return [theme for theme, groups in _THEME_GROUPS if all(matched & group for group in groups)]
+
+
+def tag_entities(text: str) -> List[str]:
+    """Tickers, family members, institutions and products, in first-seen order"""
+
+    found: Dict[str, int] = {}
+    for pattern in (_FAMILY, _INSTITUTION, _TICKER, _PRODUCT):
+        for match in pattern.finditer(text):
+            found.setdefault(match.group(0), match.start())
+    return sorted(found, key=found.get)
+
+
+def _valence(word: str, lexicon: Dict[str, int]) -> int:
+    for stem, value in lexicon.items():
+        if word.startswith(stem):
+            return value
+    return 0
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _word_scores(word: str) -> Tuple[int, int]:
+    """(valence, anxiety) of one word; memoized, as mail vocabulary repeats heavily"""
+
+    return _valence(word, POSITIVE) or _valence(word, NEGATIVE), _valence(word, ANXIETY)
+
+
+def score_sentiment(text: str) -> Tuple[float, float]:
+    """(valence, anxiety) per 100 words; negation flips, intensifiers scale"""
+
+    words = _WORDS.findall(text.lower())
+    valence = anxiety = 0.0
+    for i, word in enumerate(words):
+        value, worry = _word_scores(word)
+        if not value and not worry:
+            continue
+        window = words[max(0, i - 3):i]
+        factor = -1.0 if any(prior in NEGATIONS for prior in window) else 1.0
+        if window:
+            factor *= INTENSIFIERS.get(window[-1], 1.0)
+        if value:
+            valence += value * factor
+        if worry:
+            # "not worried" is mild reassurance, not anxiety
+            if factor < 0:
+                valence += -worry * 0.5
+            else:
+                anxiety += worry * factor
+    scale = 100.0 / max(len(words), 20)
+    return round(valence * scale, 2), round(anxiety * scale, 2)
+
+
+def sentiment_label(valence: float, anxiety: float) -> str:
+    if anxiety <= ANXIOUS_LEVEL:
+        return "anxious_but_reassured" if valence >= 1 else "anxious"
+    if anxiety < 0 and valence >= 1:
+        return "positive_with_concerns"
+    if valence >= 1:
+        return "positive"
+    if valence <= -1:
+        return "negative"
+    return "concerned" if anxiety < 0 else "neutral"
+
+
+def classify_sentiment(text: str) -> str:
+    return sentiment_label(*score_sentiment(text))
+
+
+def classify_urgency(text: str, anxiety: float) -> str:
+    """high for explicit deadlines or strong anxiety, medium for questions and requests"""
+
+    lowered = text.lower()
+    if any(marker in lowered for marker in URGENT_MARKERS) or anxiety <= URGENT_ANXIETY_LEVEL:
+        return "high"
+    if "?" in text or any(marker in lowered for marker in REQUEST_MARKERS) or anxiety <= ANXIOUS_LEVEL:
+        return "medium"
+    return "low"
+
+
+def tag_record(record: Dict) -> Dict:
+    """Copy of record with missing themes, entities, sentiment and urgency filled in"""
+
+    text = f"{record.get('subject', '')}\n{record.get('full_content', '')}"
+    tagged = dict(record)
+    if not tagged.get("key_themes"):
+        tagged["key_themes"] = tag_themes(text)
+    if not tagged.get("entities"):
+        tagged["entities"] = tag_entities(text)
+    if not tagged.get("sentiment") or not tagged.get("urgency"):
+        valence, anxiety = score_sentiment(text)
+        tagged["sentiment"] = tagged.get("sentiment") or sentiment_label(valence, anxiety)
+        tagged["urgency"] = tagged.get("urgency") or classify_urgency(text, anxiety)
+    return tagged
+
+
+def tag_batch(records: List[Dict]) -> List[Dict]:
+    return [tag_record(record) for record in records]
+
+
+def _batches(records: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def tag_records(records: Iterable[Dict], workers: Optional[int] = None,
+                batch_size: int = 500) -> Iterator[Dict]:
+    """Tag records in input order across a process pool, streaming
+
+    At most two batches per worker are in flight, so an archive larger than
+    memory streams through without being loaded whole.
+    """
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for batch in _batches(records, batch_size):
+            yield from tag_batch(batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in _batches(records, batch_size):
+            pending.append(pool.submit(tag_batch, batch))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _read_jsonl(path: str) -> Iterator[Dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Tag a JSONL archive of communications")
+    parser.add_argument("archive", help="JSONL file, one communication per line")
+    parser.add_argument("output", nargs="?", help="Tagged JSONL output")
+    parser.add_argument("--sqlite", help="Append tagged records to this communications database")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Keep quoted replies and near-duplicate messages")
+    args = parser.parse_args()
+
+    if not args.output and not args.sqlite:
+        parser.error("give an output file or --sqlite")
+
+    started = time.perf_counter()
+    records = _read_jsonl(args.archive)
+    if not args.no_dedup:
+        from ingest_dedup import dedupe_records
+        records, dedup_stats = dedupe_records(records)
+        print(f"📋 Dropped {dedup_stats['duplicates']} near-duplicates, "
+              f"{dedup_stats['threads']} threads")
+    tagged = tag_records(records, args.workers, args.batch_size)
+    if args.sqlite:
+        from communications_sqlite import open_store
+        count = open_store(args.sqlite).add_records(tagged)
+    else:
+        count = 0
+        with open(args.output, "w") as out:
+            for record in tagged:
+                out.write(json.dumps(record) + "\n")
+                count += 1
+    elapsed = time.perf_counter() - started
+    print(f"✅ Tagged {count} communications in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f}/s)")
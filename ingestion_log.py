@@ -0,0 +1,519 @@
+"""
+MILO Ingestion Log - Append-only write-ahead log for new communications
+New emails and call notes are appended to a JSONL log and are searchable as
+soon as append returns, through a small delta index in front of the main one.
+A background compactor folds the delta into the main index (and the SQLite
+store / Parquet dataset when configured) and truncates the log behind it, so
+ingest stays cheap and query cost stays flat as the corpus grows. Without
+SQLite, compacted records are kept in <log>.compacted, which is periodically
+folded into an index snapshot under <log>.snapshot; startup loads the
+snapshot and replays only the archive written since.
+
+Enable with MILO_INGEST_LOG=<path>; MILO_COMMS_PARQUET=<dir> adds a columnar
+copy of every compacted batch. Incoming messages pass through ingest_dedup
+and ingest_tagging first (MILO_INGEST_DEDUP=0 / MILO_INGEST_TAGGING=0 turn
+those off).
+"""
+
+from collections import Counter
+from datetime import date
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+
+from communications_index import DEFAULT_CLIENT, CommunicationsIndex
+from communications_sqlite import fts_columns
+from index_snapshot import prune_snapshots, read_snapshot, source_version, write_index_snapshot
+from ingest_dedup import IngestDeduplicator
+from ingest_tagging import tag_record
+from milo_tracing import span
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+INGEST_LOG_ENV = "MILO_INGEST_LOG"
+COMMS_PARQUET_ENV = "MILO_COMMS_PARQUET"
+# Quoted-reply/signature stripping and near-duplicate dropping (on unless "0")
+INGEST_DEDUP_ENV = "MILO_INGEST_DEDUP"
+# Automatic themes/entities/sentiment/urgency for untagged mail (on unless "0")
+INGEST_TAGGING_ENV = "MILO_INGEST_TAGGING"
+
+# Compact once the delta holds this many records, or every interval otherwise
+COMPACT_THRESHOLD = 256
+COMPACT_INTERVAL_SECONDS = 30.0
+# Snapshot the in-memory main index once the archive holds this many records
+ARCHIVE_ROTATE_RECORDS = 4096
+
+RECORD_TYPES = ("email", "phone_call", "meeting", "note")
+PARQUET_COLUMNS = ("seq", "client", "date", "type", "urgency", "sentiment", "subject",
+                   "full_content", "key_themes", "entities", "client_requests", "thread_id")
+
+
+def normalize_record(record: Dict, default_client: str = DEFAULT_CLIENT) -> Dict:
+    """Validate an incoming communication and fill the fields the indexes expect"""
+
+    if not isinstance(record, dict):
+        raise ValueError("A communication must be a JSON object")
+    if not record.get("subject") and not record.get("full_content"):
+        raise ValueError("A communication needs a 'subject' or 'full_content'")
+
+    record_date = record.get("date") or date.today().isoformat()
+    try:
+        date.fromisoformat(record_date)
+    except (TypeError, ValueError):
+        raise ValueError(f"'date' must be an ISO date (YYYY-MM-DD), got {record_date!r}")
+
+    record_type = record.get("type", "email")
+    if record_type not in RECORD_TYPES:
+        raise ValueError(f"Unknown communication type {record_type!r} (expected one of {', '.join(RECORD_TYPES)})")
+
+    return {
+        **record,
+        "client": record.get("client") or default_client,
+        "date": record_date,
+        "type": record_type,
+        "subject": record.get("subject", ""),
+        "full_content": record.get("full_content", ""),
+        "key_themes": list(record.get("key_themes", [])),
+        "entities": list(record.get("entities", [])),
+        "client_requests": list(record.get("client_requests", []))
+    }
+
+
+class IngestionLog:
+    """JSONL log of {"seq", "record"} entries, fsynced per append
+
+    Single writer per log: sequence numbers are allocated in-process. The
+    checkpoint file records the last sequence folded into a durable store;
+    entries up to it are dropped when the log is truncated.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self.last_seq = max([self.checkpoint()] + [seq for seq, _ in self.entries()])
+
+    def append(self, record: Dict) -> int:
+        with self._lock:
+            seq = self.last_seq + 1
+            self._write([(seq, record)])
+            self.last_seq = seq
+        return seq
+
+    def append_entries(self, entries: List[Tuple[int, Dict]]):
+        """Append entries that already carry sequence numbers (compacted batches)"""
+
+        if not entries:
+            return
+        with self._lock:
+            self._write(entries)
+            self.last_seq = max(self.last_seq, entries[-1][0])
+
+    def _write(self, entries: List[Tuple[int, Dict]]):
+        with open(self.path, "a") as f:
+            f.write("".join(_entry_line(seq, record) for seq, record in entries))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def entries(self, after_seq: int = 0) -> Iterator[Tuple[int, Dict]]:
+        """(seq, record) pairs after after_seq; a torn final line is skipped"""
+
+        try:
+            f = open(self.path)
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry["seq"] > after_seq:
+                    yield entry["seq"], entry["record"]
+
+    def checkpoint(self) -> int:
+        try:
+            with open(self.checkpoint_path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def truncate_through(self, seq: int):
+        """Record seq as durable elsewhere and drop the entries up to it"""
+
+        with self._lock:
+            remaining = list(self.entries(after_seq=seq))
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write("".join(_entry_line(entry_seq, record) for entry_seq, record in remaining))
+            # Checkpoint first: a crash in between only leaves entries that are
+            # skipped on replay, never a gap
+            _write_atomic(self.checkpoint_path, str(seq))
+            os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.entries())
+
+
+def _entry_line(seq: int, record: Dict) -> str:
+    return json.dumps({"seq": seq, "record": record}, default=str) + "\n"
+
+
+def _plain_records(index: CommunicationsIndex) -> List[Dict]:
+    """index.records with bodies decompressed from its content store"""
+
+    return [record.materialize() if hasattr(record, "materialize") else record for record in index.records]
+
+
+def _write_atomic(path: str, text: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_parquet_part(path: str, rows: List[Tuple[int, Dict]]) -> Optional[str]:
+    """Write compacted (seq, record) rows as one part file of a Parquet dataset"""
+
+    if not PYARROW_AVAILABLE or not rows:
+        return None
+    os.makedirs(path, exist_ok=True)
+    table = pa.Table.from_pylist([
+        {column: seq if column == "seq" else record.get(column) for column in PARQUET_COLUMNS}
+        for seq, record in rows
+    ])
+    name = f"part-{rows[0][0]:010d}-{rows[-1][0]:010d}.parquet"
+    tmp_path = os.path.join(path, name + ".tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, os.path.join(path, name))
+    return name
+
+
+class _LiveRecordView:
+    def __init__(self, live: "LiveCommunicationsIndex"):
+        self._live = live
+
+    def __getitem__(self, doc_id: int) -> Dict:
+        return self._live.get(doc_id)
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+
+class LiveCommunicationsIndex:
+    """Main index plus a delta of logged-but-not-compacted records
+
+    Delta records take the doc ids the main index will give them on
+    compaction (main.next_doc_id() onward), so ids stay stable across a merge.
+    The main index is either an in-memory CommunicationsIndex (the delta is
+    merged into it in place and the batch appended to the <log>.compacted
+    archive) or a SqliteCommunicationsStore (appended to; delta records are
+    scored with the store's bm25 so a record's relevance does not change when
+    it is compacted). Either way the log is truncated behind the batch. A
+    crash between the store commit and the checkpoint replays that batch once
+    more on restart; the archive's sequence numbers prevent that for memory.
+
+    Every ARCHIVE_ROTATE_RECORDS archived records, the memory main index is
+    written as a snapshot (<log>.snapshot, recorded in <log>.compacted.json
+    with the archive seq it covers) and the archive is truncated, so startup
+    loads the snapshot and replays only the archive tail. The snapshot is
+    only used over the same seed records it was built on.
+    """
+
+    def __init__(self, main, log: IngestionLog, parquet_path: Optional[str] = None,
+                 threshold: int = COMPACT_THRESHOLD, interval: float = COMPACT_INTERVAL_SECONDS,
+                 deduplicator: Optional[IngestDeduplicator] = None,
+                 tagger: Optional[Callable[[Dict], Dict]] = None):
+        self.main = main
+        self.deduplicator = deduplicator
+        self.tagger = tagger
+        self._dedup_primed = False
+        self.log = log
+        self.parquet_path = parquet_path
+        self.threshold = threshold
+        self.interval = interval
+        self.durable = hasattr(main, "add_records")
+        self.archive = None if self.durable else IngestionLog(log.path + ".compacted", fsync=log.fsync)
+        self.snapshot_root = log.path + ".snapshot"
+        self.rotation_path = log.path + ".compacted.json"
+        self.rotate_records = ARCHIVE_ROTATE_RECORDS
+        self.records = _LiveRecordView(self)
+        self.stats = {"ingested": 0, "duplicates": 0, "compactions": 0, "compacted": 0, "last_compaction_seconds": 0.0}
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # The main store (or archive) already holds everything up to the checkpoint
+        replay_after = log.checkpoint()
+        self._archived = 0
+        if self.archive is not None:
+            self.base_version = source_version(_plain_records(main), main.default_client)
+            for _, record in self.archive.entries(after_seq=self._load_rotation()):
+                self.main.add(record)
+                self._archived += 1
+            replay_after = max(replay_after, self.archive.last_seq)
+
+        self._reset_delta()
+        for seq, record in log.entries(after_seq=replay_after):
+            self._add_to_delta(seq, record)
+
+    def _load_rotation(self) -> int:
+        """Swap in the last archive snapshot, if any; returns the archive seq it covers"""
+
+        try:
+            with open(self.rotation_path) as f:
+                rotation = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if rotation.get("base_version") != self.base_version:
+            print("⚠️ Ignoring the compacted-records snapshot: it was built over different seed records")
+            return 0
+
+        # The archive before rotation["seq"] is gone, so an unusable snapshot is fatal
+        snapshot = read_snapshot(os.path.join(self.snapshot_root, rotation["path"]))
+        content_store = self.main.content_store
+        self.main = snapshot.communications_index
+        if content_store is not None:
+            self.main.attach_content_store(content_store)
+        return rotation["seq"]
+
+    def _rotate_archive(self):
+        """Snapshot the main index, then drop the archive it covers
+
+        Runs under the compact lock, the only writer of the main index, so
+        ingest and queries carry on while the snapshot is written.
+        """
+
+        seq = self.archive.last_seq
+        with span("ingest_archive_rotation"):
+            path = write_index_snapshot(self.snapshot_root, self.main, _plain_records(self.main))
+            _write_atomic(self.rotation_path, json.dumps({
+                "path": os.path.basename(path), "seq": seq, "base_version": self.base_version}))
+            self.archive.truncate_through(seq)
+            prune_snapshots(self.snapshot_root, keep=path)
+        self._archived = 0
+
+    def _reset_delta(self, pending: Optional[List[Tuple[int, Dict]]] = None):
+        self.offset = self.main.next_doc_id()
+        self.delta = CommunicationsIndex([])
+        self.delta_seqs: List[int] = []
+        # FTS tokens per delta record, for bm25 against the SQLite store
+        self.delta_columns: List[Tuple[List[str], List[str]]] = []
+        for seq, record in pending or []:
+            self._add_to_delta(seq, record)
+
+    def _pending_after(self, merged: int) -> List[Tuple[int, Dict]]:
+        """Delta entries ingested while a compaction batch was being merged"""
+
+        return list(zip(self.delta_seqs, self.delta.records))[merged:]
+
+    def _add_to_delta(self, seq: int, record: Dict) -> int:
+        self.delta_seqs.append(seq)
+        if self.durable:
+            self.delta_columns.append(fts_columns(record))
+        return self.offset + self.delta.add(record)
+
+    # ------------------------------------------------------------------ ingest
+
+    def ingest(self, record: Dict) -> Dict:
+        """Log a communication and make it searchable
+
+        Returns its doc id and thread; a near-duplicate of an indexed message is
+        not logged and returns that message's doc id with duplicate=True.
+        """
+
+        record = normalize_record(record, self.delta.default_client)
+        signature = None
+        if self.deduplicator is not None:
+            # Stripping and MinHash are the expensive part; done before locking
+            record, signature = self.deduplicator.prepare(record)
+        if self.tagger is not None:
+            # Tagged after stripping, so quoted history does not add themes
+            record = self.tagger(record)
+
+        with self._lock:
+            if self.deduplicator is not None:
+                self._prime_deduplicator()
+                record["thread_id"] = self.deduplicator.assign_thread(record)
+                duplicate_of = self.deduplicator.match(signature)
+                if duplicate_of is not None:
+                    self.stats["duplicates"] += 1
+                    return {"doc_id": duplicate_of, "thread_id": record["thread_id"], "duplicate": True}
+
+            seq = self.log.append(record)
+            doc_id = self._add_to_delta(seq, record)
+            if self.deduplicator is not None:
+                self.deduplicator.add(doc_id, record, signature)
+            self.stats["ingested"] += 1
+            if len(self.delta) >= self.threshold:
+                self._wake.set()
+        return {"doc_id": doc_id, "thread_id": record.get("thread_id"), "duplicate": False}
+
+    def _prime_deduplicator(self):
+        """Register already-indexed records on first ingest (one pass over the corpus)"""
+
+        if self._dedup_primed:
+            return
+        for doc_id in self.candidates():
+            existing = self.get(doc_id)
+            cleaned, signature = self.deduplicator.prepare(existing)
+            cleaned["thread_id"] = self.deduplicator.assign_thread(cleaned)
+            self.deduplicator.add(doc_id, cleaned, signature)
+        self._dedup_primed = True
+
+    def compact(self) -> int:
+        """Fold the current delta into the main index; returns records merged"""
+
+        with self._compact_lock:
+            with self._lock:
+                batch = list(zip(self.delta_seqs, self.delta.records))
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            with span("ingest_compaction"):
+                if self.archive is not None:
+                    # Persisted before the log is truncated below
+                    self.archive.append_entries(batch)
+
+                # Merged under the lock so no reader sees a record in both the
+                # main index and the delta; the in-memory merge reuses the
+                # delta's tokens, so it costs O(batch), not O(corpus)
+                with self._lock:
+                    if self.durable:
+                        self.main.add_records([record for _, record in batch])
+                    else:
+                        self.main.merge(self.delta, len(batch))
+                    self._reset_delta(self._pending_after(len(batch)))
+
+                if self.parquet_path:
+                    write_parquet_part(self.parquet_path, batch)
+                self.log.truncate_through(batch[-1][0])
+
+                if self.archive is not None:
+                    self._archived += len(batch)
+                    if self._archived >= self.rotate_records:
+                        self._rotate_archive()
+
+            self.stats["compactions"] += 1
+            self.stats["compacted"] += len(batch)
+            self.stats["last_compaction_seconds"] = round(time.perf_counter() - started, 4)
+            return len(batch)
+
+    def start_compactor(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._compact_loop, name="milo-ingest-compactor", daemon=True)
+        self._thread.start()
+
+    def stop_compactor(self, flush: bool = True):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.compact()
+
+    def _compact_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.compact()
+            except Exception as e:
+                # The delta and log are untouched; the next pass retries
+                print(f"⚠️ Ingestion compaction failed: {e}")
+
+    # ------------------------------------------------------------------ lookups
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.main) + len(self.delta)
+
+    def get(self, doc_id: int) -> Dict:
+        with self._lock:
+            if doc_id >= self.offset:
+                return self.delta.records[doc_id - self.offset]
+            return self.main.records[doc_id]
+
+    def candidates(self, client: Optional[str] = None, start_date: Optional[str] = None,
+                   end_date: Optional[str] = None) -> List[int]:
+        with self._lock:
+            return (self.main.candidates(client, start_date, end_date) +
+                    [self.offset + doc_id for doc_id in self.delta.candidates(client, start_date, end_date)])
+
+    def score(self, query: str, focus: str, doc_ids: Optional[List[int]] = None,
+              limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Both indexes' scores merged, best first; ties favour the main index"""
+
+        with self._lock:
+            if doc_ids is None:
+                main_ids = delta_ids = None
+            else:
+                main_ids = [doc_id for doc_id in doc_ids if doc_id < self.offset]
+                delta_ids = [doc_id - self.offset for doc_id in doc_ids if doc_id >= self.offset]
+            scored = self.main.score(query, focus, main_ids, limit=limit)
+            if self.durable:
+                # Scored over every delta record: they all feed bm25's corpus statistics
+                relevances = self.main.score_records(query, focus, self.delta.records, self.delta_columns)
+                delta_ids = range(len(relevances)) if delta_ids is None else delta_ids
+                scored += [(self.offset + doc_id, relevances[doc_id]) for doc_id in delta_ids]
+            else:
+                scored += [(self.offset + doc_id, relevance)
+                           for doc_id, relevance in self.delta.score(query, focus, delta_ids, limit=limit)]
+
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return scored if limit is None else scored[:limit]
+
+    def client_names(self) -> List[str]:
+        with self._lock:
+            return sorted(set(self.main.client_names()) | set(self.delta.client_names()))
+
+    def latest_date(self) -> Optional[str]:
+        with self._lock:
+            return max(filter(None, (self.main.latest_date(), self.delta.latest_date())), default=None)
+
+    @property
+    def theme_counts(self) -> Counter:
+        with self._lock:
+            return self.main.theme_counts + self.delta.theme_counts
+
+    def most_frequent_themes(self, limit: int = 4) -> List[Tuple[str, int]]:
+        return self.theme_counts.most_common(limit)
+
+
+def wrap_with_ingestion_log(main, log_path: Optional[str] = None,
+                            parquet_path: Optional[str] = None) -> LiveCommunicationsIndex:
+    """Live index over main, logging to log_path (default MILO_INGEST_LOG), compactor running"""
+
+    live = LiveCommunicationsIndex(
+        main, IngestionLog(log_path or os.environ[INGEST_LOG_ENV]),
+        parquet_path=parquet_path or os.environ.get(COMMS_PARQUET_ENV),
+        deduplicator=IngestDeduplicator() if _env_flag(INGEST_DEDUP_ENV) else None,
+        tagger=tag_record if _env_flag(INGEST_TAGGING_ENV) else None)
+    live.start_compactor()
+    return live
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "1").lower() not in ("0", "false", "off")
+
+
+def ingestion_log_enabled() -> bool:
+    return bool(os.environ.get(INGEST_LOG_ENV))
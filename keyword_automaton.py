@@ -0,0 +1,130 @@
+"""
+MILO Keyword Automaton - Aho-Corasick matching for query classification
+Finds every category keyword occurring in a query, overlaps included, in one
+pass over the text instead of one substring scan per keyword
+"""
+
+from collections import deque
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+# Query focus categories and the keywords that vote for them (substring match)
+QUERY_CATEGORIES = {
+    "esg_sustainability": ["esg", "sustainable", "sustainability", "environmental", "social", "governance", "values", "impact", "green", "ethical"],
+    "performance": ["performance", "returns", "return", "gains", "losses", "profit", "growth", "yield", "benchmark"],
+    "family_personal": ["family", "daughter", "emma", "linda", "college", "northwestern", "personal", "education", "life"],
+    "risk_volatility": ["risk", "volatility", "volatile", "concerned", "worry", "anxious", "safe", "conservative", "aggressive"],
+    "communication": ["communication", "contact", "meeting", "email", "call", "frequency", "updates"],
+    "market_economy": ["market", "fed", "rates", "economy", "economic", "inflation", "election", "policy"],
+    "bonds_fixed_income": ["bond", "bonds", "fixed income", "duration", "vbtlx", "vtabx", "interest rate"],
+    "equity_stocks": ["equity", "stock", "stocks", "vtsax", "vtiax", "vsgx", "allocation"],
+    "planning": ["planning", "strategy", "goals", "future", "timeline", "prepare", "preparation"]
+}
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton compiled to a DFA
+
+    Fail links are folded into each state's transitions, so matching is a
+    single dict lookup per character; states absent from a transition map go
+    back to the root.
+    """
+
+    def __init__(self, keywords: List[str]):
+        self.keywords = list(keywords)
+
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[set] = [set()]
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append(set())
+                state = goto[state][char]
+            outputs[state].add(keyword_id)
+
+        # Breadth-first, so a state's fail target is complete before the state
+        fail = [0] * len(goto)
+        self.transitions: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            outputs[state] |= outputs[fail[state]]
+            transitions = dict(self.transitions[fail[state]])
+            for char, target in goto[state].items():
+                fail[target] = self.transitions[fail[state]].get(char, 0)
+                transitions[char] = target
+                pending.append(target)
+            self.transitions[state] = transitions
+
+        self.outputs: List[FrozenSet[int]] = [frozenset(ids) for ids in outputs]
+
+    def __len__(self) -> int:
+        return len(self.transitions)
+
+    def matches(self, text: str) -> FrozenSet[int]:
+        """Ids of the keywords occurring anywhere in text"""
+
+        transitions, outputs = self.transitions, self.outputs
+        found = set()
+        state = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return frozenset(found)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Flat int32 edge and output tables, for index snapshots"""
+
+        edges = [(state, ord(char), target)
+                 for state, transitions in enumerate(self.transitions)
+                 for char, target in transitions.items()]
+        output_ptr = np.zeros(len(self.outputs) + 1, dtype=np.int32)
+        output_ptr[1:] = np.cumsum([len(ids) for ids in self.outputs])
+        return {
+            "edges": np.array(edges, dtype=np.int32).reshape(-1, 3),
+            "output_ptr": output_ptr,
+            "output_ids": np.array([i for ids in self.outputs for i in sorted(ids)], dtype=np.int32)
+        }
+
+    @classmethod
+    def from_arrays(cls, keywords: List[str], edges: np.ndarray, output_ptr: np.ndarray,
+                    output_ids: np.ndarray) -> "KeywordAutomaton":
+        automaton = cls.__new__(cls)
+        automaton.keywords = list(keywords)
+        automaton.transitions = [{} for _ in range(len(output_ptr) - 1)]
+        for state, codepoint, target in edges.tolist():
+            automaton.transitions[state][chr(codepoint)] = target
+        ptr, ids = output_ptr.tolist(), output_ids.tolist()
+        automaton.outputs = [frozenset(ids[ptr[i]:ptr[i + 1]]) for i in range(len(ptr) - 1)]
+        return automaton
+
+
+class QueryClassifier:
+    """Per-category keyword counts for a query, from one automaton pass"""
+
+    def __init__(self, categories: Dict[str, List[str]] = QUERY_CATEGORIES,
+                 automaton: Optional[KeywordAutomaton] = None):
+        self.categories = categories
+        keywords = sorted({keyword for words in categories.values() for keyword in words})
+        self.automaton = automaton or KeywordAutomaton(keywords)
+        keyword_ids = {keyword: i for i, keyword in enumerate(self.automaton.keywords)}
+        self.category_keywords: List[Tuple[str, FrozenSet[int]]] = [
+            (category, frozenset(keyword_ids[keyword] for keyword in words))
+            for category, words in categories.items()
+        ]
+
+    def category_scores(self, query_lower: str) -> Dict[str, int]:
+        """Matching keywords per category, in category order, zero scores omitted"""
+
+        matched = self.automaton.matches(query_lower)
+        scores = {}
+        for category, keyword_ids in self.category_keywords:
+            score = len(matched & keyword_ids)
+            if score > 0:
+                scores[category] = score
+        return scores
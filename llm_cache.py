@@ -0,0 +1,248 @@
+"""
+MILO LLM Response Cache - Content-addressed on-disk cache of crew LLM calls
+Entries are keyed by model, sampling parameters, the full message list (which
+carries tool outputs back to the model) and tool schemas, so repeat reviews of
+unchanged data skip the provider entirely
+
+Modes (MILO_LLM_CACHE_MODE):
+    readwrite   serve hits, call the provider on misses and store them (default)
+    replay      serve hits only; a miss raises LLMCacheMiss (offline crew runs)
+    record      always call the provider and overwrite the stored response
+    off         bypass the cache
+"""
+
+from typing import Callable, Dict, List, Optional
+import hashlib
+import json
+import os
+import threading
+import time
+
+from milo_tracing import record_cache
+
+try:
+    from crewai import LLM
+    CREWAI_LLM_AVAILABLE = True
+except ImportError:
+    CREWAI_LLM_AVAILABLE = False
+
+LLM_CACHE_MODE_ENV = "MILO_LLM_CACHE_MODE"
+LLM_CACHE_DIR_ENV = "MILO_LLM_CACHE_DIR"
+LLM_CACHE_TTL_ENV = "MILO_LLM_CACHE_TTL"
+LLM_CACHE_MAX_MB_ENV = "MILO_LLM_CACHE_MAX_MB"
+
+CACHE_MODES = ("readwrite", "replay", "record", "off")
+DEFAULT_CACHE_DIR = ".llm_cache"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_MB = 256
+CACHE_KEY_VERSION = 1
+
+# Evict down to this fraction of max_bytes so every put doesn't rescan
+EVICT_TARGET = 0.9
+
+
+class LLMCacheMiss(Exception):
+    """Raised in replay mode when a call has no stored response"""
+
+
+def cache_key(model: str, messages, tools: Optional[List] = None, params: Optional[Dict] = None) -> str:
+    """sha256 over a canonical JSON encoding of everything that shapes the response"""
+
+    payload = {
+        "v": CACHE_KEY_VERSION,
+        "model": model,
+        "messages": messages,
+        "tools": tools or [],
+        "params": {name: value for name, value in (params or {}).items() if value is not None}
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class LLMResponseCache:
+    """One JSON file per response under root/<key[:2]>/<key>.json
+
+    Hits refresh the file's mtime, so size-bounded eviction drops the least
+    recently used entries first. Writes go through a temp file and os.replace,
+    so concurrent sessions and processes never read a torn entry.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, ttl: Optional[float] = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024, mode: str = "readwrite"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode} (expected one of {', '.join(CACHE_MODES)})")
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "expired": 0, "evicted": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # An entry without its timestamp or response is unusable, like a torn one
+        created = entry.get("created") if isinstance(entry, dict) else None
+        if not isinstance(created, (int, float)) or "response" not in entry:
+            return None
+
+        # Replay is meant to be deterministic, so stored answers never expire there
+        if self.mode != "replay" and self.ttl is not None and time.time() - created > self.ttl:
+            self.stats["expired"] += 1
+            with self._lock:
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = 0
+                if self._remove(path) and self._size is not None:
+                    self._size -= size
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["response"]
+
+    def put(self, key: str, response: str, model: str = ""):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        body = json.dumps({"key": key, "model": model, "created": time.time(), "response": response})
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(body)
+
+        with self._lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.stats["writes"] += 1
+            if self._size is not None:
+                self._size += len(body) - previous
+            self._evict_if_needed()
+
+    def complete(self, model: str, messages, tools: Optional[List], params: Optional[Dict],
+                 call: Callable[[], str]) -> str:
+        """Return the cached response for this request, or run call() per the cache mode"""
+
+        if self.mode == "off":
+            return call()
+
+        key = cache_key(model, messages, tools, params)
+        if self.mode != "record":
+            response = self.get(key)
+            record_cache("llm", response is not None)
+            if response is not None:
+                self.stats["hits"] += 1
+                return response
+            self.stats["misses"] += 1
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"No recorded LLM response for {model} (key {key[:12]})")
+
+        response = call()
+        # Tool-call dicts and other structured results are not replayable text
+        if isinstance(response, str):
+            self.put(key, response, model)
+        return response
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith(".json"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                yield path, info.st_size, info.st_mtime
+
+    def _evict_if_needed(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        if self._size <= self.max_bytes:
+            return
+
+        target = self.max_bytes * EVICT_TARGET
+        for path, size, _ in sorted(self._entries(), key=lambda entry: entry[2]):
+            if self._size <= target:
+                break
+            if self._remove(path):
+                self._size -= size
+                self.stats["evicted"] += 1
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            self._size = sum(size for _, size, _ in self._entries())
+            return self._size
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                self._remove(path)
+            self._size = 0
+
+
+def create_default_llm_cache() -> LLMResponseCache:
+    """Cache configured from the MILO_LLM_CACHE_* environment variables"""
+
+    return LLMResponseCache(
+        root=os.environ.get(LLM_CACHE_DIR_ENV, DEFAULT_CACHE_DIR),
+        ttl=float(os.environ.get(LLM_CACHE_TTL_ENV, DEFAULT_TTL_SECONDS)),
+        max_bytes=int(float(os.environ.get(LLM_CACHE_MAX_MB_ENV, DEFAULT_MAX_MB)) * 1024 * 1024),
+        mode=os.environ.get(LLM_CACHE_MODE_ENV, "readwrite").lower()
+    )
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_llm_cache() -> LLMResponseCache:
+    global _default_cache
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = create_default_llm_cache()
+    return _default_cache
+
+
+if CREWAI_LLM_AVAILABLE:
+    class CachedLLM(LLM):
+        """crewai LLM whose call() goes through an LLMResponseCache
+
+        Cache hits return without calling the model, so no stream chunks are
+        emitted for them; the task completion event still carries the output.
+        """
+
+        def __init__(self, *args, response_cache: Optional[LLMResponseCache] = None, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.response_cache = response_cache or get_default_llm_cache()
+
+        def call(self, messages, tools=None, *args, **kwargs):
+            params = {
+                "temperature": getattr(self, "temperature", None),
+                "top_p": getattr(self, "top_p", None),
+                "max_tokens": getattr(self, "max_tokens", None),
+                "stop": getattr(self, "stop", None),
+                "response_format": getattr(self, "response_format", None)
+            }
+            return self.response_cache.complete(
+                self.model, messages, tools, params,
+                lambda: super(CachedLLM, self).call(messages, tools, *args, **kwargs))
@@ -0,0 +1,319 @@
+"""
+MILO LLM Stub Server - Deterministic OpenAI-compatible stand-in for benchmarks
+Serves canned chat completions (plain JSON or SSE streaming) with configurable
+per-token latency and injected faults, so crew orchestration, concurrency and
+caching can be measured offline and repeatably
+
+Endpoints:
+    POST /v1/chat/completions   OpenAI request body; "stream": true for SSE
+    GET  /v1/models
+    GET  /health                request and fault counters
+
+Usage:
+    python llm_stub_server.py --port 8099 --token-latency 0.02 --error-rate 0.05
+    MILO_LLM_BASE_URL=http://127.0.0.1:8099/v1 MILO_LLM_MODEL=openai/milo-stub python milo_agents.py
+
+A request can force a fault with the X-Stub-Fault header (error, rate_limit,
+hang or truncate), or opt out of random faults with "none".
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+MAX_BODY_BYTES = 8 << 20
+STUB_MODEL = "milo-stub"
+FAULTS = ("error", "rate_limit", "hang", "truncate")
+
+# (keywords matched against the prompt, completion) - first match wins. Written
+# in crewai's ReAct format so agents finish without calling tools.
+CANNED_COMPLETIONS = [
+    (("communications analyst", "client communications"),
+     "Thought: I now know the final answer\n"
+     "Final Answer: Chronological summary of client communications:\n"
+     "1. 2024-01-15 email - ESG concerns about international holdings, prompted by Emma.\n"
+     "2. 2024-02-28 call - banking sector volatility; reassured on portfolio exposure.\n"
+     "3. 2024-04-10 meeting - Northwestern acceptance; college funding timeline confirmed.\n"
+     "4. 2024-08-15 meeting - family ESG review; VSGX transition performing competitively.\n"
+     "Key themes: ESG alignment, family involvement, education planning, rate sensitivity."),
+    (("portfolio performance analyst", "ips compliance", "portfolio performance"),
+     "Thought: I now know the final answer\n"
+     "Final Answer: Portfolio performance report:\n"
+     "- Weighted return 8.2%, inside the 7-9% IPS objective.\n"
+     "- Allocation 70% equity / 25% fixed income / 5% alternatives matches IPS targets.\n"
+     "- No asset class drifts beyond the 5% rebalancing threshold; no rebalance needed.\n"
+     "- VGSLX led returns; VBTLX lagged with rate moves."),
+    (("meeting preparation", "talking points"),
+     "Thought: I now know the final answer\n"
+     "Final Answer: Meeting preparation package:\n"
+     "Executive summary: strong year, ESG goals met without sacrificing returns.\n"
+     "Talking points:\n"
+     "1. Portfolio returned 8.2%, within the IPS range.\n"
+     "2. VSGX transition delivered values alignment at competitive performance.\n"
+     "3. Northwestern tuition schedule and liquidity plan.\n"
+     "4. Rate outlook and the bond sleeve.\n"
+     "Action items: green bond research; confirm 2025 tuition withdrawals."),
+]
+DEFAULT_COMPLETION = ("Thought: I now know the final answer\n"
+                      "Final Answer: MILO stub response - no canned completion matched this prompt.")
+
+_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Whitespace-delimited pseudo tokens, so streamed chunks rejoin exactly"""
+    return _TOKEN_PATTERN.findall(text)
+
+
+def _prompt_text(messages: List[Dict]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(str(content or ""))
+    return "\n".join(parts)
+
+
+def canned_completion(messages: List[Dict]) -> str:
+    """Same messages in, same completion out"""
+
+    prompt = _prompt_text(messages).lower()
+    for keywords, completion in CANNED_COMPLETIONS:
+        if any(keyword in prompt for keyword in keywords):
+            return completion
+    return DEFAULT_COMPLETION
+
+
+class StubConfig:
+    """Latency and fault-injection knobs; rates are per request probabilities"""
+
+    def __init__(self, token_latency: float = 0.01, first_token_latency: float = 0.1,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, hang_rate: float = 0.0,
+                 truncate_rate: float = 0.0, hang_seconds: float = 30.0, seed: int = 7):
+        self.token_latency = token_latency
+        self.first_token_latency = first_token_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.hang_rate = hang_rate
+        self.truncate_rate = truncate_rate
+        self.hang_seconds = hang_seconds
+        self.seed = seed
+
+
+class LLMStubHandler(BaseHTTPRequestHandler):
+    """OpenAI chat completions subset; the server carries config and counters"""
+
+    server_version = "MILOStub/1.0"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Dict, headers: Dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, error_type: str, headers: Dict = None):
+        self._send_json(status, {"error": {"message": message, "type": error_type}}, headers)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "stats": self.server.snapshot_stats()})
+        elif self.path in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": STUB_MODEL, "object": "model", "owned_by": "milo"}]})
+        else:
+            self._send_error(404, f"Unknown path {self.path}", "not_found")
+
+    def do_POST(self):
+        if self.path not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_error(404, f"Unknown path {self.path}", "not_found")
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                raise ValueError("Request body too large")
+            request = json.loads(self.rfile.read(length) or b"{}")
+            messages = request["messages"]
+            if not isinstance(messages, list):
+                raise ValueError("'messages' must be a list")
+        except (ValueError, KeyError) as e:
+            self._send_error(400, f"Invalid request: {e}", "invalid_request_error")
+            return
+
+        config = self.server.config
+        forced = self.headers.get("X-Stub-Fault")
+        if forced is None:
+            fault = self.server.draw_fault()
+        elif forced in ("", "none"):
+            fault = None
+        elif forced in FAULTS:
+            fault = forced
+        else:
+            self._send_error(400, f"Unknown X-Stub-Fault {forced!r}", "invalid_request_error")
+            return
+        self.server.count("requests")
+
+        if fault == "error":
+            self.server.count("fault_error")
+            self._send_error(500, "Injected server error", "server_error")
+            return
+        if fault == "rate_limit":
+            self.server.count("fault_rate_limit")
+            self._send_error(429, "Injected rate limit", "rate_limit_error", {"Retry-After": "1"})
+            return
+        if fault == "hang":
+            # Client timeouts and cancellation paths; the response never arrives
+            self.server.count("fault_hang")
+            time.sleep(config.hang_seconds)
+            self.close_connection = True
+            return
+
+        completion = canned_completion(messages)
+        model = request.get("model") or STUB_MODEL
+        completion_id = "chatcmpl-" + hashlib.sha256(completion.encode()).hexdigest()[:24]
+        tokens = tokenize(completion)
+        prompt_tokens = len(tokenize(_prompt_text(messages)))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)
+        }
+
+        if request.get("stream"):
+            self._stream(completion_id, model, tokens, usage, truncate=(fault == "truncate"))
+        else:
+            time.sleep(config.first_token_latency + config.token_latency * len(tokens))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": completion}}],
+                "usage": usage
+            })
+        self.server.count("completions")
+
+    def _stream(self, completion_id: str, model: str, tokens: List[str], usage: Dict, truncate: bool):
+        config = self.server.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send_chunk(delta: Dict, finish_reason: Optional[str] = None, extra: Dict = None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **(extra or {})
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        try:
+            time.sleep(config.first_token_latency)
+            send_chunk({"role": "assistant", "content": ""})
+
+            cut = len(tokens) // 2 if truncate else len(tokens)
+            for token in tokens[:cut]:
+                send_chunk({"content": token})
+                time.sleep(config.token_latency)
+
+            if truncate:
+                # Drop the connection mid-stream without a finish chunk or [DONE]
+                self.server.count("fault_truncate")
+                self.close_connection = True
+                return
+
+            send_chunk({}, "stop", {"usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled; nothing left to send
+            self.server.count("client_disconnects")
+
+
+class LLMStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: StubConfig, quiet: bool = False):
+        super().__init__(address, LLMStubHandler)
+        self.config = config
+        self.quiet = quiet
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+
+    def draw_fault(self) -> Optional[str]:
+        """Seeded draw, so a given request sequence sees the same faults every run"""
+
+        config = self.config
+        with self._lock:
+            roll = self._rng.random()
+        for fault, rate in (("error", config.error_rate), ("rate_limit", config.rate_limit_rate),
+                            ("hang", config.hang_rate), ("truncate", config.truncate_rate)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def snapshot_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+
+def create_stub_server(host: str = "127.0.0.1", port: int = 8099, config: Optional[StubConfig] = None,
+                       quiet: bool = False) -> LLMStubServer:
+    """Bind the stub; port 0 picks a free port (see server.server_address)"""
+
+    return LLMStubServer((host, port), config or StubConfig(), quiet=quiet)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a deterministic OpenAI-compatible LLM stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds between streamed tokens")
+    parser.add_argument("--first-token-latency", type=float, default=0.1, help="Seconds before the first token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction answered with 429")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction that never respond")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Fraction of streams cut off midway")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=7, help="Seed for fault injection")
+    parser.add_argument("--quiet", action="store_true", help="Suppress access logs")
+    args = parser.parse_args()
+
+    server = create_stub_server(args.host, args.port, StubConfig(
+        token_latency=args.token_latency, first_token_latency=args.first_token_latency,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, hang_rate=args.hang_rate,
+        truncate_rate=args.truncate_rate, hang_seconds=args.hang_seconds, seed=args.seed), args.quiet)
+    print(f"🧪 MILO LLM stub listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Shutting down")
+    finally:
+        server.server_close()
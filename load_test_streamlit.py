@@ -0,0 +1,200 @@
+"""
+MILO Streamlit Load Harness - Concurrent simulated advisor sessions
+Drives enhanced_streamlit_app through Streamlit's AppTest API: each session
+loads the page, clicks example query buttons and runs analyses, with market
+data stubbed by the offline fake provider
+
+Usage:
+    python load_test_streamlit.py --sessions 8 --analyses 3
+    python load_test_streamlit.py --sessions 4 --ui-delay-scale 1.0   # keep the demo's progress pauses
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("MILO_MARKET_DATA_PROVIDER", "fake")
+
+from streamlit.testing.v1 import AppTest
+
+import market_data
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "enhanced_streamlit_app.py")
+EXAMPLE_BUTTONS = 6
+ANALYZE_LABEL = "🚀 Generate CrewAI Analysis"
+
+_real_sleep = time.sleep
+
+
+def install_ui_delay_scale(scale: float):
+    """Scale time.sleep only when called from the app script itself
+
+    Streamlit's own runner polls with time.sleep, so a global patch would turn
+    every session's poll loop into a busy-wait and distort the measurements.
+    """
+
+    app_file = os.path.basename(APP_PATH)
+
+    def scaled_sleep(seconds):
+        caller = sys._getframe(1).f_code.co_filename
+        if os.path.basename(caller) == app_file:
+            seconds *= scale
+        if seconds > 0:
+            _real_sleep(seconds)
+
+    time.sleep = scaled_sleep
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        return float("nan")
+
+
+def _timed(samples: List, kind: str, action):
+    started = time.perf_counter()
+    at = action()
+    samples.append((kind, time.perf_counter() - started))
+    if at.exception:
+        raise RuntimeError(f"{kind} raised: {at.exception[0].value}")
+    return at
+
+
+def run_session(session_id: int, analyses: int, timeout: float) -> Dict:
+    """One advisor: load the page, then pick examples and run analyses"""
+
+    samples = []
+    errors = []
+    try:
+        at = _timed(samples, "page_load",
+                    lambda: AppTest.from_file(APP_PATH, default_timeout=timeout).run())
+
+        for i in range(analyses):
+            example_key = f"example_{(session_id + i) % EXAMPLE_BUTTONS}"
+            at = _timed(samples, "example_click",
+                        lambda: at.button(key=example_key).click().run())
+
+            analyze_button = next(button for button in at.button if button.label == ANALYZE_LABEL)
+            at = _timed(samples, "analysis", lambda: analyze_button.click().run())
+    except Exception as e:
+        errors.append(f"session {session_id}: {e}")
+
+    return {"session": session_id, "samples": samples, "errors": errors}
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(pct):
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pick(50) * 1000,
+        "p95_ms": pick(95) * 1000,
+        "p99_ms": pick(99) * 1000,
+        "max_ms": ordered[-1] * 1000
+    }
+
+
+def run_load_test(sessions: int, analyses: int, provider_latency: float, timeout: float,
+                  trace_memory: bool = False) -> Dict:
+    market_data.set_default_fetcher(market_data.AsyncMarketDataFetcher(
+        market_data.FakeMarketDataProvider(latency=provider_latency)))
+
+    rss_before = _rss_mb()
+    if trace_memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(
+            lambda session_id: run_session(session_id, analyses, timeout), range(sessions)))
+    wall = time.perf_counter() - started
+
+    memory = {"rss_before_mb": rss_before, "rss_after_mb": _rss_mb()}
+    memory["rss_per_session_mb"] = (memory["rss_after_mb"] - rss_before) / sessions
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory["traced_peak_per_session_mb"] = peak / 1e6 / sessions
+
+    by_kind: Dict[str, List[float]] = {}
+    for result in results:
+        for kind, seconds in result["samples"]:
+            by_kind.setdefault(kind, []).append(seconds)
+
+    completed_analyses = len(by_kind.get("analysis", []))
+    return {
+        "sessions": sessions,
+        "analyses_per_session": analyses,
+        "provider_latency_s": provider_latency,
+        "wall_seconds": wall,
+        "throughput": {
+            "analyses_per_second": completed_analyses / wall if wall else 0.0,
+            "interactions_per_second": sum(len(v) for v in by_kind.values()) / wall if wall else 0.0
+        },
+        "latency": {kind: _percentiles(values) for kind, values in by_kind.items()},
+        "memory": memory,
+        "errors": [error for result in results for error in result["errors"]]
+    }
+
+
+def print_report(report: Dict):
+    print("\n" + "=" * 72)
+    print(f"🧪 {report['sessions']} concurrent sessions x {report['analyses_per_session']} analyses "
+          f"in {report['wall_seconds']:.2f}s")
+    print(f"🚀 Throughput: {report['throughput']['analyses_per_second']:.2f} analyses/s, "
+          f"{report['throughput']['interactions_per_second']:.2f} interactions/s")
+    print("-" * 72)
+    print(f"{'interaction':<15}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for kind, stats in report["latency"].items():
+        print(f"{kind:<15}{stats['count']:>7}{stats['p50_ms']:>11.1f}{stats['p95_ms']:>11.1f}"
+              f"{stats['p99_ms']:>11.1f}{stats['max_ms']:>11.1f}")
+    print("-" * 72)
+    for name, value in report["memory"].items():
+        print(f"💾 {name}: {value:.1f}")
+    if report["errors"]:
+        print(f"❌ {len(report['errors'])} session errors, first: {report['errors'][0]}")
+    print("=" * 72)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test enhanced_streamlit_app with concurrent AppTest sessions")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--analyses", type=int, default=3, help="Analyses per session")
+    parser.add_argument("--provider-latency", type=float, default=0.05,
+                        help="Seconds per fake market data request")
+    parser.add_argument("--ui-delay-scale", type=float, default=0.0,
+                        help="Multiplier for the app's simulated progress pauses (0 skips them)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-interaction AppTest timeout")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also report tracemalloc peak (slows the run)")
+    parser.add_argument("--json", help="Write the full report to this path")
+    args = parser.parse_args(argv)
+
+    install_ui_delay_scale(args.ui_delay_scale)
+    report = run_load_test(args.sessions, args.analyses, args.provider_latency,
+                           args.timeout, args.trace_memory)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""
+MILO Market Data Layer - Async price history fetcher
+Bounded concurrency, per-request timeouts, jittered retries and a circuit
+breaker that fails fast to cached or fallback data while the provider is down
+"""
+
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import concurrent.futures
+import hashlib
+import math
+import os
+import random
+import threading
+import time
+import weakref
+
+from milo_tracing import record_cache
+
+try:
+    import yfinance as yf
+    YFINANCE_AVAILABLE = True
+except ImportError:
+    YFINANCE_AVAILABLE = False
+
+# "yfinance" (default when installed) or "fake" for offline runs
+MARKET_DATA_PROVIDER_ENV = "MILO_MARKET_DATA_PROVIDER"
+
+
+class MarketDataError(Exception):
+    """Raised when a provider cannot return usable price history"""
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe after a cool-down"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow_request(self) -> Optional[str]:
+        """"closed" or "probe" (this caller holds the half-open probe slot); None if refused"""
+
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return "closed"
+            if state == "half_open" and not self._probe_in_flight:
+                # Let exactly one probe through to test the provider
+                self._probe_in_flight = True
+                return "probe"
+            return None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Give up a probe that never got an answer (cancelled) without counting a failure
+
+        Only for the caller whose allow_request() returned "probe".
+        """
+
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._probe_in_flight = False
+
+
+class _LeaderCancelled(Exception):
+    """Signals followers that the leading fetch was cancelled and they must retry"""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight call
+
+    Keyed by a thread-safe concurrent.futures.Future, so followers may wait
+    from any thread or event loop - each Streamlit session runs its own loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[tuple, concurrent.futures.Future] = {}
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    async def do(self, key: tuple, call) -> tuple:
+        """Await call() once per key; returns (result, shared) where shared marks a follower"""
+
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = concurrent.futures.Future()
+                    self._inflight[key] = future
+
+            if leader:
+                break
+
+            try:
+                # Shield so one follower's cancellation can't cancel the shared future
+                return await asyncio.shield(asyncio.wrap_future(future)), True
+            except _LeaderCancelled:
+                continue
+
+        try:
+            result = await call()
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(_LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result, False
+
+    def _finish(self, key: tuple):
+        # Before the future resolves, so a retrying follower never finds it again
+        with self._lock:
+            self._inflight.pop(key, None)
+
+
+class YFinanceProvider:
+    """Runs blocking yfinance history calls off the event loop"""
+
+    name = "yfinance"
+
+    async def history(self, ticker: str, period: str) -> List[float]:
+        return await asyncio.to_thread(self._history, ticker, period)
+
+    def _history(self, ticker: str, period: str) -> List[float]:
+        hist = yf.Ticker(ticker).history(period=period)
+        if hist.empty:
+            raise MarketDataError(f"No history returned for {ticker}")
+        return [float(price) for price in hist["Close"].tolist()]
+
+
+class FakeMarketDataProvider:
+    """Deterministic offline provider with configurable latency and failures"""
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, failure_rate: float = 0.0,
+                 hang_rate: float = 0.0, down: bool = False, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.down = down
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    async def history(self, ticker: str, period: str) -> List[float]:
+        self.calls += 1
+        roll = self._rng.random()
+
+        if self.hang_rate and roll < self.hang_rate:
+            # Simulates a provider that accepts the request and never answers
+            await asyncio.sleep(3600)
+
+        await asyncio.sleep(self.latency + self._rng.uniform(0, self.jitter))
+
+        if self.down or roll < self.hang_rate + self.failure_rate:
+            raise MarketDataError(f"Fake provider failure for {ticker}")
+
+        return self.synthetic_closes(ticker, period)
+
+    @staticmethod
+    def synthetic_closes(ticker: str, period: str = "1y") -> List[float]:
+        """Random walk seeded by (ticker, period) so every run sees the same prices"""
+
+        seed = int(hashlib.sha256(f"{ticker}:{period}".encode()).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        drift = rng.uniform(0.0, 0.12) / 252
+        daily_vol = rng.uniform(0.04, 0.2) / math.sqrt(252)
+
+        price = rng.uniform(20, 300)
+        closes = [price]
+        for _ in range(251):
+            price *= 1 + rng.gauss(drift, daily_vol)
+            closes.append(price)
+        return closes
+
+
+class AsyncMarketDataFetcher:
+    """Concurrency-limited, retrying price fetcher with stale-cache fallback"""
+
+    def __init__(self, provider, max_concurrency: int = 4, timeout: float = 10.0,
+                 retries: int = 2, backoff_base: float = 0.25, backoff_cap: float = 4.0,
+                 cache_ttl: float = 900.0, breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.cache_ttl = cache_ttl
+        self.breaker = breaker or CircuitBreaker()
+
+        self._cache: Dict[Tuple[str, str], Tuple[float, List[float]]] = {}
+        self._cache_lock = threading.Lock()
+        # asyncio primitives are bound to one loop; sync callers use a fresh loop per call
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._singleflight = SingleFlight()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "failures": 0,
+                      "short_circuits": 0, "stale_served": 0}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    def _cached(self, key: Tuple[str, str], allow_stale: bool = False) -> Optional[List[float]]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+        if entry is None:
+            return None
+        stored_at, closes = entry
+        if allow_stale or time.monotonic() - stored_at < self.cache_ttl:
+            return closes
+        return None
+
+    def _count(self, stat: str):
+        # Sessions on different threads share the fetcher
+        with self._cache_lock:
+            self.stats[stat] += 1
+
+    def _fallback(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        stale = self._cached(key, allow_stale=True)
+        if stale is not None:
+            self._count("stale_served")
+        return stale
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps concurrent retries from synchronising
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    async def fetch(self, ticker: str, period: str = "1y") -> Optional[List[float]]:
+        """Closing prices for one ticker, or None when only fallback data is available"""
+
+        key = (ticker, period)
+        cached = self._cached(key)
+        record_cache("prices", cached is not None)
+        if cached is not None:
+            self._count("hits")
+            return cached
+
+        self._count("misses")
+
+        if self.provider is None:
+            return None
+
+        # Concurrent sessions asking for the same (ticker, period) share one request
+        closes, shared = await self._singleflight.do(key, lambda: self._fetch_uncached(key))
+        if shared:
+            self._count("coalesced")
+        return closes
+
+    async def _fetch_uncached(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        ticker, period = key
+
+        async with self._semaphore():
+            for attempt in range(self.retries + 1):
+                permit = self.breaker.allow_request()
+                if permit is None:
+                    self._count("short_circuits")
+                    return self._fallback(key)
+
+                try:
+                    closes = await asyncio.wait_for(
+                        self.provider.history(ticker, period), timeout=self.timeout)
+                except asyncio.CancelledError:
+                    # A cancelled half-open probe must not hold the breaker shut forever;
+                    # anyone else cancelled must not free a probe slot they never held
+                    if permit == "probe":
+                        self.breaker.release_probe()
+                    raise
+                except Exception as e:  # provider errors vary widely; cancellation still propagates
+                    self._count("failures")
+                    self.breaker.record_failure()
+                    print(
+                        f"📋 {ticker} fetch attempt {attempt + 1} failed: {type(e).__name__}")
+                    if attempt < self.retries:
+                        await asyncio.sleep(self._backoff(attempt))
+                    continue
+
+                self.breaker.record_success()
+                with self._cache_lock:
+                    self._cache[key] = (time.monotonic(), closes)
+                return closes
+
+        return self._fallback(key)
+
+    async def fetch_many(self, tickers: List[str], period: str = "1y") -> Dict[str, Optional[List[float]]]:
+        """Fetch several tickers concurrently, bounded by max_concurrency"""
+
+        results = await asyncio.gather(*(self.fetch(ticker, period) for ticker in tickers))
+        return dict(zip(tickers, results))
+
+
+def create_default_provider():
+    """Pick the provider named by MILO_MARKET_DATA_PROVIDER"""
+
+    choice = os.environ.get(MARKET_DATA_PROVIDER_ENV, "yfinance").lower()
+    if choice == "fake":
+        return FakeMarketDataProvider()
+    if choice == "yfinance" and YFINANCE_AVAILABLE:
+        return YFinanceProvider()
+    return None
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def get_default_fetcher() -> AsyncMarketDataFetcher:
+    """Process-wide fetcher, so the cache and circuit breaker are shared by every session"""
+
+    global _default_fetcher
+
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = AsyncMarketDataFetcher(create_default_provider())
+    return _default_fetcher
+
+
+def set_default_fetcher(fetcher: Optional[AsyncMarketDataFetcher]):
+    """Swap the process-wide fetcher (benchmarks, load tests); None rebuilds from env"""
+
+    global _default_fetcher
+
+    with _default_fetcher_lock:
+        _default_fetcher = fetcher
+
+
+def fetch_price_histories(tickers: List[str], period: str = "1y") -> Dict[str, Optional[List[float]]]:
+    """Blocking entry point for synchronous callers such as analyze_portfolio"""
+
+    coroutine = get_default_fetcher().fetch_many(tickers, period)
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    # Already inside an event loop - run on a private loop in a worker thread
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
@@ -1,47 +1,116 @@
 from crewai import Agent, Task, Crew, Process
 from crewai_tools import BaseTool
-from typing import List, Dict
+from contextlib import contextmanager, nullcontext
+from typing import Callable, List, Dict, Optional, Sequence
 import json
+import os
+import queue
+import threading
+import time
 from datetime import datetime, timedelta
 
+import llm_cache
+import milo_tracing
+from communications_index import DEFAULT_CLIENT
+from context_packer import TASK_TOKEN_BUDGETS, ContextPacker
+
+# Model for every MILO agent; calls are served through the on-disk response cache
+LLM_MODEL_ENV = "MILO_LLM_MODEL"
+DEFAULT_LLM_MODEL = "gpt-4o-mini"
+LLM_STREAM_ENV = "MILO_LLM_STREAM"
+# OpenAI-compatible endpoint, e.g. llm_stub_server.py for offline benchmarks
+LLM_BASE_URL_ENV = "MILO_LLM_BASE_URL"
+LLM_API_KEY_ENV = "MILO_LLM_API_KEY"
+
+# Prebuilt crews kept warm for concurrent review requests
+CREW_POOL_SIZE_ENV = "MILO_CREW_POOL_SIZE"
+DEFAULT_CREW_POOL_SIZE = 2
+DEFAULT_REVIEW_QUERY = "What has happened with this account over the past year?"
+
+# EmailAnalysisTool retrieval defaults
+DEFAULT_TOP_K = 5
+COMMUNICATIONS_WINDOW_DAYS = 365
+
 # Custom tools for the agents
 
 
+def parse_communications_request(client_data: str, index) -> Dict:
+    """Tool input as plain text or JSON -> client, query, date window and top_k
+
+    Without explicit dates the window is the year ending at the newest record.
+    """
+
+    try:
+        payload = json.loads(client_data)
+    except (TypeError, ValueError):
+        payload = None
+    if not isinstance(payload, dict):
+        payload = {"query": str(client_data or "")}
+
+    query = str(payload.get("query") or payload.get("question") or "")
+    client_name = payload.get("client_name") or payload.get("client")
+    if not client_name:
+        # Agents often pass "<client>: <question>" - pick a known client out of the text
+        client_name = next((name for name in index.client_names() if name.lower() in query.lower()),
+                           DEFAULT_CLIENT)
+
+    end_date = payload.get("end_date") or index.latest_date()
+    start_date = payload.get("start_date")
+    if not start_date and end_date:
+        start_date = (datetime.strptime(end_date, "%Y-%m-%d") -
+                      timedelta(days=COMMUNICATIONS_WINDOW_DAYS)).strftime("%Y-%m-%d")
+
+    return {
+        "client_name": client_name,
+        "query": query or DEFAULT_REVIEW_QUERY,
+        "start_date": start_date,
+        "end_date": end_date,
+        "top_k": int(payload.get("top_k") or DEFAULT_TOP_K)
+    }
+
+
 class EmailAnalysisTool(BaseTool):
     name: str = "Email Analysis Tool"
-    description: str = "Analyzes client emails and meeting transcripts for key themes and chronological patterns"
+    description: str = ("Retrieves the most relevant client emails, calls and meeting notes for a question. "
+                        "Input: the question, optionally as JSON with client_name, query, start_date, "
+                        "end_date (YYYY-MM-DD) and top_k")
 
     def _run(self, client_data: str) -> str:
-        # In real implementation, this would connect to Gmail API or SharePoint
-        # For demo, we'll use mock data
-        mock_communications = [
-            {
-                "date": "2024-01-15",
-                "type": "email",
-                "subject": "Q4 2023 Portfolio Review Follow-up",
-                "summary": "Client confirmed satisfaction with portfolio performance but raised concerns about ESG alignment in international holdings."
-            },
-            {
-                "date": "2024-03-20",
-                "type": "email",
-                "subject": "Market Volatility Concerns",
-                "summary": "Client expressed anxiety about banking sector issues and requested reassurance about portfolio exposure."
-            },
-            {
-                "date": "2024-06-10",
-                "type": "meeting",
-                "subject": "Mid-Year Portfolio Review",
-                "summary": "45-minute meeting. Discussed rebalancing strategy and client's daughter starting college in 2025. Need to plan for tuition payments."
-            },
-            {
-                "date": "2024-09-15",
-                "type": "email",
-                "subject": "Fed Rate Decision Discussion",
-                "summary": "Client asked about impact of rate cuts on bond portfolio. Expressed interest in increasing equity allocation."
-            }
-        ]
-
-        return json.dumps(mock_communications, indent=2)
+        # Same indexed store as the non-CrewAI pipeline; a Gmail/SharePoint sync would feed it
+        from enhanced_milo_agents import analyze_query, get_communications_index
+
+        index = get_communications_index()
+        request = parse_communications_request(client_data, index)
+
+        doc_ids = index.candidates(request["client_name"], request["start_date"], request["end_date"])
+        if not doc_ids:
+            return json.dumps({**request, "records": [],
+                               "note": "No communications on file for this client and date window"}, indent=2)
+
+        focus = analyze_query(request["query"])["primary_focus"]
+        packed = ContextPacker(index).pack(
+            request["query"], TASK_TOKEN_BUDGETS["communications"], focus, doc_ids,
+            top_k=request["top_k"])
+
+        records = []
+        for item in packed["included"]:
+            record = index.records[item["doc_id"]]
+            records.append({
+                "date": record.get("date"),
+                "type": record.get("type"),
+                "subject": record.get("subject"),
+                "relevance": item["relevance"],
+                "detail": item["mode"],
+                "content": item["text"]
+            })
+
+        return json.dumps({
+            **request,
+            "matched": len(doc_ids),
+            "omitted": len(packed["dropped"]),
+            "tokens": packed["tokens"],
+            "records": records
+        }, indent=2)
 
 
 class PerformanceAnalysisTool(BaseTool):
@@ -49,45 +118,39 @@ class PerformanceAnalysisTool(BaseTool):
     description: str = "Analyzes portfolio performance against IPS benchmarks using real market data"
 
     def _run(self, portfolio_data: str) -> str:
-        # This would integrate with the PortfolioAnalyzer class we created above
-        from portfolio_analyzer import PortfolioAnalyzer
-
-        # Mock portfolio and IPS data for demo
-        sample_portfolio = {
-            "allocation": {
-                "VTIAX": {"allocation": 30, "name": "Vanguard Total International Stock Index"},
-                "VTSAX": {"allocation": 40, "name": "Vanguard Total Stock Market Index"},
-                "VBTLX": {"allocation": 20, "name": "Vanguard Total Bond Market Index"},
-                "VTABX": {"allocation": 5, "name": "Vanguard Total International Bond Index"},
-                "VGSLX": {"allocation": 5, "name": "Vanguard Real Estate Index Fund"}
-            }
-        }
-
-        sample_ips = {
-            "return_objective": "7-9%",
-            "asset_allocation_targets": {
-                "equity": {"target": 70},
-                "fixed_income": {"target": 25},
-                "alternatives": {"target": 5}
-            },
-            "rebalancing_threshold": 5
-        }
-
-        # In real implementation, this would call the actual analyzer
-        mock_performance = {
-            "portfolio_return": 0.08,  # 8% return
-            "ips_comparison": "Within Range",
+        # Same analyzer and snapshot cache as the non-CrewAI pipeline
+        from portfolio_analyzer import PortfolioAnalyzer, get_default_analyzer
+
+        # Optional JSON {"allocations": {...}} analyzes a different portfolio
+        try:
+            payload = json.loads(portfolio_data)
+        except (TypeError, ValueError):
+            payload = None
+        if isinstance(payload, dict) and isinstance(payload.get("allocations"), dict):
+            analyzer = PortfolioAnalyzer(portfolio=payload)
+        else:
+            analyzer = get_default_analyzer()
+
+        snapshot = analyzer.analyze()
+        compliance = snapshot["ips_compliance"]
+
+        performance = {
+            "as_of": snapshot["as_of"],
+            "portfolio_return": round(snapshot["total_return"] / 100, 4),
+            "portfolio_volatility": (round(snapshot["portfolio_volatility"] / 100, 4)
+                                     if snapshot["portfolio_volatility"] is not None else None),
+            "ips_comparison": compliance["return_compliance"]["status"],
+            "ips_target": compliance["return_compliance"]["ips_target"],
             "individual_funds": {
-                "VTSAX": {"return": 0.12, "allocation": 40},
-                "VTIAX": {"return": 0.06, "allocation": 30},
-                "VBTLX": {"return": 0.02, "allocation": 20},
-                "VTABX": {"return": 0.01, "allocation": 5},
-                "VGSLX": {"return": 0.15, "allocation": 5}
+                ticker: {"return": round(fund["annual_return"] / 100, 4), "allocation": fund["allocation"],
+                         "volatility": round(fund["volatility"] / 100, 4)}
+                for ticker, fund in snapshot["fund_performance"].items()
             },
-            "needs_rebalancing": False
+            "allocation_drift": compliance["allocation_drift"],
+            "needs_rebalancing": compliance["needs_rebalancing"]
         }
 
-        return json.dumps(mock_performance, indent=2)
+        return json.dumps(performance, indent=2)
 
 
 class ReportGenerationTool(BaseTool):
@@ -98,10 +161,36 @@ class ReportGenerationTool(BaseTool):
         # This tool formats the final report
         return "Report generation tool ready to compile final meeting materials"
 
+# Shared LLM for the agents
+
+
+def create_milo_llm():
+    """Cached, streaming LLM for the agents, or None to keep crewai's default client"""
+
+    if not llm_cache.CREWAI_LLM_AVAILABLE:
+        return None
+
+    options = {
+        "model": os.environ.get(LLM_MODEL_ENV, DEFAULT_LLM_MODEL),
+        # Token chunks go out on crewai's event bus for the dashboard
+        "stream": os.environ.get(LLM_STREAM_ENV, "1").lower() not in ("0", "false", "no", "off")
+    }
+    base_url = os.environ.get(LLM_BASE_URL_ENV)
+    if base_url:
+        options["base_url"] = base_url
+        # Local stand-ins accept any key; real endpoints get one from the environment
+        options["api_key"] = os.environ.get(LLM_API_KEY_ENV, "milo-local")
+    cache = llm_cache.get_default_llm_cache()
+    if cache.mode == "off":
+        return llm_cache.LLM(**options)
+    return llm_cache.CachedLLM(response_cache=cache, **options)
+
 # Define the three core agents
 
 
-def create_milo_agents():
+def create_milo_agents(llm=None):
+
+    llm_options = {"llm": llm} if llm is not None else {}
 
     communications_analyst = Agent(
         role='Client Communications Analyst',
@@ -109,7 +198,8 @@ def create_milo_agents():
         backstory="""You are an expert at parsing through client emails, meeting notes, and phone call summaries to understand the full context of the advisor-client relationship. You excel at identifying patterns, recurring concerns, and important life events that impact financial planning decisions.""",
         tools=[EmailAnalysisTool()],
         verbose=True,
-        allow_delegation=False
+        allow_delegation=False,
+        **llm_options
     )
 
     portfolio_analyst = Agent(
@@ -118,7 +208,8 @@ def create_milo_agents():
         backstory="""You are a quantitative analyst specializing in portfolio performance evaluation. You have deep expertise in mutual fund analysis, benchmark comparison, and Investment Policy Statement compliance. You provide clear, data-driven assessments of portfolio performance.""",
         tools=[PerformanceAnalysisTool()],
         verbose=True,
-        allow_delegation=False
+        allow_delegation=False,
+        **llm_options
     )
 
     meeting_prep_specialist = Agent(
@@ -127,19 +218,57 @@ def create_milo_agents():
         backstory="""You are an experienced advisor support specialist who creates compelling meeting preparation materials. You excel at connecting client concerns with portfolio performance to create meaningful conversation topics and actionable recommendations.""",
         tools=[ReportGenerationTool()],
         verbose=True,
-        allow_delegation=False
+        allow_delegation=False,
+        **llm_options
     )
 
     return communications_analyst, portfolio_analyst, meeting_prep_specialist
 
+# Per-task timing for crew runs
+
+
+class TaskTimer:
+    """Wall-clock time per crew task, fed by Task completion callbacks
+
+    A task starts when its last context dependency finishes (or at kickoff),
+    so concurrent analyst tasks each get their own duration.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started: Optional[float] = None
+        self.finished: Dict[str, float] = {}
+        self.durations: Dict[str, float] = {}
+
+    def start(self):
+        with self._lock:
+            self.started = time.perf_counter()
+            self.finished = {}
+            self.durations = {}
+
+    def callback(self, task_name: str, depends_on: Sequence[str] = ()) -> Callable:
+        def on_task_complete(output):
+            now = time.perf_counter()
+            with self._lock:
+                ready = max([self.started] + [self.finished[name] for name in depends_on
+                                              if name in self.finished])
+                self.finished[task_name] = now
+                self.durations[task_name] = now - ready
+            milo_tracing.STAGE_DURATION.observe(now - ready, stage="crew_task", task=task_name)
+        return on_task_complete
+
 # Define the tasks for each agent
 
 
-def create_milo_tasks(communications_analyst, portfolio_analyst, meeting_prep_specialist):
+def create_milo_tasks(communications_analyst, portfolio_analyst, meeting_prep_specialist,
+                      timer: Optional[TaskTimer] = None):
+
+    def timing(task_name, depends_on=()):
+        return {"callback": timer.callback(task_name, depends_on)} if timer else {}
 
     communications_task = Task(
         description="""
-        Analyze the Smith Family Trust's communications over the past year. Your analysis should include:
+        Analyze {client_name}'s communications over the past year. Your analysis should include:
         
         1. A chronological timeline of all client interactions (emails, meetings, calls)
         2. Key themes and concerns raised by the client
@@ -147,15 +276,19 @@ def create_milo_tasks(communications_analyst, portfolio_analyst, meeting_prep_sp
         4. Recurring topics that may need addressing
         5. Client sentiment and satisfaction indicators
         
-        Focus on extracting actionable insights that will help the advisor prepare for the annual review meeting.
+        Focus on extracting actionable insights that will help the advisor prepare for the {review_type} review meeting.
+        The advisor's question: {query}
         """,
         agent=communications_analyst,
-        expected_output="A structured chronological summary of client communications with key themes and concerns highlighted"
+        expected_output="A structured chronological summary of client communications with key themes and concerns highlighted",
+        # Independent of the portfolio analysis - runs alongside it
+        async_execution=True,
+        **timing("communications")
     )
 
     performance_task = Task(
         description="""
-        Conduct a comprehensive analysis of the Smith Family Trust portfolio performance:
+        Conduct a comprehensive analysis of the {client_name} portfolio performance:
         
         1. Calculate the weighted portfolio return for the past year
         2. Compare returns to the Investment Policy Statement objectives (7-9% target)
@@ -167,7 +300,9 @@ def create_milo_tasks(communications_analyst, portfolio_analyst, meeting_prep_sp
         Provide specific data points and clear assessment of IPS compliance.
         """,
         agent=portfolio_analyst,
-        expected_output="Detailed portfolio performance report with IPS compliance assessment and rebalancing recommendations"
+        expected_output="Detailed portfolio performance report with IPS compliance assessment and rebalancing recommendations",
+        async_execution=True,
+        **timing("performance")
     )
 
     meeting_prep_task = Task(
@@ -177,7 +312,7 @@ def create_milo_tasks(communications_analyst, portfolio_analyst, meeting_prep_sp
         1. Executive summary connecting client concerns with portfolio performance
         2. Address any specific client questions or concerns from communications
         3. Highlight portfolio performance relative to client expectations
-        4. Generate 4-8 specific talking points for the annual review meeting
+        4. Generate 4-8 specific talking points for the {review_type} review meeting with {client_name}
         5. Identify action items and recommendations
         6. Suggest conversation starters based on client interests and concerns
         
@@ -185,8 +320,9 @@ def create_milo_tasks(communications_analyst, portfolio_analyst, meeting_prep_sp
         """,
         agent=meeting_prep_specialist,
         expected_output="Complete meeting preparation package with executive summary, talking points, and recommended actions",
-        # This task depends on the previous two
-        context=[communications_task, performance_task]
+        # This task depends on the previous two and waits for both to finish
+        context=[communications_task, performance_task],
+        **timing("meeting_prep", depends_on=("communications", "performance"))
     )
 
     return communications_task, performance_task, meeting_prep_task
@@ -194,14 +330,15 @@ def create_milo_tasks(communications_analyst, portfolio_analyst, meeting_prep_sp
 # Create the MILO crew
 
 
-def create_milo_crew():
+def create_milo_crew(timer: Optional[TaskTimer] = None, llm=None):
 
     # Create agents
-    communications_analyst, portfolio_analyst, meeting_prep_specialist = create_milo_agents()
+    communications_analyst, portfolio_analyst, meeting_prep_specialist = create_milo_agents(
+        llm if llm is not None else create_milo_llm())
 
     # Create tasks
     communications_task, performance_task, meeting_prep_task = create_milo_tasks(
-        communications_analyst, portfolio_analyst, meeting_prep_specialist
+        communications_analyst, portfolio_analyst, meeting_prep_specialist, timer
     )
 
     # Create the crew
@@ -209,31 +346,109 @@ def create_milo_crew():
         agents=[communications_analyst,
                 portfolio_analyst, meeting_prep_specialist],
         tasks=[communications_task, performance_task, meeting_prep_task],
-        process=Process.sequential,  # Tasks run in sequence
+        # Sequential order, but the two async analyst tasks run concurrently and
+        # meeting prep waits on both through its context
+        process=Process.sequential,
         verbose=2
     )
 
     return milo_crew
 
+# Warm pool of crews
+
+
+class CrewPool:
+    """Prebuilt crews handed out one request at a time
+
+    Client specifics arrive through kickoff inputs, so a crew can serve any
+    client. Tasks keep per-run output state, so a crew is never shared by two
+    requests at once; checkout() blocks until one is idle. All crews share a
+    single LLM client.
+    """
+
+    def __init__(self, size: int = DEFAULT_CREW_POOL_SIZE):
+        self.size = size
+        self._llm = create_milo_llm()
+        self._idle: "queue.Queue" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._build())
+
+    def _build(self):
+        timer = TaskTimer()
+        return create_milo_crew(timer, self._llm), timer
+
+    @property
+    def idle(self) -> int:
+        return self._idle.qsize()
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None):
+        """Yield an idle (crew, timer); raises TimeoutError if none frees up in time"""
+
+        try:
+            entry = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No idle crew within {timeout}s")
+
+        try:
+            yield entry
+        except BaseException:
+            # A failed run may leave task state half-written - replace the crew
+            entry = self._build()
+            raise
+        finally:
+            self._idle.put(entry)
+
+
+_default_crew_pool = None
+_default_crew_pool_lock = threading.Lock()
+
+
+def get_default_crew_pool() -> CrewPool:
+    """Process-wide pool, sized by MILO_CREW_POOL_SIZE"""
+
+    global _default_crew_pool
+
+    with _default_crew_pool_lock:
+        if _default_crew_pool is None:
+            _default_crew_pool = CrewPool(
+                int(os.environ.get(CREW_POOL_SIZE_ENV, DEFAULT_CREW_POOL_SIZE)))
+    return _default_crew_pool
+
 # Main execution function for Streamlit integration
 
 
-def execute_annual_review_prep(client_name: str = "Smith Family Trust"):
+def execute_annual_review_prep(client_name: str = "Smith Family Trust", query: str = DEFAULT_REVIEW_QUERY,
+                               pool: Optional[CrewPool] = None, timeout: Optional[float] = None,
+                               stream=None):
     """
     Main function to execute the annual review preparation workflow
+    Pass a crew_streaming.CrewStream to receive token chunks while the crew runs.
     """
     print(f"🤖 MILO: Preparing annual review materials for {client_name}")
     print("=" * 60)
 
-    # Create and execute the crew
-    crew = create_milo_crew()
-
-    # The crew will execute all tasks in sequence
-    result = crew.kickoff(inputs={
-        'client_name': client_name,
-        'review_type': 'annual',
-        'query': 'What has happened with this account over the past year?'
-    })
+    # Borrow a prebuilt crew instead of constructing agents, tools and tasks per call
+    pool = pool or get_default_crew_pool()
+    with pool.checkout(timeout) as (crew, timer):
+        if stream is not None:
+            from crew_streaming import bind_stream
+            streaming = bind_stream(stream, crew)
+        else:
+            streaming = nullcontext()
+
+        # Analyst tasks run concurrently, then meeting prep
+        with streaming, milo_tracing.span("crew_kickoff", client_name=client_name) as kickoff_span:
+            timer.start()
+            result = crew.kickoff(inputs={
+                'client_name': client_name,
+                'review_type': 'annual',
+                'query': query
+            })
+            kickoff_span.set("task_seconds", dict(timer.durations))
+
+        timings = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in timer.durations.items())
+    print(f"⏱️ Task timings: {timings}")
 
     return result
 
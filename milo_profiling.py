@@ -0,0 +1,114 @@
+"""
+MILO Profiling - Opt-in cProfile + tracemalloc capture for a single analysis
+Enable with MILO_PROFILE=1 or execute_enhanced_milo_analysis(..., profile=True);
+reports land in MILO_PROFILE_DIR (default ./profiles) named by request ID
+
+Disabled runs never import or start a profiler.
+"""
+
+from contextlib import contextmanager
+from typing import Optional
+import io
+import os
+import threading
+import uuid
+
+PROFILE_ENV = "MILO_PROFILE"
+PROFILE_DIR_ENV = "MILO_PROFILE_DIR"
+DEFAULT_PROFILE_DIR = "profiles"
+TOP_ENTRIES = 30
+
+# tracemalloc is process-wide, so profiled runs take turns
+_profile_lock = threading.Lock()
+
+
+def profiling_enabled(flag: Optional[bool] = None) -> bool:
+    """A per-call flag wins; otherwise MILO_PROFILE decides"""
+
+    if flag is not None:
+        return flag
+    return os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes", "on")
+
+
+class ProfileRun:
+    """Handle for one profiled run; request_id may be updated before exit"""
+
+    def __init__(self, request_id: str, output_dir: str):
+        self.request_id = request_id
+        self.output_dir = output_dir
+        self.paths = {}
+
+
+@contextmanager
+def profile_run(request_id: Optional[str] = None, output_dir: Optional[str] = None):
+    """Profile the enclosed block with cProfile and tracemalloc
+
+    tracemalloc is process-wide, so concurrent profiled runs (service worker
+    threads) are serialized: each waits for the previous one to write its
+    report. Allocations from unprofiled requests in other threads can still
+    appear in the report.
+    """
+
+    with _profile_lock:
+        with _profile_run(request_id, output_dir) as run:
+            yield run
+
+
+@contextmanager
+def _profile_run(request_id: Optional[str], output_dir: Optional[str]):
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    run = ProfileRun(request_id or uuid.uuid4().hex[:16],
+                     output_dir or os.environ.get(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR))
+
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(25)
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.take_snapshot()
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        profiler_active = True
+    except ValueError:
+        # Another profiler already owns this interpreter
+        profiler_active = False
+
+    try:
+        yield run
+    finally:
+        if profiler_active:
+            profiler.disable()
+
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+        os.makedirs(run.output_dir, exist_ok=True)
+        prefix = os.path.join(run.output_dir, run.request_id)
+
+        if profiler_active:
+            run.paths["pstats"] = prefix + ".pstats"
+            profiler.dump_stats(run.paths["pstats"])
+
+            report = io.StringIO()
+            stats = pstats.Stats(profiler, stream=report)
+            stats.sort_stats("cumulative").print_stats(TOP_ENTRIES)
+            run.paths["profile"] = prefix + ".profile.txt"
+            with open(run.paths["profile"], "w") as f:
+                f.write(report.getvalue())
+
+        run.paths["allocations"] = prefix + ".alloc.txt"
+        with open(run.paths["allocations"], "w") as f:
+            f.write(f"Request {run.request_id}\n")
+            f.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n")
+            f.write(f"Still allocated at exit: {current / 1024:.1f} KiB\n\n")
+            f.write(f"Top {TOP_ENTRIES} allocation sites (growth during run):\n")
+            for stat in snapshot.compare_to(baseline, "lineno")[:TOP_ENTRIES]:
+                f.write(f"{stat}\n")
+
+        print(f"🔬 Profile for {run.request_id} written to {run.output_dir}")
@@ -0,0 +1,276 @@
+"""
+MILO Headless Service - HTTP/JSON API around execute_enhanced_milo_analysis
+Bounded worker pool with a bounded request queue; when the queue is full new
+requests are rejected with 503 + Retry-After instead of piling up
+
+Endpoints:
+    POST /analyze   {"client_name": "...", "query": "..."}
+    POST /preview   {"query": "..."}
+    POST /ingest    {"date": "...", "type": "email", "subject": "...", "full_content": "..."}
+    GET  /health
+    GET  /metrics   Prometheus text format
+
+Usage:
+    MILO_MARKET_DATA_PROVIDER=fake python milo_service.py --port 8080
+"""
+
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+import argparse
+import contextlib
+import io
+import json
+import queue
+import threading
+import time
+
+import enhanced_milo_agents
+import milo_tracing
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class QueueFullError(Exception):
+    """Raised when the worker pool cannot accept more work"""
+
+
+class AnalysisWorkerPool:
+    """Fixed set of worker threads draining a bounded FIFO queue"""
+
+    def __init__(self, workers: int = 4, queue_size: int = 32):
+        self.workers = workers
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"milo-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def queue_capacity(self) -> int:
+        return self._queue.maxsize
+
+    @property
+    def active(self) -> int:
+        with self._active_lock:
+            return self._active
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue fn(*args); raises QueueFullError rather than blocking the caller"""
+
+        future = Future()
+        try:
+            self._queue.put_nowait((future, fn, args))
+        except queue.Full:
+            self.stats["rejected"] += 1
+            raise QueueFullError("Analysis queue is full")
+        self.stats["accepted"] += 1
+        return future
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            future, fn, args = item
+            # Skip work whose caller already gave up
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            with self._active_lock:
+                self._active += 1
+            try:
+                future.set_result(fn(*args))
+                self.stats["completed"] += 1
+            except Exception as e:
+                future.set_exception(e)
+                self.stats["failed"] += 1
+            finally:
+                with self._active_lock:
+                    self._active -= 1
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def warm_indexes():
+    """Preload indexes and price data so the first request pays no build cost"""
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        index = enhanced_milo_agents.get_communications_index()
+        enhanced_milo_agents.analyze_portfolio("warm-up")
+    print(f"✅ Indexes warm: {len(index)} communications in {time.perf_counter() - started:.2f}s")
+
+
+class MiloRequestHandler(BaseHTTPRequestHandler):
+    """Routes JSON requests; the server instance carries the pool and settings"""
+
+    server_version = "MILO/1.0"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Dict, headers: Dict = None):
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length < 0:
+            raise ValueError("Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        raw = self.rfile.read(length) if length else b"{}"
+        payload = json.loads(raw or b"{}")
+        if not isinstance(payload, dict):
+            raise ValueError("Request body must be a JSON object")
+        return payload
+
+    def do_GET(self):
+        if self.path == "/health":
+            pool = self.server.pool
+            self._send_json(200, {
+                "status": "ok",
+                "workers": pool.workers,
+                "active": pool.active,
+                "queue_depth": pool.queue_depth,
+                "queue_capacity": pool.queue_capacity,
+                "indexes": {"communications": len(enhanced_milo_agents.get_communications_index())},
+                "stats": pool.stats
+            })
+        elif self.path == "/metrics":
+            body = milo_tracing.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        if self.path == "/ingest":
+            self._ingest(payload)
+            return
+
+        query = payload.get("query")
+        if not isinstance(query, str) or not query.strip():
+            self._send_json(400, {"error": "'query' is required"})
+            return
+
+        if self.path == "/preview":
+            # Cheap and CPU-light - answered inline without queueing
+            self._send_json(200, enhanced_milo_agents.analyze_query(query))
+        elif self.path == "/analyze":
+            client_name = payload.get("client_name") or "Smith Family Trust"
+            self._analyze(client_name, query)
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def _ingest(self, payload: Dict):
+        # An fsynced log append plus a delta index insert - answered inline
+        try:
+            result = enhanced_milo_agents.ingest_communication(payload)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except RuntimeError as e:
+            self._send_json(409, {"error": str(e)})
+            return
+        # A near-duplicate of an indexed message is acknowledged, not stored
+        self._send_json(200 if result["duplicate"] else 201, result)
+
+    def _analyze(self, client_name: str, query: str):
+        try:
+            future = self.server.pool.submit(
+                enhanced_milo_agents.execute_enhanced_milo_analysis, client_name, query)
+        except QueueFullError as e:
+            self._send_json(503, {"error": str(e)}, {
+                            "Retry-After": str(self.server.retry_after)})
+            return
+
+        try:
+            result = future.result(timeout=self.server.request_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._send_json(504, {"error": "Analysis timed out"})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+
+        status = 500 if "error" in result else 200
+        self._send_json(status, result)
+
+
+class MiloServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool: AnalysisWorkerPool, request_timeout: float = 60.0,
+                 retry_after: int = 1, quiet: bool = False):
+        super().__init__(address, MiloRequestHandler)
+        self.pool = pool
+        self.request_timeout = request_timeout
+        self.retry_after = retry_after
+        self.quiet = quiet
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8080, workers: int = 4,
+                  queue_size: int = 32, request_timeout: float = 60.0, quiet: bool = False) -> MiloServer:
+    """Warm indexes, start the worker pool and bind the HTTP server"""
+
+    warm_indexes()
+    pool = AnalysisWorkerPool(workers=workers, queue_size=queue_size)
+    return MiloServer((host, port), pool, request_timeout=request_timeout, quiet=quiet)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run MILO as an HTTP/JSON service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=32,
+                        help="Requests allowed to wait before 503s are returned")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="Seconds a request may wait for its analysis")
+    parser.add_argument("--quiet", action="store_true", help="Suppress access logs")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.workers,
+                           args.queue_size, args.timeout, args.quiet)
+    print(f"🚀 MILO service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Shutting down")
+    finally:
+        server.server_close()
+        server.pool.shutdown()
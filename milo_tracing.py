@@ -0,0 +1,280 @@
+"""
+MILO Tracing - Per-stage timing spans and metrics export
+Spans feed latency histograms (Prometheus text format) and a JSON-lines trace
+file, so p95 latency can be attributed to a pipeline stage
+
+Set MILO_TRACE_FILE to append every finished trace as one JSON line.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+
+TRACE_FILE_ENV = "MILO_TRACE_FILE"
+
+# Seconds; spans cover everything from dict lookups to provider round trips
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+RECENT_TRACES = 200
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar(
+    "milo_current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, Prometheus style"""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple, Dict] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self) -> Dict[Tuple, Dict]:
+        with self._lock:
+            return {key: {"counts": list(series["counts"]), "sum": series["sum"], "count": series["count"]}
+                    for key, series in self._series.items()}
+
+    def prometheus_lines(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}",
+                 f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.snapshot().items()):
+            for bound, count in zip(self.buckets, series["counts"]):
+                lines.append(f"{self.name}_bucket{_format_labels(key, le=_format_bound(bound))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, le='+Inf')} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[Tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def prometheus_lines(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}",
+                 f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+def _format_bound(bound: float) -> str:
+    return f"{bound:g}"
+
+
+def _format_labels(key: Tuple, **extra) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+STAGE_DURATION = Histogram(
+    "milo_stage_duration_seconds", "Wall-clock duration of MILO pipeline stages")
+CACHE_REQUESTS = Counter(
+    "milo_cache_requests_total", "Cache lookups by cache name and result")
+
+_recent_traces: deque = deque(maxlen=RECENT_TRACES)
+_trace_lock = threading.Lock()
+
+
+class Span:
+    """One timed unit of work; children share the root's trace_id"""
+
+    def __init__(self, name: str, parent: Optional["Span"]):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = next(_span_ids)
+        self.labels: Dict[str, str] = {}
+        self.attributes: Dict = {}
+        self.children: List["Span"] = []
+        self.start_wall = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set_label(self, name: str, value: str):
+        """Low-cardinality value that also becomes a histogram label"""
+        self.labels[name] = value
+
+    def set(self, name: str, value):
+        self.attributes[name] = value
+
+    def incr(self, name: str, amount: int = 1):
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "start": self.start_wall,
+            "duration": self.duration,
+            "labels": self.labels,
+            "attributes": self.attributes,
+            "error": self.error,
+            "children": [child.to_dict() for child in self.children]
+        }
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a pipeline stage; nests under the enclosing span"""
+
+    parent = _current_span.get()
+    current = Span(name, parent)
+    current.attributes.update(attributes)
+    token = _current_span.set(current)
+
+    try:
+        yield current
+    except Exception as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current._start
+        _current_span.reset(token)
+
+        STAGE_DURATION.observe(current.duration, stage=name, **current.labels)
+        if parent is not None:
+            parent.children.append(current)
+        else:
+            _finish_trace(current)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup and tally it on the active span"""
+
+    result = "hit" if hit else "miss"
+    CACHE_REQUESTS.inc(cache=cache, result=result)
+    active = _current_span.get()
+    if active is not None:
+        active.incr(f"{cache}_cache_{result}")
+
+
+def _finish_trace(root: Span):
+    record = {"trace_id": root.trace_id, **root.to_dict()}
+    with _trace_lock:
+        _recent_traces.append(record)
+
+    path = os.environ.get(TRACE_FILE_ENV)
+    if path:
+        line = json.dumps(record, default=str) + "\n"
+        with _trace_lock, open(path, "a") as f:
+            f.write(line)
+
+
+def recent_traces(limit: int = RECENT_TRACES) -> List[Dict]:
+    with _trace_lock:
+        return list(_recent_traces)[-limit:]
+
+
+def cache_stats() -> Dict[str, Dict[str, float]]:
+    """{cache: {"hit": n, "miss": n, "hit_rate": r}} from the cache counter"""
+
+    stats: Dict[str, Dict[str, float]] = {}
+    for key, value in CACHE_REQUESTS.snapshot().items():
+        labels = dict(key)
+        entry = stats.setdefault(labels["cache"], {"hit": 0, "miss": 0})
+        entry[labels["result"]] = entry.get(labels["result"], 0) + value
+    for entry in stats.values():
+        total = entry["hit"] + entry["miss"]
+        entry["hit_rate"] = entry["hit"] / total if total else 0.0
+    return stats
+
+
+def prometheus_text() -> str:
+    """All MILO metrics in Prometheus text exposition format"""
+
+    lines = STAGE_DURATION.prometheus_lines() + CACHE_REQUESTS.prometheus_lines()
+    return "\n".join(lines) + "\n"
+
+
+def write_trace_file(path: str):
+    """Dump the recent in-memory traces as a JSON document"""
+
+    with open(path, "w") as f:
+        json.dump({"traces": recent_traces()}, f, indent=2, default=str)
+
+
+def reset():
+    """Clear metrics and traces (benchmarks and load tests start from zero)"""
+
+    global STAGE_DURATION, CACHE_REQUESTS
+    STAGE_DURATION = Histogram(STAGE_DURATION.name, STAGE_DURATION.help_text)
+    CACHE_REQUESTS = Counter(CACHE_REQUESTS.name, CACHE_REQUESTS.help_text)
+    with _trace_lock:
+        _recent_traces.clear()
+
+
+async def run_in_executor(executor, fn, *args):
+    """Await fn(*args) on executor (None: the loop's default thread pool)
+
+    Thread pools run fn in a copy of the caller's context, so its spans nest
+    under the awaiting stage; process pools get fn as-is. Cancelling the
+    awaiting task abandons the result but cannot interrupt a running call.
+    """
+
+    loop = asyncio.get_running_loop()
+    if executor is None or isinstance(executor, concurrent.futures.ThreadPoolExecutor):
+        return await loop.run_in_executor(
+            executor, functools.partial(contextvars.copy_context().run, fn, *args))
+    return await loop.run_in_executor(executor, functools.partial(fn, *args))
+
+
+def traced(name: str):
+    """Decorator form of span() for whole stage functions"""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,321 @@
+"""
+MILO Portfolio Analyzer - Shared portfolio metrics for both agent paths
+Loads prices once per snapshot (memory-mapped store first, then the async
+fetcher), computes fund and portfolio metrics with numpy and checks them
+against the Investment Policy Statement. analyze_async() serves async callers,
+awaiting the fetcher directly and running the math in an executor.
+"""
+
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+import copy
+import hashlib
+import json
+import threading
+import time
+
+import numpy as np
+
+from fund_universe import ASSET_CLASSES
+from market_data import SingleFlight, fetch_price_histories, get_default_fetcher
+from milo_tracing import record_cache, run_in_executor, span
+
+try:
+    from price_store import get_default_price_store
+    PRICE_STORE_AVAILABLE = True
+except ImportError:
+    PRICE_STORE_AVAILABLE = False
+
+TRADING_DAYS = 252
+MIN_HISTORY = 20
+
+# Snapshots are reused until the price cache would have refreshed anyway
+SNAPSHOT_TTL_SECONDS = 900
+
+DEFAULT_PORTFOLIO = {
+    "client_name": "Smith Family Trust",
+    "portfolio_value": 2500000,
+    "allocations": {
+        "VTSAX": {"allocation": 40, "name": "Vanguard Total Stock Market Index"},
+        "VTIAX": {"allocation": 15, "name": "Vanguard Total International Stock Index"},
+        "VSGX": {"allocation": 15, "name": "Vanguard ESG International Stock ETF"},
+        "VBTLX": {"allocation": 20, "name": "Vanguard Total Bond Market Index"},
+        "VGSLX": {"allocation": 5, "name": "Vanguard Real Estate Index Fund"},
+        "VTABX": {"allocation": 5, "name": "Vanguard Total International Bond Index"}
+    }
+}
+
+DEFAULT_IPS = {
+    "return_objective": {"min": 7, "max": 9},
+    "asset_allocation_targets": {
+        "equity": {"target": 70},
+        "fixed_income": {"target": 25},
+        "alternatives": {"target": 5}
+    },
+    "rebalancing_threshold": 5
+}
+
+# Used when a fund has no usable price history
+FALLBACK_METRICS = {
+    "VTSAX": {"return": 0.121, "volatility": 0.135},
+    "VTIAX": {"return": 0.062, "volatility": 0.142},
+    # Slightly lower due to ESG screening
+    "VSGX": {"return": 0.058, "volatility": 0.138},
+    "VBTLX": {"return": 0.021, "volatility": 0.045},
+    "VGSLX": {"return": 0.153, "volatility": 0.218},
+    "VTABX": {"return": 0.018, "volatility": 0.055}
+}
+
+
+def _fingerprint(*parts) -> str:
+    encoded = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+
+def _split_by_price_store(tickers: List[str], period: str) -> Tuple[Dict[str, List[float]], List[str]]:
+    """Histories the memory-mapped store already has, and the tickers left to fetch"""
+
+    # Shared memory-mapped history, when a store has been built for this host
+    price_store = get_default_price_store() if PRICE_STORE_AVAILABLE else None
+
+    price_histories = {}
+    to_fetch = []
+    for ticker in tickers:
+        closes = None
+        if price_store is not None and ticker in price_store:
+            # None when the store is stale
+            closes = price_store.closes(ticker, period=period)
+        if closes is not None:
+            price_histories[ticker] = closes
+        else:
+            to_fetch.append(ticker)
+    return price_histories, to_fetch
+
+
+def _label_fetch_span(fetch_span):
+    # Label the latency sample with whether the price cache served it
+    hits = fetch_span.attributes.get("prices_cache_hit", 0)
+    misses = fetch_span.attributes.get("prices_cache_miss", 0)
+    fetch_span.set_label(
+        "cache", "miss" if misses and not hits else "hit" if not misses else "partial")
+
+
+def load_price_histories(tickers: List[str], period: str = "1y") -> Dict[str, Optional[List[float]]]:
+    """Memory-mapped store first, remaining tickers from the async fetcher"""
+
+    with span("market_data_fetch") as fetch_span:
+        price_histories, to_fetch = _split_by_price_store(tickers, period)
+
+        # Remaining tickers are fetched concurrently; failures come back as None
+        if to_fetch:
+            price_histories.update(fetch_price_histories(to_fetch, period=period))
+
+        _label_fetch_span(fetch_span)
+
+    return price_histories
+
+
+async def load_price_histories_async(tickers: List[str], period: str = "1y") -> Dict[str, Optional[List[float]]]:
+    """load_price_histories for callers already on an event loop"""
+
+    with span("market_data_fetch") as fetch_span:
+        price_histories, to_fetch = _split_by_price_store(tickers, period)
+        if to_fetch:
+            price_histories.update(await get_default_fetcher().fetch_many(to_fetch, period=period))
+        _label_fetch_span(fetch_span)
+
+    return price_histories
+
+
+class PortfolioAnalyzer:
+    """Fund metrics, portfolio risk and IPS compliance, cached per snapshot
+
+    A snapshot is one (portfolio, IPS, period, trading day) combination; every
+    caller asking for the same snapshot within the TTL gets the same result
+    without refetching prices or redoing the math.
+    """
+
+    def __init__(self, portfolio: Optional[Dict] = None, ips: Optional[Dict] = None,
+                 period: str = "1y", ttl: float = SNAPSHOT_TTL_SECONDS):
+        self.portfolio = portfolio or DEFAULT_PORTFOLIO
+        self.ips = ips or DEFAULT_IPS
+        self.period = period
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, tuple] = {}
+        self._singleflight = SingleFlight()
+
+    def snapshot_key(self, as_of: Optional[date] = None) -> str:
+        return _fingerprint(self.portfolio["allocations"], self.ips, self.period,
+                            (as_of or date.today()).isoformat())
+
+    def analyze(self, as_of: Optional[date] = None) -> Dict:
+        """Snapshot metrics; a deep copy, so callers may annotate it freely"""
+
+        key = self.snapshot_key(as_of)
+        with self._lock:
+            cached = self._cached_snapshot(key)
+            if cached is not None:
+                return copy.deepcopy(cached)
+
+            # Computed under the lock so concurrent sessions share one fetch;
+            # only the latest snapshot is kept
+            snapshot = self._compute(key, as_of or date.today())
+            self._snapshots = {key: (time.monotonic(), snapshot)}
+            return copy.deepcopy(snapshot)
+
+    def _cached_snapshot(self, key: str) -> Optional[Dict]:
+        cached = self._snapshots.get(key)
+        hit = cached is not None and time.monotonic() - cached[0] < self.ttl
+        record_cache("portfolio", hit)
+        return cached[1] if hit else None
+
+    async def analyze_async(self, as_of: Optional[date] = None, executor=None) -> Dict:
+        """analyze() without blocking the event loop
+
+        Prices are awaited from the fetcher and the math runs on executor (the
+        loop's default thread pool when None). Concurrent async callers share
+        one computation; cancelling a caller cancels its price fetches.
+        """
+
+        key = self.snapshot_key(as_of)
+        # _snapshots is only ever replaced whole, so reading it needs no lock
+        # (taking the lock here could stall the loop behind a sync compute)
+        snapshot = self._cached_snapshot(key)
+        if snapshot is None:
+            snapshot, _ = await self._singleflight.do(
+                (key,), lambda: self._compute_async(key, as_of or date.today(), executor))
+        return copy.deepcopy(snapshot)
+
+    async def _compute_async(self, key: str, as_of: date, executor) -> Dict:
+        tickers = list(self.portfolio["allocations"])
+        price_histories = await load_price_histories_async(tickers, self.period)
+        snapshot = await run_in_executor(executor, self._metrics, key, as_of, price_histories)
+        self._snapshots = {key: (time.monotonic(), snapshot)}
+        return snapshot
+
+    def clear_cache(self):
+        with self._lock:
+            self._snapshots = {}
+
+    def _compute(self, key: str, as_of: date) -> Dict:
+        price_histories = load_price_histories(list(self.portfolio["allocations"]), self.period)
+        return self._metrics(key, as_of, price_histories)
+
+    def _metrics(self, key: str, as_of: date, price_histories: Dict[str, Optional[List[float]]]) -> Dict:
+        allocations = self.portfolio["allocations"]
+        tickers = list(allocations)
+
+        with span("portfolio_math"):
+            weights = np.array([allocations[ticker]["allocation"] for ticker in tickers],
+                               dtype=np.float64) / 100
+            returns = np.empty(len(tickers))
+            volatilities = np.empty(len(tickers))
+            daily_series = {}
+
+            for i, ticker in enumerate(tickers):
+                closes = price_histories.get(ticker)
+                if closes is not None and len(closes) > MIN_HISTORY:
+                    closes = np.asarray(closes, dtype=np.float64)
+                    daily_series[ticker] = np.diff(closes) / closes[:-1]
+                    returns[i] = (closes[-1] - closes[0]) / closes[0]
+                    volatilities[i] = daily_series[ticker].std(ddof=1) * np.sqrt(TRADING_DAYS)
+                    print(f"✅ Got real data for {ticker}: {returns[i]*100:.1f}%")
+                else:
+                    fallback = FALLBACK_METRICS.get(ticker, {"return": 0.0, "volatility": 0.0})
+                    returns[i], volatilities[i] = fallback["return"], fallback["volatility"]
+                    print(f"📋 Using fallback for {ticker}: {returns[i]*100:.1f}%")
+
+            contributions = returns * weights
+            total_return = round(float(contributions.sum()) * 100, 2)
+
+            fund_performance = {
+                ticker: {
+                    "name": allocations[ticker]["name"],
+                    "allocation": allocations[ticker]["allocation"],
+                    "annual_return": round(float(returns[i]) * 100, 2),
+                    "volatility": round(float(volatilities[i]) * 100, 2),
+                    "weighted_contribution": round(float(contributions[i]) * 100, 2)
+                }
+                for i, ticker in enumerate(tickers)
+            }
+
+            portfolio_volatility = self._portfolio_volatility(tickers, weights, daily_series)
+
+        return {
+            "snapshot_key": key,
+            "as_of": as_of.isoformat(),
+            "client_name": self.portfolio.get("client_name"),
+            "portfolio_value": self.portfolio.get("portfolio_value"),
+            "total_return": total_return,
+            "portfolio_volatility": portfolio_volatility,
+            "fund_performance": fund_performance,
+            "ips_compliance": self.ips_compliance(total_return)
+        }
+
+    @staticmethod
+    def _portfolio_volatility(tickers: List[str], weights: np.ndarray,
+                              daily_series: Dict[str, np.ndarray]) -> Optional[float]:
+        """Annualized volatility of the weighted portfolio over the common history"""
+
+        if len(daily_series) != len(tickers):
+            return None
+        length = min(len(series) for series in daily_series.values())
+        if length < MIN_HISTORY:
+            return None
+        matrix = np.vstack([daily_series[ticker][-length:] for ticker in tickers])
+        covariance = np.cov(matrix)
+        variance = float(weights @ covariance @ weights)
+        return round(np.sqrt(max(variance, 0.0) * TRADING_DAYS) * 100, 2)
+
+    def asset_class_allocation(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for ticker, details in self.portfolio["allocations"].items():
+            asset_class = ASSET_CLASSES.get(ticker, "other")
+            totals[asset_class] = totals.get(asset_class, 0) + details["allocation"]
+        return totals
+
+    def ips_compliance(self, total_return: float) -> Dict:
+        objective = self.ips["return_objective"]
+        threshold = self.ips["rebalancing_threshold"]
+        current = self.asset_class_allocation()
+
+        drift = {
+            asset_class: round(current.get(asset_class, 0) - target["target"], 2)
+            for asset_class, target in self.ips["asset_allocation_targets"].items()
+        }
+        needs_rebalancing = any(abs(value) > threshold for value in drift.values())
+
+        if total_return > objective["max"]:
+            return_status = "Exceeding"
+        elif total_return >= objective["min"]:
+            return_status = "Compliant"
+        else:
+            return_status = "Below target"
+
+        return {
+            "return_compliance": {
+                "current_return": f"{total_return}%",
+                "ips_target": f"{objective['min']}-{objective['max']}% annually",
+                "status": return_status
+            },
+            "allocation_compliance": ("Rebalancing needed" if needs_rebalancing
+                                      else "Within IPS guidelines"),
+            "allocation_drift": drift,
+            "needs_rebalancing": needs_rebalancing
+        }
+
+
+_default_analyzer = None
+_default_analyzer_lock = threading.Lock()
+
+
+def get_default_analyzer() -> PortfolioAnalyzer:
+    """Process-wide analyzer, so both agent paths share one snapshot cache"""
+
+    global _default_analyzer
+
+    with _default_analyzer_lock:
+        if _default_analyzer is None:
+            _default_analyzer = PortfolioAnalyzer()
+    return _default_analyzer
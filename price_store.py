@@ -0,0 +1,273 @@
+"""
+MILO Price History Store - Memory-mapped daily closes for the fund universe
+Stores a float32 (dates x tickers) matrix on disk and opens it with np.memmap,
+so every Streamlit worker and batch process shares the same page-cached data.
+Each build is written to its own directory and published by replacing the
+CURRENT pointer file, so readers always open one build's files together.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+MATRIX_FILENAME = "closes.f32"
+DATES_FILENAME = "dates.npy"
+INDEX_FILENAME = "index.json"
+# Names the build directory readers open; stores without one keep their files in root
+CURRENT_FILENAME = "CURRENT"
+
+# Environment variable pointing the agents at a prebuilt store
+PRICE_STORE_ENV = "MILO_PRICE_STORE_DIR"
+
+# A store whose last bar is older than this (weekend plus a holiday) is stale;
+# periods are then left to the live fetcher instead of ending on old data
+MAX_STALENESS_DAYS = 4
+
+_PERIOD_PATTERN = re.compile(r"^(\d+)(d|wk|mo|y)$")
+_PERIOD_DAYS = {"d": 1, "wk": 7, "mo": 31, "y": 366}
+
+
+def period_start(end: date, period: str) -> Optional[date]:
+    """Translate a yfinance-style period ("1y", "6mo", "max") into a start date"""
+
+    if period == "max":
+        return None
+
+    match = _PERIOD_PATTERN.match(period)
+    if not match:
+        raise ValueError(f"Unsupported period: {period}")
+
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == "y":
+        try:
+            return end.replace(year=end.year - count)
+        except ValueError:
+            # Feb 29 -> Feb 28
+            return end.replace(year=end.year - count, day=28)
+    return end - timedelta(days=count * _PERIOD_DAYS[unit])
+
+
+def _current_build(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILENAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def store_exists(root: str) -> bool:
+    return os.path.exists(os.path.join(root, CURRENT_FILENAME)) or os.path.exists(os.path.join(root, INDEX_FILENAME))
+
+
+class PriceStore:
+    """Read-only view over a memory-mapped close price matrix"""
+
+    def __init__(self, root: str):
+        self.root = root
+        build = _current_build(root)
+        data_dir = os.path.join(root, build) if build else root
+
+        with open(os.path.join(data_dir, INDEX_FILENAME)) as f:
+            index = json.load(f)
+
+        if index.get("version") != STORE_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported price store version {index.get('version')} in {root}")
+
+        self._stale_warned = False
+        self.tickers: List[str] = index["tickers"]
+        self.columns: Dict[str, int] = {
+            ticker: i for i, ticker in enumerate(self.tickers)}
+
+        # Day ordinals as datetime64[D]; small enough to mmap alongside
+        self.dates = np.load(os.path.join(data_dir, DATES_FILENAME), mmap_mode="r")
+
+        shape = (len(self.dates), len(self.tickers))
+        if shape[0] == 0 or shape[1] == 0:
+            self.matrix = np.empty(shape, dtype=np.float32)
+        else:
+            self.matrix = np.memmap(
+                os.path.join(data_dir, MATRIX_FILENAME),
+                dtype=np.float32,
+                mode="r",
+                shape=shape
+            )
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self.columns
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.matrix.nbytes)
+
+    def _row_range(self, start: Optional[date], end: Optional[date]) -> slice:
+        lo = 0 if start is None else int(
+            np.searchsorted(self.dates, np.datetime64(start, "D"), side="left"))
+        hi = len(self.dates) if end is None else int(
+            np.searchsorted(self.dates, np.datetime64(end, "D"), side="right"))
+        return slice(lo, hi)
+
+    @property
+    def last_date(self) -> Optional[date]:
+        return self.dates[-1].astype(object) if len(self.dates) else None
+
+    def is_stale(self, today: Optional[date] = None) -> bool:
+        last = self.last_date
+        return last is None or ((today or date.today()) - last).days > MAX_STALENESS_DAYS
+
+    def closes(self, ticker: str, period: str = "1y", end: Optional[date] = None) -> Optional[np.ndarray]:
+        """Closing prices for one ticker over a period, missing days dropped
+
+        Without an explicit end the period runs to the store's last bar; if
+        that bar is stale, None is returned so callers fetch live data.
+        """
+
+        column = self.columns[ticker]
+        if end is None:
+            if self.is_stale():
+                if not self._stale_warned:
+                    self._stale_warned = True
+                    print(f"⚠️ Price store {self.root} ends {self.last_date} - using live prices instead")
+                return None
+            end = self.last_date
+
+        rows = self._row_range(period_start(end, period), end)
+        series = self.matrix[rows, column]
+        return series[~np.isnan(series)]
+
+    def window(self, tickers: List[str], start: Optional[date] = None, end: Optional[date] = None) -> np.ndarray:
+        """(dates x tickers) block for a date range; NaN marks missing bars"""
+
+        rows = self._row_range(start, end)
+        columns = [self.columns[ticker] for ticker in tickers]
+        return self.matrix[rows][:, columns]
+
+
+def build_price_store(root: str, histories: Dict[str, "pd.Series"]) -> PriceStore:
+    """Write per-ticker close series into an aligned float32 matrix on disk
+
+    The files go to a new build-* directory, published by replacing CURRENT;
+    the build it replaces is kept for readers still opening it, older ones
+    are removed.
+    """
+
+    built_at = datetime.now()
+    build = built_at.strftime("build-%Y%m%dT%H%M%S%f")
+    build_dir = os.path.join(root, build)
+    tmp_dir = f"{build_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    tickers = sorted(histories)
+    day_sets = []
+    for ticker in tickers:
+        index = histories[ticker].index
+        day_sets.append(np.asarray(index, dtype="datetime64[D]"))
+
+    if day_sets:
+        dates = np.unique(np.concatenate(day_sets))
+    else:
+        dates = np.empty(0, dtype="datetime64[D]")
+
+    tmp_matrix_path = os.path.join(tmp_dir, MATRIX_FILENAME)
+
+    if len(dates) and len(tickers):
+        matrix = np.memmap(tmp_matrix_path, dtype=np.float32, mode="w+",
+                           shape=(len(dates), len(tickers)))
+        matrix[:] = np.nan
+
+        for column, ticker in enumerate(tickers):
+            rows = np.searchsorted(dates, day_sets[column])
+            matrix[rows, column] = np.asarray(
+                histories[ticker].values, dtype=np.float32)
+
+        matrix.flush()
+        del matrix
+    else:
+        open(tmp_matrix_path, "wb").close()
+
+    with open(os.path.join(tmp_dir, DATES_FILENAME), "wb") as f:
+        np.save(f, dates)
+
+    with open(os.path.join(tmp_dir, INDEX_FILENAME), "w") as f:
+        json.dump({
+            "version": STORE_FORMAT_VERSION,
+            "dtype": "float32",
+            "tickers": tickers,
+            "shape": [len(dates), len(tickers)],
+            "built_at": built_at.isoformat()
+        }, f)
+
+    os.replace(tmp_dir, build_dir)
+    previous = _current_build(root)
+    tmp_current_path = os.path.join(root, f"{CURRENT_FILENAME}.{os.getpid()}.tmp")
+    with open(tmp_current_path, "w") as f:
+        f.write(build)
+    os.replace(tmp_current_path, os.path.join(root, CURRENT_FILENAME))
+
+    for name in os.listdir(root):
+        if name.startswith("build-") and name not in (build, previous) and not name.endswith(".tmp"):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    return PriceStore(root)
+
+
+_default_store = None
+_default_store_loaded = False
+
+
+def get_default_price_store() -> Optional[PriceStore]:
+    """Open the store named by MILO_PRICE_STORE_DIR once per process"""
+
+    global _default_store, _default_store_loaded
+
+    if not _default_store_loaded:
+        _default_store_loaded = True
+        root = os.environ.get(PRICE_STORE_ENV)
+        if root and store_exists(root):
+            try:
+                _default_store = PriceStore(root)
+                print(
+                    f"✅ Price store loaded: {len(_default_store)} tickers x {len(_default_store.dates)} days")
+            except (OSError, ValueError) as e:
+                print(f"❌ Price store unavailable: {e}")
+
+    return _default_store
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Build the MILO memory-mapped price store from yfinance")
+    parser.add_argument("output", help="Directory for the store files")
+    parser.add_argument("tickers", nargs="+", help="Tickers to download")
+    parser.add_argument("--period", default="max",
+                        help="yfinance history period (default: max)")
+    args = parser.parse_args()
+
+    import yfinance as yf
+
+    histories = {}
+    for ticker in args.tickers:
+        hist = yf.Ticker(ticker).history(period=args.period)
+        if hist.empty:
+            print(f"📋 No history for {ticker} - skipped")
+            continue
+        closes = hist["Close"]
+        closes.index = closes.index.tz_localize(None) if closes.index.tz else closes.index
+        histories[ticker] = closes
+        print(f"✅ {ticker}: {len(closes)} bars")
+
+    store = build_price_store(args.output, histories)
+    print(
+        f"🚀 Price store written to {args.output}: {store.nbytes / 1e6:.1f} MB")